@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -49,12 +50,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'employees.middleware.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'employees.middleware.TenantMiddleware',
+    'employees.middleware.ProfilingMiddleware',
+    'employees.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'employees.middleware.AuditContextMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -82,12 +88,58 @@ WSGI_APPLICATION = 'employeemng.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+#
+# DATABASE_ENGINE=postgresql selects the production profile (needs
+# requirements-postgres.txt).  Connections come from a psycopg pool of
+# POSTGRES_POOL_MIN_SIZE..POSTGRES_POOL_MAX_SIZE per process; with
+# POSTGRES_POOL=off each thread keeps its connection for
+# POSTGRES_CONN_MAX_AGE seconds instead.  Behind PgBouncer in transaction
+# mode set POSTGRES_DISABLE_SERVER_SIDE_CURSORS=on.
+
+DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'sqlite').lower()
+
+if DATABASE_ENGINE in ('postgres', 'postgresql'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'employeemng'),
+            'USER': os.environ.get('POSTGRES_USER', 'employeemng'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_HEALTH_CHECKS': True,
+            'DISABLE_SERVER_SIDE_CURSORS': (
+                os.environ.get('POSTGRES_DISABLE_SERVER_SIDE_CURSORS', 'off').lower() == 'on'),
+            'OPTIONS': {},
+        }
+    }
+    if os.environ.get('POSTGRES_POOL', 'on').lower() == 'on':
+        # Pooled connections are returned after every request; Django
+        # refuses a pool together with CONN_MAX_AGE
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('POSTGRES_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.environ.get('POSTGRES_POOL_MAX_SIZE', '10')),
+            'timeout': float(os.environ.get('POSTGRES_POOL_TIMEOUT', '10')),
+        }
+    else:
+        DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('POSTGRES_CONN_MAX_AGE', '600'))
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
     }
-}
+
+# Company tenants (employees/tenants.py): companies are listed in 'default',
+# each company's data lives in its own shard, by default a SQLite file in
+# TENANT_DATABASE_DIR.  Other DATABASES aliases can hold a company only when
+# listed in TENANT_SHARD_ALIASES ('default' never can).  Company lookups are
+# cached per process for TENANT_CACHE_SECONDS.
+DATABASE_ROUTERS = ['employees.tenants.TenantRouter']
+TENANT_DATABASE_DIR = Path(os.environ.get('TENANT_DATABASE_DIR', BASE_DIR / 'tenants'))
+TENANT_SHARD_ALIASES = [alias for alias in os.environ.get('TENANT_SHARD_ALIASES', '').split(',') if alias]
+TENANT_CACHE_SECONDS = int(os.environ.get('TENANT_CACHE_SECONDS', '60'))
 
 
 # Password validation
@@ -138,15 +190,99 @@ AUTH_USER_MODEL = 'employees.Employee'
 # Django REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'employees.authentication.TenantTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'employees.listing.ListPagination',
     'PAGE_SIZE': 20,
+    'DEFAULT_THROTTLE_CLASSES': [
+        'employees.throttling.CostThrottle',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'employees.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'employees.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# MessagePack is negotiated via `Accept: application/msgpack` when installed.
+if find_spec('msgpack') is not None:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].insert(1, 'employees.renderers.MessagePackRenderer')
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].insert(1, 'employees.renderers.MessagePackParser')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# Throttling (employees/throttling.py): endpoint class -> (bucket capacity,
+# tokens refilled per minute). Report and analytics requests cost one token
+# plus one per 31 days of range, bulk requests one plus one per 100 rows.
+# API_THROTTLING=off disables the buckets (the report slot limit still applies).
+# Buckets are kept in THROTTLE_DB, an SQLite file every worker on the host
+# shares; put it on fast local storage.
+API_THROTTLING = os.environ.get('API_THROTTLING', 'on')
+THROTTLE_DB = Path(os.environ.get('THROTTLE_DB', BASE_DIR / '.cache' / 'throttle.sqlite3'))
+THROTTLE_BUCKETS = {
+    'default': (120, 240),
+    'reports': (12, 6),
+    'analytics': (60, 60),
+    'bulk': (20, 10),
+}
+# Host-wide limit on reports generated at once; keep below the worker count.
+REPORT_MAX_CONCURRENT = int(os.environ.get('REPORT_MAX_CONCURRENT', '1'))
+REPORT_SLOT_DIR = Path(os.environ.get('REPORT_SLOT_DIR', BASE_DIR / '.cache' / 'report-slots'))
+REPORT_SLOT_RETRY_AFTER = int(os.environ.get('REPORT_SLOT_RETRY_AFTER', '5'))
+
+# Failed requests are logged to stderr whatever DEBUG is, so tracebacks (for
+# example SQLite "database is locked") reach the server log.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'django.request': {'handlers': ['console'], 'level': 'ERROR', 'propagate': False},
+    },
+}
+
+# Request profiling (employees/profiling.py): requests with a token from
+# `manage.py profile_token`, plus PROFILE_SAMPLE_RATE of all requests, are
+# profiled into PROFILE_DIR; `manage.py profile_stacks` aggregates them.
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', BASE_DIR / '.cache' / 'profiles'))
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_MODE = os.environ.get('PROFILE_MODE', 'cprofile')  # or 'sampling'
+PROFILE_SAMPLING_INTERVAL = float(os.environ.get('PROFILE_SAMPLING_INTERVAL', '0.001'))
+PROFILE_TOKEN_MAX_AGE = int(os.environ.get('PROFILE_TOKEN_MAX_AGE', '3600'))
+
+# Prometheus metrics at /metrics (employees/metrics.py). With several worker
+# processes set METRICS_DIR to a local directory that is emptied at startup;
+# each worker writes its numbers there every METRICS_FLUSH_INTERVAL seconds.
+# METRICS_TOKEN, when set, must be sent as "Authorization: Bearer <token>".
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '1'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Audit log (employees/audit.py): changes are queued in memory and written
+# by a background thread in batches of AUDIT_BATCH_SIZE, at least every
+# AUDIT_FLUSH_INTERVAL seconds.  A batch the database refuses is retried
+# with backoff and dropped (and logged) after AUDIT_FLUSH_ATTEMPTS tries.
+AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', '500'))
+AUDIT_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL', '0.5'))
+AUDIT_FLUSH_ATTEMPTS = int(os.environ.get('AUDIT_FLUSH_ATTEMPTS', '6'))
+
+# Response compression (brotli when installed and accepted, gzip otherwise)
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '4'))
+
 # CORS settings for React frontend
 CORS_ALLOWED_ORIGINS = [
     origin.strip()
@@ -158,3 +294,65 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+
+# Punch archive: records older than the retention horizon are moved to
+# compressed per-month segment files by `manage.py archive_punches`.
+PUNCH_ARCHIVE_DIR = Path(os.environ.get('PUNCH_ARCHIVE_DIR', BASE_DIR / 'archive'))
+PUNCH_ARCHIVE_RETENTION_DAYS = int(os.environ.get('PUNCH_ARCHIVE_RETENTION_DAYS', '365'))
+
+# Bulk employee endpoint (/api/employees/bulk/)
+BULK_MAX_ROWS = int(os.environ.get('BULK_MAX_ROWS', '10000'))
+BULK_HASH_WORKERS = int(os.environ.get('BULK_HASH_WORKERS', os.cpu_count() or 1))
+BULK_HASH_MIN_PARALLEL = int(os.environ.get('BULK_HASH_MIN_PARALLEL', '8'))
+
+# Kiosk punch sync (/api/punch-records/sync/): punches per request, how far
+# ahead of the server clock a device timestamp may be (seconds), how far
+# behind it (hours: the longest outage a kiosk may catch up on), and how
+# long idempotency keys are kept by `manage.py prune_sync_keys`.
+KIOSK_SYNC_MAX_PUNCHES = int(os.environ.get('KIOSK_SYNC_MAX_PUNCHES', '1000'))
+KIOSK_MAX_CLOCK_SKEW = int(os.environ.get('KIOSK_MAX_CLOCK_SKEW', '300'))
+KIOSK_MAX_BACKLOG = int(os.environ.get('KIOSK_MAX_BACKLOG', '72'))
+KIOSK_KEY_RETENTION_DAYS = int(os.environ.get('KIOSK_KEY_RETENTION_DAYS', '90'))
+
+# Work days (employees/worktime.py): a punch belongs to the day it started
+# in the employee's timezone, or WORK_TIME_ZONE for employees without one.
+WORK_TIME_ZONE = os.environ.get('WORK_TIME_ZONE', TIME_ZONE)
+
+# Month-end payslips (employees/payslips.py, `manage.py generate_payslips`,
+# /api/payslips/): batches are written under PAYSLIP_DIR and rendered by
+# PAYSLIP_WORKERS processes, PAYSLIP_CHUNK_SIZE employees at a time.
+PAYSLIP_DIR = Path(os.environ.get('PAYSLIP_DIR', BASE_DIR / 'payslips'))
+PAYSLIP_WORKERS = int(os.environ.get('PAYSLIP_WORKERS', os.cpu_count() or 1))
+PAYSLIP_CHUNK_SIZE = int(os.environ.get('PAYSLIP_CHUNK_SIZE', '500'))
+
+# Database snapshots (employees/snapshots.py, `manage.py snapshot_db` and
+# `restore_db`).  With TEST_DATABASE_TEMPLATE set to a snapshot name or
+# file, `manage.py test` starts from that snapshot instead of migrating.
+SNAPSHOT_DIR = Path(os.environ.get('SNAPSHOT_DIR', BASE_DIR / 'snapshots'))
+TEST_DATABASE_TEMPLATE = os.environ.get('TEST_DATABASE_TEMPLATE', '')
+TEST_RUNNER = 'employees.snapshots.SnapshotTestRunner'
+
+# Scheduled reports (employees/scheduler.py, `manage.py run_report_schedules`):
+# days missed while the scheduler was down are caught up this far back, and
+# --loop checks for due schedules every REPORT_SCHEDULE_POLL_SECONDS.
+REPORT_SCHEDULE_CATCH_UP_DAYS = int(os.environ.get('REPORT_SCHEDULE_CATCH_UP_DAYS', '31'))
+REPORT_SCHEDULE_POLL_SECONDS = int(os.environ.get('REPORT_SCHEDULE_POLL_SECONDS', '300'))
+
+# Analytics endpoint (/api/analytics/)
+ANALYTICS_CACHE_SECONDS = int(os.environ.get('ANALYTICS_CACHE_SECONDS', '60'))
+ANALYTICS_MAX_DAYS = int(os.environ.get('ANALYTICS_MAX_DAYS', '731'))
+
+# Dashboard summary (/api/dashboard/), cached per user
+DASHBOARD_CACHE_SECONDS = int(os.environ.get('DASHBOARD_CACHE_SECONDS', '15'))
+
+# List endpoints (employees/listing.py): clients may ask for up to this many
+# rows per page with ?page_size=
+LIST_MAX_PAGE_SIZE = int(os.environ.get('LIST_MAX_PAGE_SIZE', '10000'))
+
+# Employee search (/api/employees/search/): broader queries skip ranking
+SEARCH_RANK_LIMIT = int(os.environ.get('SEARCH_RANK_LIMIT', '1000'))
+
+# Demo accounts (ADMIN001/MGR001/EMP001) checked after `migrate`:
+# 'enforce' resets them to the documented credentials, 'ensure' only creates
+# missing ones and 'off' skips the check entirely (recommended in production).
+DEMO_ACCOUNTS = os.environ.get('DEMO_ACCOUNTS', 'enforce').lower()
@@ -1,35 +1,234 @@
-from django.contrib import admin
+from collections import defaultdict
+
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
-from .models import Employee, PunchRecord, Report
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from . import audit, hierarchy, scheduler, worktime
+from .expressions import HoursBetween, salary_expression
+from .models import AuditLog, Company, Employee, PunchRecord, Report, ReportSchedule, ScheduledRun
+from .reports import generate_report_data, invalidate_partials
+from .search import filter_matching
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that never runs an unbounded COUNT(*).
+
+    Small result sets are counted exactly with a LIMITed subquery; above
+    ``exact_limit`` rows the planner statistics are used when the queryset is
+    unfiltered, otherwise the count is capped at the limit.
+    """
+    exact_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        bounded = queryset[:self.exact_limit + 1].count()
+        if bounded <= self.exact_limit:
+            return bounded
+        if not queryset.query.where:
+            estimate = self._estimate(connections[queryset.db], queryset.model._meta.db_table)
+            if estimate:
+                return max(estimate, bounded)
+        return self.exact_limit
+
+    @staticmethod
+    def _estimate(connection, table):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            elif connection.vendor == 'sqlite':
+                # sqlite_stat1 is populated by ANALYZE; its first number is the row count.
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+                if cursor.fetchone() is None:
+                    return None
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+            else:
+                return None
+            row = cursor.fetchone()
+        if not row or row[0] is None:
+            return None
+        return int(str(row[0]).split()[0])
+
 
 @admin.register(Employee)
 class EmployeeAdmin(UserAdmin):
     fieldsets = UserAdmin.fieldsets + (
         ('Employee Details', {
-            'fields': ('employee_id', 'role', 'phone_number', 'address', 'campaign', 'hourly_rate')
+            'fields': ('employee_id', 'role', 'manager', 'phone_number', 'address', 'campaign', 'timezone',
+                       'hourly_rate')
         }),
     )
     add_fieldsets = UserAdmin.add_fieldsets + (
         ('Employee Details', {
-            'fields': ('employee_id', 'role', 'phone_number', 'address', 'campaign', 'hourly_rate')
+            'fields': ('employee_id', 'role', 'manager', 'phone_number', 'address', 'campaign', 'timezone',
+                       'hourly_rate')
         }),
     )
+    autocomplete_fields = ['manager']
     list_display = ['employee_id', 'first_name', 'last_name', 'email', 'role', 'is_active']
     list_filter = ['role', 'is_active', 'date_joined']
     search_fields = ['employee_id', 'first_name', 'last_name', 'email']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # Same full-text index as the API, also used by employee autocompletes
+        if not search_term.strip():
+            return queryset, False
+        return filter_matching(queryset, search_term), False
+
 
 @admin.register(PunchRecord)
 class PunchRecordAdmin(admin.ModelAdmin):
-    list_display = ['employee', 'date', 'punch_in', 'punch_out', 'total_hours', 'daily_salary']
+    list_display = ['employee', 'date', 'punch_in', 'punch_out', 'total_hours', 'salary']
     list_filter = ['date', 'employee__role']
-    search_fields = ['employee__employee_id', 'employee__first_name', 'employee__last_name']
+    list_select_related = ['employee']
+    search_fields = ['employee__employee_id', '^employee__first_name', '^employee__last_name']
+    autocomplete_fields = ['employee']
     readonly_fields = ['total_hours', 'daily_salary']
-    date_hierarchy = 'date'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['recompute_hours']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(salary_amount=salary_expression())
+
+    def get_search_results(self, request, queryset, search_term):
+        # Employee IDs hit the unique index directly instead of a LIKE scan.
+        term = search_term.strip()
+        if term and ' ' not in term and Employee.objects.filter(employee_id=term.upper()).exists():
+            return queryset.filter(employee__employee_id=term.upper()), False
+        if not term:
+            return queryset, False
+        return queryset.filter(employee__in=filter_matching(Employee.objects.all(), term)), False
+
+    @admin.display(description='Daily salary', ordering='salary_amount')
+    def salary(self, obj):
+        return obj.salary_amount or 0
+
+    @admin.action(description='Recompute hours for selected punch records')
+    def recompute_hours(self, request, queryset):
+        queryset = queryset.order_by().filter(punch_out__isnull=False)
+        before = dict(queryset.values_list('pk', 'total_hours'))
+        dates = set(queryset.values_list('date', flat=True).distinct())
+        updated = queryset.update(total_hours=HoursBetween('punch_in', 'punch_out'))
+        invalidate_partials(dates)
+        after = PunchRecord.objects.filter(pk__in=list(before)).values_list('pk', 'total_hours')
+        audit.record_updates(PunchRecord, {
+            pk: {'total_hours': [before[pk], hours]} for pk, hours in after if hours != before[pk]})
+        self.message_user(request, f'Recomputed hours for {updated} punch record(s).', messages.SUCCESS)
+
 
 @admin.register(Report)
 class ReportAdmin(admin.ModelAdmin):
-    list_display = ['title', 'report_type', 'generated_by', 'generated_at']
+    list_display = ['title', 'report_type', 'start_date', 'end_date', 'generated_by', 'generated_at']
     list_filter = ['report_type', 'generated_at']
+    list_select_related = ['generated_by']
     search_fields = ['title', 'generated_by__employee_id']
     readonly_fields = ['generated_at']
-    date_hierarchy = 'generated_at'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['regenerate_reports']
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        match = request.resolver_match
+        if match and match.url_name and match.url_name.endswith('_changelist'):
+            # The changelist never shows the (potentially large) report data.
+            queryset = queryset.defer('data')
+        return queryset
+
+    @admin.action(description='Regenerate selected reports')
+    def regenerate_reports(self, request, queryset):
+        groups = defaultdict(list)
+        for pk, report_type, start_date, end_date, owner, role in queryset.values_list(
+                'pk', 'report_type', 'start_date', 'end_date', 'generated_by', 'generated_by__role'):
+            # A manager's report covers their team only, as when the API
+            # made it; everyone else's covers the whole company
+            team_of = owner if role == 'manager' else None
+            groups[(report_type, start_date, end_date, team_of)].append(pk)
+
+        # One computation and one UPDATE per distinct report range and scope.
+        managers = Employee.objects.in_bulk({key[3] for key in groups} - {None})
+        for (report_type, start_date, end_date, team_of), pks in groups.items():
+            employees = hierarchy.employees_under(managers[team_of]) if team_of else None
+            data = generate_report_data(report_type, start_date, end_date, employees=employees)
+            Report.objects.filter(pk__in=pks).update(data=data)
+            audit.record_updates(Report, {pk: {'data': [audit.MASK, audit.MASK]} for pk in pks})
+
+        self.message_user(
+            request,
+            f'Regenerated {sum(len(pks) for pks in groups.values())} report(s) '
+            f'from {len(groups)} distinct range(s) and team(s).',
+            messages.SUCCESS,
+        )
+
+
+@admin.register(AuditLog)
+class AuditLogAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'action', 'model', 'object_id', 'actor']
+    list_filter = ['model', 'action']
+    list_select_related = ['actor']
+    search_fields = ['=object_id', 'actor__employee_id']
+    readonly_fields = ['model', 'object_id', 'action', 'changes', 'actor', 'created_at']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class ScheduledRunInline(admin.TabularInline):
+    model = ScheduledRun
+    fields = ['start_date', 'end_date', 'report', 'checked_at']
+    readonly_fields = fields
+    ordering = ['-end_date', '-start_date']
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ReportSchedule)
+class ReportScheduleAdmin(admin.ModelAdmin):
+    list_display = ['title', 'report_type', 'period', 'generated_by', 'run_at', 'is_active', 'last_run_on']
+    list_filter = ['report_type', 'period', 'is_active']
+    list_select_related = ['generated_by']
+    autocomplete_fields = ['generated_by']
+    readonly_fields = ['last_run_on', 'created_at']
+    inlines = [ScheduledRunInline]
+    actions = ['run_now']
+
+    @admin.action(description="Refresh the current period's report now")
+    def run_now(self, request, queryset):
+        outcomes = []
+        for schedule in queryset.select_related('generated_by'):
+            start, end = scheduler.period_range(schedule.period, worktime.today())
+            outcomes.append(scheduler.run_range(schedule, start, end))
+        self.message_user(
+            request,
+            f"{outcomes.count('created')} created, {outcomes.count('updated')} updated, "
+            f"{outcomes.count('unchanged')} unchanged.",
+            messages.SUCCESS)
+
+
+@admin.register(Company)
+class CompanyAdmin(admin.ModelAdmin):
+    list_display = ['slug', 'name', 'shard', 'is_active', 'created_at']
+    list_filter = ['is_active']
+    search_fields = ['slug', 'name']
+    readonly_fields = ['slug', 'shard', 'created_at']
+
+    def has_add_permission(self, request):
+        # `manage.py create_company` also creates and migrates the database
+        return False
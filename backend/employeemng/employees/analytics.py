@@ -0,0 +1,94 @@
+"""Time-bucketed, grouped punch analytics computed in the database.
+
+Every request is answered by a single aggregate query over ``PunchRecord``
+and returned as columnar JSON (one list per column), which is both smaller
+than a list of row objects and what charting libraries want.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, DateField, F, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+from .expressions import salary_expression
+from .metrics import cache_lookup
+
+BUCKETS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+GROUPS = {
+    'employee': 'employee__employee_id',
+    'campaign': 'employee__campaign',
+    'role': 'employee__role',
+}
+
+METRICS = ('hours', 'pay', 'days_worked', 'avg_start')
+
+
+def _metric_expressions(metrics):
+    expressions = {
+        'hours': Sum('total_hours'),
+        'pay': Sum(salary_expression()),
+        'days_worked': Count('id'),
+        # Local minutes after midnight, averaged.
+        'avg_start': Avg('start_minute'),
+    }
+    return {name: expressions[name] for name in metrics}
+
+
+def _round(value, digits=2):
+    return None if value is None else round(float(value), digits)
+
+
+def build_analytics(queryset, group_by, bucket, start_date, end_date, metrics):
+    """Run the aggregate query and return the columnar payload"""
+    group_field = GROUPS[group_by]
+    rows = (
+        queryset
+        .filter(date__gte=start_date, date__lte=end_date)
+        .order_by()
+        .annotate(bucket=BUCKETS[bucket]('date', output_field=DateField()), group=F(group_field))
+        .values('bucket', 'group')
+        .annotate(**_metric_expressions(metrics))
+        .order_by('bucket', 'group')
+    )
+
+    columns = {'bucket': [], group_by: []}
+    columns.update({name: [] for name in metrics})
+    for row in rows:
+        columns['bucket'].append(row['bucket'].isoformat())
+        columns[group_by].append(row['group'])
+        for name in metrics:
+            value = row[name]
+            columns[name].append(value if name == 'days_worked' else _round(value, 1 if name == 'avg_start' else 2))
+
+    return {
+        'group_by': group_by,
+        'bucket': bucket,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'rows': len(columns['bucket']),
+        'columns': list(columns),
+        'data': columns,
+    }
+
+
+def cached_analytics(scope, queryset, **params):
+    """``build_analytics`` memoised per visibility scope and parameters"""
+    digest = hashlib.sha1(
+        json.dumps(params, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    key = f'analytics:{scope}:{digest}'
+    payload = cache.get(key)
+    if payload is None:
+        cache_lookup('analytics', 0, 1)
+        payload = build_analytics(queryset, **params)
+        cache.set(key, payload, settings.ANALYTICS_CACHE_SECONDS)
+    else:
+        cache_lookup('analytics', 1)
+    return payload
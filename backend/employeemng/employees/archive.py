@@ -0,0 +1,376 @@
+"""Cold storage for old punch records.
+
+Punches older than the retention horizon are moved out of the
+``PunchRecord`` table into one segment file per month under
+``settings.PUNCH_ARCHIVE_DIR``, or its ``<company slug>`` subdirectory for
+a tenant.  A segment stores each column as a fixed-width array,
+zlib-compressed on its own, and sorted by (date, employee).  A JSON
+sidecar index records where every column block lives in the file and which
+rows belong to each day, so a reader maps the segment with mmap and only
+inflates the columns it needs.
+"""
+import json
+import mmap
+import os
+import sys
+import time
+import zlib
+from array import array
+from collections import namedtuple
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+
+from .tenants import current as current_tenant
+
+SEGMENT_VERSION = 1
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+NULL_TIMESTAMP = -2 ** 63
+NULL_HOURS = -2 ** 31
+
+# Column name -> array typecode.  Timestamps are microseconds since the
+# epoch, dates are proleptic ordinals and hours are stored in hundredths.
+COLUMNS = (
+    ('id', 'q'),
+    ('employee', 'q'),
+    ('date', 'i'),
+    ('punch_in', 'q'),
+    ('punch_out', 'q'),
+    ('total_hours', 'i'),
+)
+
+ArchivedPunch = namedtuple(
+    'ArchivedPunch',
+    ['id', 'employee_id', 'date', 'punch_in', 'punch_out', 'total_hours'],
+)
+
+
+def archive_dir():
+    # Each tenant's punches are archived under its own subdirectory
+    tenant = current_tenant()
+    if tenant is not None:
+        return Path(settings.PUNCH_ARCHIVE_DIR) / tenant.slug
+    return Path(settings.PUNCH_ARCHIVE_DIR)
+
+
+def month_key(value):
+    return f'{value.year:04d}-{value.month:02d}'
+
+
+def next_month(value):
+    if value.month == 12:
+        return date(value.year + 1, 1, 1)
+    return date(value.year, value.month + 1, 1)
+
+
+def index_path(key):
+    return archive_dir() / f'punches-{key}.idx.json'
+
+
+def archived_months():
+    """Return the month keys that have a segment on disk, oldest first"""
+    base = archive_dir()
+    if not base.exists():
+        return []
+    return sorted(
+        path.name[len('punches-'):-len('.idx.json')]
+        for path in base.glob('punches-*.idx.json')
+    )
+
+
+def _encode_timestamp(value):
+    if value is None:
+        return NULL_TIMESTAMP
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def _decode_timestamp(value):
+    if value == NULL_TIMESTAMP:
+        return None
+    return EPOCH + timedelta(microseconds=value)
+
+
+def _encode_hours(value):
+    if value is None:
+        return NULL_HOURS
+    return int(Decimal(value).scaleb(2).to_integral_value())
+
+
+def _decode_hours(value):
+    if value == NULL_HOURS:
+        return None
+    return Decimal(value).scaleb(-2)
+
+
+def empty_columns():
+    return {name: array(typecode) for name, typecode in COLUMNS}
+
+
+def append_row(columns, record_id, employee_id, day, punch_in, punch_out, total_hours):
+    columns['id'].append(record_id)
+    columns['employee'].append(employee_id)
+    columns['date'].append(day.toordinal())
+    columns['punch_in'].append(_encode_timestamp(punch_in))
+    columns['punch_out'].append(_encode_timestamp(punch_out))
+    columns['total_hours'].append(_encode_hours(total_hours))
+
+
+class Segment:
+    """Read-only view of one month of archived punches"""
+
+    def __init__(self, key):
+        self.key = key
+        with open(index_path(key)) as fh:
+            self.index = json.load(fh)
+        self.rows = self.index['rows']
+        self._columns = {}
+        self._file = open(archive_dir() / self.index['data_file'], 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        self._columns.clear()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def column(self, name):
+        """Inflate a single column straight out of the mapped file"""
+        if name not in self._columns:
+            meta = self.index['columns'][name]
+            offset, length = meta['offset'], meta['length']
+            values = array(meta['typecode'])
+            with memoryview(self._map) as view:
+                values.frombytes(zlib.decompress(view[offset:offset + length]))
+            if self.index['byteorder'] != sys.byteorder:
+                values.byteswap()
+            self._columns[name] = values
+        return self._columns[name]
+
+    def row_range(self, start_date=None, end_date=None):
+        """Return the [start, stop) row slice covering the date range"""
+        start = start_date.toordinal() if start_date else None
+        end = end_date.toordinal() if end_date else None
+        lo = hi = None
+        for ordinal, (first, last) in self.index['days']:
+            if (start is None or ordinal >= start) and (end is None or ordinal <= end):
+                lo = first if lo is None else lo
+                hi = last
+        if lo is None:
+            return 0, 0
+        return lo, hi
+
+    def iter_punches(self, start_date=None, end_date=None):
+        lo, hi = self.row_range(start_date, end_date)
+        if lo == hi:
+            return
+        ids = self.column('id')
+        employees = self.column('employee')
+        days = self.column('date')
+        punch_ins = self.column('punch_in')
+        punch_outs = self.column('punch_out')
+        hours = self.column('total_hours')
+        for i in range(lo, hi):
+            yield ArchivedPunch(
+                ids[i],
+                employees[i],
+                date.fromordinal(days[i]),
+                _decode_timestamp(punch_ins[i]),
+                _decode_timestamp(punch_outs[i]),
+                _decode_hours(hours[i]),
+            )
+
+
+def write_segment(key, columns):
+    """Sort, compress and atomically (re)write a month segment.
+
+    The data goes to a fresh file first; swapping the sidecar index is the
+    commit point, after which the previous data file is removed.
+    """
+    count = len(columns['id'])
+    base = archive_dir()
+    base.mkdir(parents=True, exist_ok=True)
+    sidecar = index_path(key)
+    previous = None
+    if sidecar.exists():
+        with open(sidecar) as fh:
+            previous = json.load(fh)['data_file']
+    data_file = f'punches-{key}.{time.time_ns()}.seg'
+
+    order = sorted(range(count), key=lambda i: (columns['date'][i], columns['employee'][i]))
+    ordered = {
+        name: array(typecode, (columns[name][i] for i in order))
+        for name, typecode in COLUMNS
+    }
+
+    days = []
+    dates = ordered['date']
+    for i in range(count):
+        if not days or days[-1][0] != dates[i]:
+            days.append([dates[i], [i, i + 1]])
+        else:
+            days[-1][1][1] = i + 1
+
+    index = {
+        'version': SEGMENT_VERSION,
+        'month': key,
+        'data_file': data_file,
+        'rows': count,
+        'byteorder': sys.byteorder,
+        'min_date': date.fromordinal(dates[0]).isoformat() if count else None,
+        'max_date': date.fromordinal(dates[-1]).isoformat() if count else None,
+        'columns': {},
+        'days': days,
+    }
+
+    with open(base / data_file, 'wb') as fh:
+        offset = 0
+        for name, typecode in COLUMNS:
+            block = zlib.compress(ordered[name].tobytes(), 6)
+            fh.write(block)
+            index['columns'][name] = {
+                'typecode': typecode,
+                'offset': offset,
+                'length': len(block),
+            }
+            offset += len(block)
+        fh.flush()
+        os.fsync(fh.fileno())
+
+    tmp_index = sidecar.with_suffix('.tmp')
+    with open(tmp_index, 'w') as fh:
+        json.dump(index, fh, separators=(',', ':'))
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_index, sidecar)
+
+    if previous and previous != data_file:
+        (base / previous).unlink(missing_ok=True)
+    return index
+
+
+def _segments_for_range(start_date, end_date):
+    for key in archived_months():
+        year, month = map(int, key.split('-'))
+        first = date(year, month, 1)
+        if end_date is not None and first > end_date:
+            continue
+        if start_date is not None and next_month(first) <= start_date:
+            continue
+        yield key
+
+
+def iter_punches(start_date=None, end_date=None):
+    """Yield archived punches in the date range, oldest first"""
+    for key in _segments_for_range(start_date, end_date):
+        with Segment(key) as segment:
+            yield from segment.iter_punches(start_date, end_date)
+
+
+def employee_totals(start_date=None, end_date=None, totals=None):
+    """Accumulate {employee_pk: [days_worked, total_hours]} from the archive.
+
+    Works on the raw columns so old ranges never materialise a row object.
+    """
+    if totals is None:
+        totals = {}
+    for key in _segments_for_range(start_date, end_date):
+        with Segment(key) as segment:
+            lo, hi = segment.row_range(start_date, end_date)
+            if lo == hi:
+                continue
+            employees = segment.column('employee')
+            hours = segment.column('total_hours')
+            for i in range(lo, hi):
+                entry = totals.get(employees[i])
+                if entry is None:
+                    entry = totals[employees[i]] = [0, Decimal(0)]
+                entry[0] += 1
+                if hours[i] != NULL_HOURS:
+                    entry[1] += Decimal(hours[i]).scaleb(-2)
+    return totals
+
+
+def employee_totals_by_day(start_date, end_date, totals=None):
+    """Like ``employee_totals`` but keyed by day: {date: {employee_pk: [...]}}"""
+    if totals is None:
+        totals = {}
+    for key in _segments_for_range(start_date, end_date):
+        with Segment(key) as segment:
+            lo, hi = segment.row_range(start_date, end_date)
+            if lo == hi:
+                continue
+            employees = segment.column('employee')
+            days = segment.column('date')
+            hours = segment.column('total_hours')
+            for i in range(lo, hi):
+                day_totals = totals.setdefault(date.fromordinal(days[i]), {})
+                entry = day_totals.get(employees[i])
+                if entry is None:
+                    entry = day_totals[employees[i]] = [0, Decimal(0)]
+                entry[0] += 1
+                if hours[i] != NULL_HOURS:
+                    entry[1] += Decimal(hours[i]).scaleb(-2)
+    return totals
+
+
+def archive_punches(before, batch_size=5000, dry_run=False, log=None):
+    """Move punch records dated before ``before`` into month segments.
+
+    Each month is merged with any existing segment (deduplicated on the
+    record id, so a crash between writing and deleting is safe to re-run)
+    and then removed from the hot table in batches.
+    """
+    from .models import PunchRecord, PunchSyncKey
+
+    log = log or (lambda message: None)
+    summary = {'months': 0, 'archived': 0, 'deleted': 0}
+    queryset = PunchRecord.objects.filter(date__lt=before).order_by()
+
+    for month in queryset.dates('date', 'month'):
+        key = month_key(month)
+        month_qs = queryset.filter(date__gte=month, date__lt=next_month(month))
+
+        columns = empty_columns()
+        if index_path(key).exists():
+            with Segment(key) as segment:
+                for name, _ in COLUMNS:
+                    columns[name].extend(segment.column(name))
+        seen = set(columns['id'])
+
+        ids = []
+        rows = month_qs.values_list(
+            'id', 'employee_id', 'date', 'punch_in', 'punch_out', 'total_hours'
+        )
+        for row in rows.iterator(chunk_size=batch_size):
+            ids.append(row[0])
+            if row[0] not in seen:
+                append_row(columns, *row)
+
+        log(f'{key}: {len(ids)} punch records to archive')
+        summary['months'] += 1
+        summary['archived'] += len(ids)
+        if dry_run or not ids:
+            continue
+
+        write_segment(key, columns)
+        for offset in range(0, len(ids), batch_size):
+            # Archiving moves punches without changing any totals, so skip
+            # the per-object delete signals (and the report partial
+            # invalidation they trigger) with a plain DELETE.  That also
+            # skips on_delete, so kiosk sync keys are let go of first.
+            batch_ids = ids[offset:offset + batch_size]
+            batch = PunchRecord.objects.filter(id__in=batch_ids)
+            with transaction.atomic(using=batch.db):
+                PunchSyncKey.objects.using(batch.db).filter(
+                    punch_record_id__in=batch_ids).update(punch_record=None)
+                summary['deleted'] += batch._raw_delete(batch.db)
+
+    return summary
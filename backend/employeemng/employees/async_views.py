@@ -0,0 +1,150 @@
+"""Native async versions of the hot punch endpoints.
+
+DRF views are synchronous, so under ASGI every request would tie up a
+thread for its whole duration.  These plain Django async views serve the
+same URLs under ``/api/async/`` with the same request and response shapes
+as ``PunchRecordViewSet`` (``punch``, ``presence`` and the list), using the
+async ORM so a slow report elsewhere doesn't hold up punches queued behind
+it.  Serve them with an ASGI server, see README "Async API".
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import exceptions
+from rest_framework.authtoken.models import Token
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from . import kiosk, listing, tenants, worktime
+from .authentication import check_company, split_key, tenant_for_slug
+from .metrics import PUNCHES
+from .models import PunchRecord
+from .renderers import ORJSONParser, ORJSONRenderer
+from .views import PunchRecordViewSet
+
+renderer = ORJSONRenderer()
+parser = ORJSONParser()
+
+
+def json_response(data, status=200):
+    return HttpResponse(renderer.render(data), status=status, content_type='application/json')
+
+
+async def authenticate(request):
+    """Async equivalent of TenantTokenAuthentication"""
+    header = request.headers.get('Authorization', '').split()
+    if not header or header[0].lower() != 'token':
+        raise exceptions.NotAuthenticated()
+    if len(header) != 2:
+        raise exceptions.AuthenticationFailed('Invalid token header.')
+    slug, key = split_key(header[1])
+    if slug is not None:
+        tenants.activate(await sync_to_async(tenant_for_slug)(slug))
+    try:
+        token = await Token.objects.select_related('user').aget(key=key)
+    except Token.DoesNotExist:
+        raise exceptions.AuthenticationFailed('Invalid token.')
+    if not token.user.is_active:
+        raise exceptions.AuthenticationFailed('User inactive or deleted.')
+    check_company(token.user)
+    return token.user
+
+
+def token_required(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            request.user = await authenticate(request)
+        except exceptions.APIException as exc:
+            response = json_response({'detail': exc.detail}, status=exc.status_code)
+            response['WWW-Authenticate'] = 'Token'
+            return response
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+@csrf_exempt
+@require_POST
+@token_required
+async def punch(request):
+    try:
+        data = parser.parse(request) if request.body else {}
+    except exceptions.ParseError as exc:
+        return json_response({'detail': exc.detail}, status=400)
+    action = data.get('action') if isinstance(data, dict) else None
+    if action is None:
+        return json_response({'action': ['This field is required.']}, status=400)
+    if action not in ('punch_in', 'punch_out'):
+        return json_response({'action': [f'"{action}" is not a valid choice.']}, status=400)
+
+    employee = request.user
+    now = timezone.now()
+    days = worktime.shift_days(employee, now)
+    # One read for both actions: an open punch from today, else from last night
+    open_record = await PunchRecord.objects.filter(
+        employee=employee, date__in=days, punch_out__isnull=True).order_by('-date').afirst()
+
+    if action == 'punch_in':
+        if open_record and open_record.date == days[0]:
+            PUNCHES.inc(action, 'rejected')
+            return json_response({'non_field_errors': ['Already punched in today']}, status=400)
+        if await sync_to_async(kiosk.punch_in)(employee, now) is None:
+            PUNCHES.inc(action, 'rejected')
+            return json_response({'non_field_errors': ['Already punched in today']}, status=400)
+        PUNCHES.inc(action, 'ok')
+        return json_response({'status': 'punched in'})
+
+    if not open_record:
+        PUNCHES.inc(action, 'rejected')
+        return json_response({'non_field_errors': ['No punch in record found for today']}, status=400)
+    open_record.punch_out = now
+    await open_record.asave()
+    PUNCHES.inc(action, 'ok')
+    return json_response({'status': 'punched out'})
+
+
+@require_GET
+@token_required
+async def presence(request):
+    own, present = PunchRecordViewSet.presence_querysets(request.user)
+    own_record = await own.afirst()
+    present_records = [record async for record in present] if present is not None else None
+    return json_response(PunchRecordViewSet.presence_payload(own_record, present_records))
+
+
+@require_GET
+@token_required
+async def punch_record_list(request):
+    """Paginated like the DRF list, from the same rows (employees.listing)"""
+    page_size = listing.page_size(request.GET)
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        page = 0
+    queryset = PunchRecordViewSet.visible_to(request.user)
+    try:
+        queryset = PunchRecordViewSet.filtered(queryset, request.GET)
+    except exceptions.ValidationError as exc:
+        return json_response(exc.detail, status=400)
+    count = await queryset.acount()
+    last_page = max(1, -(-count // page_size))
+    if page < 1 or page > last_page:
+        return json_response({'detail': 'Invalid page.'}, status=404)
+
+    start = (page - 1) * page_size
+    rows = listing.PUNCH_RECORDS.query(queryset)[start:start + page_size]
+    records = [row async for row in rows]
+    url = request.build_absolute_uri()
+    previous = None
+    if page > 1:
+        previous = (remove_query_param(url, 'page') if page == 2
+                    else replace_query_param(url, 'page', page - 1))
+    return json_response({
+        'count': count,
+        'next': replace_query_param(url, 'page', page + 1) if page < last_page else None,
+        'previous': previous,
+        'results': listing.PUNCH_RECORDS.serialize(records),
+    })
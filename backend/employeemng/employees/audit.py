@@ -0,0 +1,265 @@
+"""Field-level audit trail for employees, punches and reports.
+
+Saves and deletes of audited models are diffed against the values each row
+was loaded with (``AuditedModel``) and queued in memory once the surrounding
+transaction commits.  A background thread writes the queue to ``AuditLog``
+every ``AUDIT_FLUSH_INTERVAL`` seconds, or as soon as ``AUDIT_BATCH_SIZE``
+entries are waiting, with one ``bulk_create`` per batch and database (each
+entry goes to the database of the row it audits), so the audited
+request never waits for the audit insert.  A batch that fails to write
+(e.g. SQLite's "database is locked") goes back to the front of the queue
+and is retried with backoff; only after ``AUDIT_FLUSH_ATTEMPTS`` failures
+are its entries dropped, and logged as lost.  Entries still queued when a
+process dies are lost too.
+
+The actor is the user of the request being served (``AuditContextMiddleware``)
+or whoever ``acting_as`` names, e.g. in management commands.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import close_old_connections, router, transaction
+from django.utils import timezone
+
+from .models import AuditLog, Employee, PunchRecord, Report
+
+# Audited fields per model (attnames); values of MASKED ones are never stored
+AUDITED_FIELDS = {
+    Employee: [
+        'employee_id', 'username', 'first_name', 'last_name', 'email', 'role',
+        'phone_number', 'address', 'campaign', 'timezone', 'hourly_rate', 'manager_id',
+        'is_active', 'is_staff', 'is_superuser', 'password',
+    ],
+    PunchRecord: ['employee_id', 'punch_in', 'punch_out', 'date', 'total_hours'],
+    Report: ['title', 'report_type', 'generated_by_id', 'start_date', 'end_date', 'data'],
+}
+MASKED = {'password', 'data'}
+MASK = '***'
+
+logger = logging.getLogger(__name__)
+
+_request = ContextVar('audit_request', default=None)
+_actor = ContextVar('audit_actor', default=None)
+
+_queue = []
+_lock = threading.Lock()
+_wake = threading.Event()
+_flusher = None
+
+
+def current_actor_id():
+    actor = _actor.get()
+    if actor is not None:
+        return actor.pk
+    user = getattr(_request.get(), 'user', None)
+    return user.pk if user is not None and user.is_authenticated else None
+
+
+@contextmanager
+def acting_as(user):
+    """Attribute changes made inside the block to ``user``"""
+    token = _actor.set(user)
+    try:
+        yield
+    finally:
+        _actor.reset(token)
+
+
+@contextmanager
+def request_context(request):
+    # request.user is read when a change is recorded, after DRF has authenticated it
+    token = _request.set(request)
+    try:
+        yield
+    finally:
+        _request.reset(token)
+
+
+def _values(instance, fields):
+    loaded = instance.__dict__.get('_audit_baseline')
+    if loaded is not None:
+        return loaded
+    row = instance.__dict__.get('_audit_loaded')
+    if row is None:
+        return None
+    loaded = dict(zip(*row))
+    return {field: loaded[field] for field in fields if field in loaded}
+
+
+def _current(instance, fields):
+    values = instance.__dict__
+    return {field: values[field] for field in fields if field in values}
+
+
+def _diff(old, new):
+    changes = {}
+    for field, value in new.items():
+        before = old.get(field) if old is not None else None
+        if old is not None and field in old and before == value:
+            continue
+        if field in MASKED:
+            changes[field] = [MASK if before is not None else None, MASK]
+        else:
+            changes[field] = [before, value]
+    return changes
+
+
+def record_save(instance, created=False, update_fields=None, using=None):
+    fields = AUDITED_FIELDS[type(instance)]
+    if update_fields is not None:
+        fields = [field for field in fields
+                  if field in update_fields or field.removesuffix('_id') in update_fields]
+    new = _current(instance, fields)
+    old = None if created else _values(instance, fields)
+    changes = _diff(old, new)
+    # Later saves of the same instance diff against what was just written
+    baseline = dict(_values(instance, AUDITED_FIELDS[type(instance)]) or {})
+    baseline.update(new)
+    instance._audit_baseline = baseline
+    if changes:
+        _enqueue(instance, 'create' if created else 'update', changes, using)
+
+
+def record_delete(instance, using=None):
+    fields = AUDITED_FIELDS[type(instance)]
+    old = _values(instance, fields) or _current(instance, fields)
+    changes = {field: [MASK if field in MASKED else value, None] for field, value in old.items()}
+    _enqueue(instance, 'delete', changes, using)
+
+
+def record_updates(model, changes_by_pk, using=None):
+    """Audit a ``QuerySet.update()``, given ``{pk: {field: [old, new]}}``"""
+    using = using or router.db_for_write(model)
+    entries = [_entry(model, pk, 'update', changes) for pk, changes in changes_by_pk.items() if changes]
+    if entries:
+        transaction.on_commit(lambda: _push(using, entries), using=using)
+
+
+def _entry(model, pk, action, changes):
+    return AuditLog(
+        model=model._meta.model_name, object_id=pk, action=action, changes=changes,
+        actor_id=current_actor_id(), created_at=timezone.now(),
+    )
+
+
+def _enqueue(instance, action, changes, using):
+    # Entries go to the database of the audited row, i.e. its tenant's shard
+    using = using or instance._state.db or router.db_for_write(type(instance))
+    entry = _entry(type(instance), instance.pk, action, changes)
+    transaction.on_commit(lambda: _push(using, [entry]), using=using)
+
+
+# Longest wait between retries of a failed flush, in seconds
+MAX_RETRY_DELAY = 30
+
+
+def _push(using, entries):
+    with _lock:
+        # (database, entry, failed attempts so far)
+        _queue.extend((using, entry, 0) for entry in entries)
+        full = len(_queue) >= settings.AUDIT_BATCH_SIZE
+    if _flusher is None:
+        start_flusher()
+    if full:
+        _wake.set()
+
+
+def flush():
+    """Write every queued entry now; returns how many were written.
+
+    If a database refuses its entries they are queued again, ahead of
+    newer ones, and the error is raised once the other databases' entries
+    of the batch are written.
+    """
+    written = 0
+    while True:
+        with _lock:
+            batch = _queue[:settings.AUDIT_BATCH_SIZE]
+            del _queue[:len(batch)]
+        if not batch:
+            return written
+        by_database = {}
+        for item in batch:
+            by_database.setdefault(item[0], []).append(item)
+        failed, error = [], None
+        for using, items in by_database.items():
+            try:
+                AuditLog.objects.using(using).bulk_create([entry for _, entry, _ in items])
+            except Exception as exc:
+                failed.extend(items)
+                error = exc
+            else:
+                written += len(items)
+        if error is not None:
+            _requeue(failed)
+            raise error
+
+
+def _requeue(items):
+    retry = [(using, entry, attempts + 1) for using, entry, attempts in items
+             if attempts + 1 < settings.AUDIT_FLUSH_ATTEMPTS]
+    if len(retry) < len(items):
+        logger.error('Dropped %d audit log entries after %d failed attempts',
+                     len(items) - len(retry), settings.AUDIT_FLUSH_ATTEMPTS)
+    with _lock:
+        _queue[:0] = retry
+
+
+def flush_now():
+    """``flush`` for request paths: a failure is logged, and the entries stay queued"""
+    try:
+        return flush()
+    except Exception:
+        logger.exception('Could not write audit log entries')
+        return 0
+
+
+def start_flusher():
+    global _flusher
+    with _lock:
+        if _flusher is not None:
+            return
+        _flusher = threading.Thread(target=_flush_forever, name='audit-flusher', daemon=True)
+    _flusher.start()
+
+
+def _flush_forever():
+    failures = 0
+    while True:
+        _wake.wait(settings.AUDIT_FLUSH_INTERVAL)
+        _wake.clear()
+        close_old_connections()
+        try:
+            flush()
+            failures = 0
+        except Exception:
+            # Keep the thread alive; the failed entries were queued again
+            logger.exception('Could not write audit log entries')
+            failures += 1
+            time.sleep(min(settings.AUDIT_FLUSH_INTERVAL * 2 ** failures, MAX_RETRY_DELAY))
+
+
+def _reset_after_fork():
+    global _lock, _wake, _flusher
+    _queue.clear()
+    _lock = threading.Lock()
+    _wake = threading.Event()
+    _flusher = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@atexit.register
+def _flush_at_exit():
+    if _queue:
+        try:
+            flush()
+        except Exception:  # pragma: no cover - interpreter shutdown
+            pass
@@ -0,0 +1,36 @@
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from . import tenants
+from .models import Company
+
+
+def split_key(key):
+    """(company slug or None, token key) of a ``<slug>:<key>`` API token"""
+    slug, _, key = key.rpartition(':')
+    return slug or None, key
+
+
+def tenant_for_slug(slug):
+    try:
+        return tenants.get_tenant(slug)
+    except Company.DoesNotExist:
+        raise exceptions.AuthenticationFailed('Invalid token.')
+
+
+def check_company(user):
+    # A token only works in the tenant its user belongs to
+    if user.company_id != tenants.current_company_id():
+        raise exceptions.AuthenticationFailed('Invalid token.')
+
+
+class TenantTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that activates the tenant named in the token"""
+
+    def authenticate_credentials(self, key):
+        slug, key = split_key(key)
+        if slug is not None:
+            tenants.activate(tenant_for_slug(slug))
+        user, token = super().authenticate_credentials(key)
+        check_company(user)
+        return user, token
@@ -0,0 +1,230 @@
+"""Bulk create/update/deactivate for employees.
+
+A batch is validated as a whole, passwords are hashed in a process pool
+(PBKDF2 is CPU-bound, so threads would not help) and all writes happen in
+one transaction: new employees in one ``INSERT ... ON CONFLICT DO NOTHING``
+per 500 (see ``employees.inserts``), changes with ``bulk_update``.
+"""
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import router, transaction
+from django.db.models import Q
+from rest_framework import serializers
+
+from . import audit, hierarchy
+from .inserts import insert_new
+from .models import Employee
+from .serializers import BulkEmployeeSerializer
+
+ID_FIELD = serializers.IntegerField(min_value=1)
+
+_pool = None
+
+
+def _init_worker(settings_module):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def _hash_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.BULK_HASH_WORKERS,
+            initializer=_init_worker,
+            initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'employeemng.settings'),),
+        )
+    return _pool
+
+
+def hash_passwords(passwords):
+    """Hash a list of raw passwords, in parallel for large batches"""
+    if len(passwords) < settings.BULK_HASH_MIN_PARALLEL or settings.BULK_HASH_WORKERS < 2:
+        return [make_password(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (settings.BULK_HASH_WORKERS * 4))
+    return list(_hash_pool().map(make_password, passwords, chunksize=chunksize))
+
+
+class BulkConflict(Exception):
+    """The batch failed while being applied; nothing was written"""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+class BulkEmployeeBatch:
+    """Validate and apply one bulk request against a scoped queryset"""
+
+    def __init__(self, queryset, create=(), update=(), deactivate=(), context=None):
+        self.queryset = queryset
+        self.context = context or {}
+        self.creates = list(create)
+        self.updates = list(update)
+        self.deactivate = list(deactivate)
+        self.errors = []
+        self._new = []      # (index, validated_data)
+        self._changed = []  # (index, instance, validated_data)
+
+    def _error(self, op, index, errors):
+        self.errors.append({'op': op, 'index': index, 'errors': errors})
+
+    def _id(self, op, index, value):
+        """``value`` as an employee pk, or None after recording an error"""
+        try:
+            return ID_FIELD.to_internal_value(value)
+        except serializers.ValidationError as exc:
+            self._error(op, index, {'id': exc.detail})
+            return None
+
+    def is_valid(self):
+        for index, row in enumerate(self.creates):
+            serializer = BulkEmployeeSerializer(data=row, context=self.context)
+            if serializer.is_valid():
+                data = BulkEmployeeSerializer.default_username(dict(serializer.validated_data))
+                request = self.context.get('request')
+                BulkEmployeeSerializer.default_manager(data, request.user if request else None)
+                self._new.append((index, data))
+            else:
+                self._error('create', index, serializer.errors)
+
+        ids = [self._id('update', index, row.get('id') if isinstance(row, dict) else None)
+               for index, row in enumerate(self.updates)]
+        instances = self.queryset.in_bulk([pk for pk in ids if pk is not None])
+        for index, (row, pk) in enumerate(zip(self.updates, ids)):
+            if pk is None:
+                continue
+            if pk not in instances:
+                self._error('update', index, {'id': ['Employee not found.']})
+                continue
+            serializer = BulkEmployeeSerializer(
+                instances[pk], data=row, partial=True, context=self.context)
+            if serializer.is_valid():
+                self._changed.append((index, instances[pk], dict(serializer.validated_data)))
+            else:
+                self._error('update', index, serializer.errors)
+
+        self.deactivate = [self._id('deactivate', index, pk) for index, pk in enumerate(self.deactivate)]
+        found = set(
+            self.queryset.filter(pk__in=[pk for pk in self.deactivate if pk is not None])
+            .values_list('pk', flat=True)
+        )
+        for index, pk in enumerate(self.deactivate):
+            if pk is not None and pk not in found:
+                self._error('deactivate', index, {'id': ['Employee not found.']})
+
+        self._check_unique()
+        return not self.errors
+
+    def _check_unique(self):
+        """Check employee_id/username against the batch and the database at once"""
+        claims = []  # (op, index, own_pk, field, value)
+        for index, data in self._new:
+            for field in BulkEmployeeSerializer.BATCH_UNIQUE_FIELDS:
+                claims.append(('create', index, None, field, data.get(field)))
+        for index, instance, data in self._changed:
+            for field in BulkEmployeeSerializer.BATCH_UNIQUE_FIELDS:
+                if data.get(field) and data[field] != getattr(instance, field):
+                    claims.append(('update', index, instance.pk, field, data[field]))
+        if not claims:
+            return
+
+        counts = Counter((field, value) for _, _, _, field, value in claims)
+        values = {field: set() for field in BulkEmployeeSerializer.BATCH_UNIQUE_FIELDS}
+        for _, _, _, field, value in claims:
+            values[field].add(value)
+        taken = {}
+        rows = Employee.objects.filter(
+            Q(employee_id__in=values['employee_id']) | Q(username__in=values['username'])
+        ).values_list('pk', 'employee_id', 'username')
+        for pk, employee_id, username in rows:
+            taken[('employee_id', employee_id)] = pk
+            taken[('username', username)] = pk
+
+        for op, index, own_pk, field, value in claims:
+            owner = taken.get((field, value))
+            if counts[(field, value)] > 1:
+                self._error(op, index, {field: ['Duplicated within this batch.']})
+            elif owner is not None and owner != own_pk:
+                self._error(op, index, {field: [f'An employee with this {field} already exists.']})
+
+    def save(self):
+        passwords = [data.pop('password', None) for _, data in self._new]
+        to_hash = [password for password in passwords if password]
+        update_passwords = [data.pop('password', None) for _, _, data in self._changed]
+        hashed = iter(hash_passwords(to_hash + [p for p in update_passwords if p]))
+
+        new_employees = []
+        for (index, data), password in zip(self._new, passwords):
+            employee = Employee(**data)
+            if password:
+                employee.password = next(hashed)
+            else:
+                employee.set_unusable_password()
+            new_employees.append(employee)
+
+        changed_fields = set()
+        changed_employees = []
+        moved = []  # (index, employee pk, new manager pk)
+        for (index, instance, data), password in zip(self._changed, update_passwords):
+            if 'manager' in data and data['manager'] != instance.manager:
+                moved.append((index, instance.pk, data['manager'].pk if data['manager'] else None))
+            for attr, value in data.items():
+                if attr == 'username' and not value:
+                    continue
+                setattr(instance, attr, value)
+                changed_fields.add(attr)
+            if password:
+                instance.password = next(hashed)
+                changed_fields.add('password')
+            changed_employees.append(instance)
+
+        with transaction.atomic(using=router.db_for_write(Employee)):
+            # An employee_id or username taken by another request since
+            # validation is skipped by the database and reported here
+            inserted = insert_new(new_employees, key=['employee_id'])
+            if len(inserted) != len(new_employees):
+                raise BulkConflict([
+                    {'op': 'create', 'index': index,
+                     'errors': {'employee_id': ['An employee with this employee_id or username already exists.']}}
+                    for (index, _), employee in zip(self._new, new_employees) if employee.pk is None
+                ])
+            if changed_fields:
+                Employee.objects.bulk_update(
+                    changed_employees, sorted(changed_fields), batch_size=500)
+            active = Employee.objects.filter(pk__in=self.deactivate, is_active=True)
+            active_pks = list(active.values_list('pk', flat=True))
+            deactivated = active.update(is_active=False)
+
+            # bulk writes skip the post_save signal, so audit them here
+            for employee in new_employees:
+                audit.record_save(employee, created=True)
+            for employee in changed_employees:
+                audit.record_save(employee, update_fields=changed_fields)
+            audit.record_updates(Employee, {pk: {'is_active': [True, False]} for pk in active_pks})
+
+            # Same for the reporting lines.  Moves are applied in order, so a
+            # management loop made within the batch is caught here.
+            for employee in new_employees:
+                if employee.manager_id is not None:
+                    hierarchy.move(employee.pk, employee.manager_id)
+            for index, pk, manager_pk in moved:
+                try:
+                    hierarchy.move(pk, manager_pk)
+                except hierarchy.HierarchyError as exc:
+                    raise BulkConflict(
+                        [{'op': 'update', 'index': index, 'errors': {'manager': [str(exc)]}}])
+
+        return {
+            'created': [
+                {'index': index, 'id': employee.pk, 'employee_id': employee.employee_id}
+                for (index, _), employee in zip(self._new, new_employees)
+            ],
+            'updated': len(changed_employees),
+            'deactivated': deactivated,
+        }
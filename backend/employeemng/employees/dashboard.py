@@ -0,0 +1,203 @@
+"""Everything a role's dashboard shows, in one response.
+
+Headcount, punch totals and pay come from a single aggregate query per
+model; who is in now and the latest reports are short ordered slices.  The
+summary is cached per user for ``DASHBOARD_CACHE_SECONDS``.  The user's own
+punch status is always read fresh, so punching in or out shows up at once.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from rest_framework import serializers
+
+from . import tenants, worktime
+from .expressions import salary_expression
+from .metrics import cache_lookup
+from .models import PunchRecord, Report
+
+# Who is in now: at most this many names, the count is always exact
+PRESENT_LIMIT = 20
+RECENT_REPORTS = 5
+RECENT_PUNCHES = 7
+# Own punches counted in the "this week" figures
+WEEK_DAYS = 7
+
+PROFILE_FIELDS = (
+    'id', 'employee_id', 'username', 'first_name', 'last_name', 'email', 'phone_number',
+    'address', 'campaign', 'timezone', 'role', 'hourly_rate',
+)
+
+
+def _round(value, digits=2):
+    return round(float(value or 0), digits)
+
+
+def _datetime(value):
+    return serializers.DateTimeField().to_representation(value) if value else None
+
+
+def _punch_totals(queryset, today, week_start, period_start):
+    """Counts, hours and pay for all time, this period and the last week in one query"""
+    in_period = Q(date__gte=period_start, date__lte=today)
+    in_week = Q(date__gte=week_start, date__lte=today)
+    totals = queryset.order_by().aggregate(
+        punch_records=Count('id'),
+        hours=Sum('total_hours'),
+        pay=Sum(salary_expression()),
+        period_days=Count('id', filter=in_period),
+        period_hours=Sum('total_hours', filter=in_period),
+        period_pay=Sum(salary_expression(), filter=in_period),
+        week_days=Count('id', filter=in_week),
+        week_hours=Sum('total_hours', filter=in_week),
+        week_pay=Sum(salary_expression(), filter=in_week),
+        present_count=Count('id', filter=Q(date=today, punch_out__isnull=True)),
+    )
+    return {
+        'punch_records': totals['punch_records'],
+        'present_count': totals['present_count'],
+        'hours': {
+            'week': _round(totals['week_hours']),
+            'period': _round(totals['period_hours']),
+            'all_time': _round(totals['hours']),
+        },
+        'pay': {
+            'week': _round(totals['week_pay']),
+            'period': _round(totals['period_pay']),
+            'all_time': _round(totals['pay']),
+        },
+        'days_worked': {
+            'week': totals['week_days'],
+            'period': totals['period_days'],
+        },
+    }
+
+
+def _headcount(queryset):
+    totals = queryset.order_by().aggregate(
+        total=Count('id'),
+        active=Count('id', filter=Q(is_active=True)),
+        admins=Count('id', filter=Q(role='admin')),
+        managers=Count('id', filter=Q(role='manager')),
+        employees=Count('id', filter=Q(role='employee')),
+    )
+    return {
+        'total': totals['total'],
+        'active': totals['active'],
+        'by_role': {
+            'admin': totals['admins'],
+            'manager': totals['managers'],
+            'employee': totals['employees'],
+        },
+    }
+
+
+def build_dashboard(user, punches, staff, today=None):
+    """The cacheable part of ``user``'s dashboard.
+
+    ``punches`` and ``staff`` are the punch records and employees the user may see.
+    """
+    today = today or worktime.today(user)
+    period_start = today.replace(day=1)
+    week_start = today - timedelta(days=WEEK_DAYS)
+    totals = _punch_totals(punches, today, week_start, period_start)
+    present_count = totals.pop('present_count')
+
+    payload = {
+        'role': user.role,
+        'today': today.isoformat(),
+        'period': {'start': period_start.isoformat(), 'end': today.isoformat()},
+        'week': {'start': week_start.isoformat(), 'end': today.isoformat()},
+        **totals,
+    }
+
+    if user.role == 'employee':
+        payload['recent_punches'] = [
+            {
+                'id': record['id'],
+                'date': record['date'].isoformat(),
+                'punch_in': _datetime(record['punch_in']),
+                'punch_out': _datetime(record['punch_out']),
+                'total_hours': _round(record['total_hours']),
+                'daily_salary': _round(record['total_hours'] and record['total_hours'] * user.hourly_rate),
+            }
+            for record in punches.values(
+                'id', 'date', 'punch_in', 'punch_out', 'total_hours')[:RECENT_PUNCHES]
+        ]
+        return payload
+
+    payload['headcount'] = _headcount(staff)
+
+    present = []
+    if present_count:
+        present = [
+            {
+                'id': record['id'],
+                'employee': record['employee'],
+                'employee_id': record['employee__employee_id'],
+                'employee_name': f"{record['employee__first_name']} {record['employee__last_name']}".strip(),
+                'punch_in': _datetime(record['punch_in']),
+            }
+            for record in punches
+            .filter(date=today, punch_out__isnull=True)
+            .order_by('punch_in')
+            .values('id', 'employee', 'employee__employee_id', 'employee__first_name',
+                    'employee__last_name', 'punch_in')[:PRESENT_LIMIT]
+        ]
+    payload['present'] = {'count': present_count, 'records': present}
+
+    reports = Report.objects.all()
+    if user.role == 'manager':
+        reports = reports.filter(generated_by=user)
+    payload['recent_reports'] = [
+        {
+            'id': report['id'],
+            'title': report['title'],
+            'report_type': report['report_type'],
+            'generated_by': report['generated_by__employee_id'],
+            'generated_at': _datetime(report['generated_at']),
+            'start_date': report['start_date'].isoformat(),
+            'end_date': report['end_date'].isoformat(),
+        }
+        # values() keeps the (large) report data column out of the query
+        for report in reports.order_by('-generated_at').values(
+            'id', 'title', 'report_type', 'generated_by__employee_id', 'generated_at',
+            'start_date', 'end_date')[:RECENT_REPORTS]
+    ]
+    return payload
+
+
+def own_status(user, today=None):
+    """The user's profile and open punch today; never cached"""
+    today = today or worktime.today(user)
+    punch_in = (
+        PunchRecord.objects
+        .filter(employee=user, date__in=[today, today - timedelta(days=1)], punch_out__isnull=True)
+        .order_by('-date')
+        .values_list('punch_in', flat=True)
+        .first()
+    )
+    profile = {field: getattr(user, field) for field in PROFILE_FIELDS}
+    profile['hourly_rate'] = str(user.hourly_rate)
+    return {
+        **profile,
+        'punched_in': punch_in is not None,
+        'punch_in': _datetime(punch_in),
+    }
+
+
+def cached_dashboard(user, punches, staff):
+    """``build_dashboard`` memoised per user (and company) for a few seconds"""
+    tenant = tenants.current()
+    key = f'dashboard:{tenant.slug if tenant else "default"}:{user.pk}'
+    payload = cache.get(key)
+    if payload is None:
+        cache_lookup('dashboard', 0, 1)
+        payload = build_dashboard(user, punches, staff)
+        payload['generated_at'] = _datetime(timezone.now())
+        cache.set(key, payload, settings.DASHBOARD_CACHE_SECONDS)
+    else:
+        cache_lookup('dashboard', 1)
+    return {**payload, 'me': own_status(user)}
@@ -0,0 +1,37 @@
+"""Database expressions shared by querysets, the admin and reports."""
+from django.db.models import DecimalField, ExpressionWrapper, F, Func
+
+
+class HoursBetween(Func):
+    """Hours between two datetime columns, rounded to two decimals.
+
+    Mirrors ``PunchRecord.save`` so set-based updates store the same value
+    a row-by-row save would.
+    """
+    output_field = DecimalField(max_digits=5, decimal_places=2)
+
+    def __init__(self, start, end, **extra):
+        super().__init__(start, end, **extra)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        start, end = (compiler.compile(expression) for expression in self.source_expressions)
+        sql = f'ROUND((julianday({end[0]}) - julianday({start[0]})) * 24, 2)'
+        return sql, (*end[1], *start[1])
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        start, end = (compiler.compile(expression) for expression in self.source_expressions)
+        sql = f'ROUND((EXTRACT(EPOCH FROM ({end[0]} - {start[0]})) / 3600)::numeric, 2)'
+        return sql, (*end[1], *start[1])
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        start, end = (compiler.compile(expression) for expression in self.source_expressions)
+        sql = f'ROUND(TIMESTAMPDIFF(MICROSECOND, {start[0]}, {end[0]}) / 3600000000, 2)'
+        return sql, (*start[1], *end[1])
+
+
+def salary_expression(hours='total_hours', rate='employee__hourly_rate'):
+    """Hours multiplied by the employee's hourly rate, computed in the database"""
+    return ExpressionWrapper(
+        F(hours) * F(rate),
+        output_field=DecimalField(max_digits=15, decimal_places=4),
+    )
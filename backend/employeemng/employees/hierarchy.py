@@ -0,0 +1,129 @@
+"""Reporting lines: who manages whom, directly or through other managers.
+
+``Employee.manager`` is the source of truth.  ``ReportingLine`` is its
+closure table, with one row for every (manager above, employee below) pair
+and the number of levels between them.  "Everyone under X" is then a single
+indexed join however deep the org chart goes, instead of a recursive walk.
+
+Saving an employee with a different manager moves its whole subtree in two
+statements (see ``move``).  Bulk writes skip signals and call ``move``
+themselves; ``rebuild`` recomputes the table from ``Employee.manager`` after
+raw updates or imports.
+"""
+from django.db import connections, router, transaction
+from django.db.models import Q
+
+from .models import Employee, ReportingLine
+
+
+class HierarchyError(ValueError):
+    pass
+
+
+def team(manager):
+    """Primary keys of everyone under ``manager``, as a subquery"""
+    return ReportingLine.objects.filter(ancestor=manager).values('descendant_id')
+
+
+def employees_under(manager):
+    return Employee.objects.filter(reporting_lines__ancestor=manager)
+
+
+def is_under(employee_pk, manager_pk, using=None):
+    return ReportingLine.objects.using(using or router.db_for_read(ReportingLine)).filter(
+        ancestor_id=manager_pk, descendant_id=employee_pk).exists()
+
+
+def check_manager(employee_pk, manager_pk, using=None):
+    """Raise ``HierarchyError`` if ``manager_pk`` may not manage ``employee_pk``"""
+    if manager_pk is None or employee_pk is None:
+        return
+    if manager_pk == employee_pk:
+        raise HierarchyError('An employee cannot manage themselves.')
+    if is_under(manager_pk, employee_pk, using):
+        raise HierarchyError('The new manager reports to this employee.')
+
+
+def manager_in_table(employee_pk, using=None):
+    """The direct manager the closure table currently records"""
+    return (
+        ReportingLine.objects.using(using or router.db_for_read(ReportingLine))
+        .filter(descendant_id=employee_pk, depth=1)
+        .values_list('ancestor_id', flat=True)
+        .first()
+    )
+
+
+def move(employee_pk, manager_pk, using=None):
+    """Put ``employee_pk`` and everyone under it below ``manager_pk`` (None: no manager)"""
+    db = using or router.db_for_write(ReportingLine)
+    check_manager(employee_pk, manager_pk, db)
+    lines = ReportingLine.objects.using(db)
+    connection = connections[db]
+    table = connection.ops.quote_name(ReportingLine._meta.db_table)
+    with transaction.atomic(using=db):
+        # Cut the subtree loose from everyone above it...
+        above = list(lines.filter(descendant_id=employee_pk).values_list('ancestor_id', flat=True))
+        if above:
+            lines.filter(ancestor_id__in=above).filter(
+                Q(descendant_id=employee_pk)
+                | Q(descendant_id__in=lines.filter(ancestor_id=employee_pk).values('descendant_id'))
+            ).delete()
+        if manager_pk is None:
+            return
+        # ...and link it to the new manager and everyone above them: each
+        # (new ancestor, subtree member) pair, depths added up
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (ancestor_id, descendant_id, depth) '
+                f'SELECT above.ancestor_id, below.descendant_id, above.depth + below.depth + 1 '
+                f'FROM (SELECT ancestor_id, depth FROM {table} WHERE descendant_id = %s '
+                f'UNION ALL SELECT CAST(%s AS BIGINT), 0) above, '
+                f'(SELECT descendant_id, depth FROM {table} WHERE ancestor_id = %s '
+                f'UNION ALL SELECT CAST(%s AS BIGINT), 0) below',
+                [manager_pk, manager_pk, employee_pk, employee_pk],
+            )
+
+
+def find_loop(parents):
+    """An employee in a management loop of a {employee: manager} mapping, or None"""
+    done = set()
+    for start in parents:
+        path = set()
+        node = start
+        while node in parents and node not in done:
+            if node in path:
+                return node
+            path.add(node)
+            node = parents[node]
+        done |= path
+    return None
+
+
+def rebuild(using=None):
+    """Recompute every reporting line from ``Employee.manager``; returns the row count"""
+    db = using or router.db_for_write(ReportingLine)
+    parents = dict(
+        Employee.objects.using(db).exclude(manager=None).values_list('pk', 'manager_id'))
+    loop = find_loop(parents)
+    if loop is not None:
+        raise HierarchyError(f'Employee {loop} is in a management loop.')
+
+    connection = connections[db]
+    table = connection.ops.quote_name(ReportingLine._meta.db_table)
+    employees = connection.ops.quote_name(Employee._meta.db_table)
+    with transaction.atomic(using=db):
+        ReportingLine.objects.using(db).all().delete()
+        # Walk up from every employee in the database itself
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (ancestor_id, descendant_id, depth) '
+                f'WITH RECURSIVE up (descendant_id, ancestor_id, depth) AS ('
+                f'SELECT id, manager_id, 1 FROM {employees} WHERE manager_id IS NOT NULL '
+                f'UNION ALL '
+                f'SELECT up.descendant_id, e.manager_id, up.depth + 1 '
+                f'FROM up JOIN {employees} e ON e.id = up.ancestor_id '
+                f'WHERE e.manager_id IS NOT NULL) '
+                f'SELECT ancestor_id, descendant_id, depth FROM up'
+            )
+            return cursor.rowcount
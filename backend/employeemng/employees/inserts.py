@@ -0,0 +1,75 @@
+"""``INSERT ... ON CONFLICT DO NOTHING`` that says which rows went in.
+
+``bulk_create(ignore_conflicts=True)`` can't tell which objects were
+skipped and leaves all of them without a primary key, so the punch and
+bulk import paths used to insert plainly and let a concurrent request's
+row surface as an ``IntegrityError``.  On PostgreSQL that error also
+aborts the surrounding transaction.  ``insert_new`` skips conflicting rows
+in the database and reads back the inserted ones with ``RETURNING``
+(PostgreSQL, SQLite 3.35+), leaving callers to report the rest as taken.
+"""
+from django.db import connections, router
+
+BATCH_SIZE = 500
+
+
+def insert_new(objs, key, conflict_fields=(), using=None, batch_size=BATCH_SIZE):
+    """Insert ``objs``, skipping any that conflict; returns the inserted ones, pk set.
+
+    ``key`` names fields that tell the objects apart, ``conflict_fields``
+    the unique constraint to watch (default: any).  Backends without
+    ``RETURNING`` fall back to ``bulk_create``, which raises on a conflict.
+    """
+    objs = list(objs)
+    if not objs:
+        return []
+    model = type(objs[0])
+    db = using or router.db_for_write(model)
+    connection = connections[db]
+    if not connection.features.can_return_rows_from_bulk_insert:
+        model.objects.using(db).bulk_create(objs, batch_size=batch_size)
+        return objs
+
+    meta = model._meta
+    quote = connection.ops.quote_name
+    fields = [field for field in meta.concrete_fields if not field.primary_key]
+    key_fields = [meta.get_field(name) for name in key]
+    positions = [fields.index(field) for field in key_fields]
+    target = (
+        '(' + ', '.join(quote(meta.get_field(name).column) for name in conflict_fields) + ') '
+        if conflict_fields else ''
+    )
+    sql = (
+        f'INSERT INTO {quote(meta.db_table)} ({", ".join(quote(field.column) for field in fields)}) '
+        f'VALUES {{values}} ON CONFLICT {target}DO NOTHING '
+        f'RETURNING {", ".join(quote(field.column) for field in [meta.pk, *key_fields])}'
+    )
+    row_placeholder = '(' + ', '.join(['%s'] * len(fields)) + ')'
+
+    inserted = []
+    with connection.cursor() as cursor:
+        for offset in range(0, len(objs), batch_size):
+            batch = objs[offset:offset + batch_size]
+            rows = [
+                [field.get_db_prep_save(field.pre_save(obj, True), connection) for field in fields]
+                for obj in batch
+            ]
+            cursor.execute(
+                sql.format(values=', '.join([row_placeholder] * len(batch))),
+                [value for row in rows for value in row],
+            )
+            # Keys are compared as Python values: a backend may hand back a
+            # date for what was sent as a string
+            pks = {
+                tuple(field.to_python(value) for field, value in zip(key_fields, returned[1:])): returned[0]
+                for returned in cursor.fetchall()
+            }
+            for obj, row in zip(batch, rows):
+                pk = pks.get(tuple(
+                    field.to_python(row[position]) for field, position in zip(key_fields, positions)))
+                if pk is not None:
+                    obj.pk = pk
+                    obj._state.adding = False
+                    obj._state.db = db
+                    inserted.append(obj)
+    return inserted
@@ -0,0 +1,221 @@
+"""Batch sync of punches buffered by offline kiosks.
+
+Each punch carries the device's timestamp and a client idempotency key.
+Keys already in ``PunchSyncKey`` get their stored outcome back, so a kiosk
+can resend a whole batch after a dropped connection.  New punches are
+replayed in timestamp order against the punch records they touch, which
+are read with one query, and written with one INSERT, one conditional
+UPDATE and one key INSERT in a single transaction.  If another request
+wrote the same records in the meantime the batch is re-read and retried.
+
+``punch_in`` is the single punch in of the punch endpoints, with the same
+conflict handling: a second punch in for the day is skipped by the
+database (``ON CONFLICT DO NOTHING``) rather than raising.
+"""
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import IntegrityError, router, transaction
+from django.db.models import Case, DateTimeField, DecimalField, Q, Value, When
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
+
+from . import audit, hierarchy, worktime
+from .inserts import insert_new
+from .metrics import PUNCHES
+from .models import Employee, PunchRecord, PunchSyncKey
+from .reports import invalidate_partials
+from .serializers import KioskPunchSerializer
+
+ONE_DAY = timedelta(days=1)
+ATTEMPTS = 3
+
+
+class Conflict(Exception):
+    """A punch record changed between reading and writing the batch"""
+
+
+def hours_between(punch_in, punch_out):
+    # Same rounding as PunchRecord.save()
+    return round((punch_out - punch_in).total_seconds() / 3600, 2)
+
+
+def insert_punches(records):
+    """Insert new punch records; returns those whose work day was still free"""
+    return insert_new(records, key=['employee', 'date'], conflict_fields=['employee', 'date'])
+
+
+def record_writes(created=(), closed=()):
+    """What PunchRecord's post_save receivers would do, for rows written in bulk"""
+    today = timezone.localdate()
+    invalidate_partials(
+        record.date for record in [*created, *closed] if record.date < today)
+    for record in created:
+        audit.record_save(record, created=True)
+    for record in closed:
+        audit.record_save(record, update_fields=['punch_out', 'total_hours'])
+
+
+def punch_in(employee, moment):
+    """Punch ``employee`` in at ``moment``; None if that work day already has a punch"""
+    day, minute = worktime.work_day(moment, worktime.zone_of(employee))
+    record = PunchRecord(employee=employee, punch_in=moment, date=day, start_minute=minute)
+    if not insert_punches([record]):
+        return None
+    record_writes(created=[record])
+    return record
+
+
+class KioskSyncBatch:
+    """Validate and apply one kiosk upload on behalf of ``user``"""
+
+    def __init__(self, user, punches, device=''):
+        self.user = user
+        self.punches = list(punches)
+        self.device = device
+        self.results = [None] * len(self.punches)
+        self._valid = []  # (index, validated_data)
+
+    def validate(self):
+        # One serializer for every row, as ListSerializer does; building its
+        # fields per row would cost more than the writes
+        serializer = KioskPunchSerializer()
+        for index, row in enumerate(self.punches):
+            try:
+                data = dict(serializer.run_validation(row))
+            except ValidationError as exc:
+                key = row.get('key') if isinstance(row, dict) else None
+                self.results[index] = self._result(
+                    index, key, 'invalid', errors=as_serializer_error(exc))
+                continue
+            data['timestamp'] = data['timestamp'].astimezone(dt_timezone.utc)
+            self._valid.append((index, data))
+
+    def save(self):
+        """Apply the batch; returns one result per submitted punch, in order"""
+        for attempt in range(ATTEMPTS):
+            try:
+                return self._apply()
+            except (Conflict, IntegrityError):
+                if attempt == ATTEMPTS - 1:
+                    raise
+
+    @staticmethod
+    def _result(index, key, status, punch_record=None, detail='', **extra):
+        return {'index': index, 'key': key, 'status': status,
+                'punch_record': punch_record, 'detail': detail, **extra}
+
+    def _apply(self):
+        results = list(self.results)
+        stored = PunchSyncKey.objects.in_bulk(
+            [data['key'] for _, data in self._valid], field_name='key')
+
+        pending, first_of = [], {}
+        for index, data in self._valid:
+            key = data['key']
+            if key in stored:
+                previous = stored[key]
+                results[index] = self._result(
+                    index, key, 'duplicate', previous.punch_record_id, previous.detail,
+                    original_status=previous.status)
+            elif key in first_of:
+                pass  # filled in from the first occurrence below
+            else:
+                first_of[key] = index
+                pending.append((index, data))
+
+        employees = self._employees({data['employee_id'] for _, data in pending})
+        days = {
+            worktime.work_day(data['timestamp'], employees[data['employee_id']][1])[0]
+            for _, data in pending if data['employee_id'] in employees
+        }
+        days |= {day - ONE_DAY for day in days}
+        records = {
+            (record.employee_id, record.date): record
+            for record in PunchRecord.objects.filter(
+                employee_id__in={pk for pk, _ in employees.values()}, date__in=days)
+        }
+
+        created, closed, outcomes = [], {}, {}
+        for index, data in sorted(pending, key=lambda item: item[1]['timestamp']):
+            outcomes[index] = self._replay(data, employees, records, created, closed)
+
+        with transaction.atomic(using=router.db_for_write(PunchRecord)):
+            # A day punched in by another request since the read: retry
+            if len(insert_punches(created)) != len(created):
+                raise Conflict()
+            self._close(closed)
+            PunchSyncKey.objects.bulk_create([
+                PunchSyncKey(key=data['key'], device=self.device, status=outcomes[index][0],
+                             detail=outcomes[index][2],
+                             punch_record_id=outcomes[index][1].pk if outcomes[index][1] else None)
+                for index, data in pending
+            ], batch_size=500)
+            record_writes(created, closed.values())
+
+        for index, data in pending:
+            status, record, detail = outcomes[index]
+            results[index] = self._result(
+                index, data['key'], status, record.pk if record else None, detail)
+            PUNCHES.inc(data['action'], 'ok' if status == 'applied' else 'rejected')
+        for index, data in self._valid:
+            if results[index] is None:
+                first = results[first_of[data['key']]]
+                results[index] = self._result(
+                    index, data['key'], 'duplicate', first['punch_record'], first['detail'],
+                    original_status=first['status'])
+        return results
+
+    def _employees(self, employee_ids):
+        """employee_id -> (pk, work zone) for the active employees this user may punch for"""
+        queryset = Employee.objects.filter(employee_id__in=employee_ids, is_active=True)
+        if self.user.role == 'manager':
+            queryset = queryset.filter(Q(pk=self.user.pk) | Q(pk__in=hierarchy.team(self.user)))
+        return {
+            employee_id: (pk, worktime.zone_named(name))
+            for employee_id, pk, name in queryset.values_list('employee_id', 'pk', 'timezone')
+        }
+
+    @staticmethod
+    def _replay(data, employees, records, created, closed):
+        """Apply one punch to the in-memory records: (status, record, detail)"""
+        if data['employee_id'] not in employees:
+            return 'rejected', None, 'Unknown or inactive employee.'
+        employee, zone = employees[data['employee_id']]
+        moment = data['timestamp']
+        day, minute = worktime.work_day(moment, zone)
+
+        if data['action'] == 'punch_in':
+            if (employee, day) in records:
+                return 'rejected', records[(employee, day)], 'Already punched in on this day.'
+            record = PunchRecord(employee_id=employee, punch_in=moment, date=day, start_minute=minute)
+            records[(employee, day)] = record
+            created.append(record)
+            return 'applied', record, ''
+
+        # A punch out closes an open record from the same day or, for night
+        # shifts, the day before
+        for candidate in (records.get((employee, day)), records.get((employee, day - ONE_DAY))):
+            if candidate is not None and candidate.punch_out is None and candidate.punch_in <= moment:
+                candidate.punch_out = moment
+                candidate.total_hours = hours_between(candidate.punch_in, moment)
+                if candidate.pk is not None:
+                    closed[candidate.pk] = candidate
+                return 'applied', candidate, ''
+        return 'rejected', None, 'No open punch in before this time.'
+
+    @staticmethod
+    def _close(closed):
+        """One UPDATE for every punch out, only while the records are still open"""
+        if not closed:
+            return
+        updated = PunchRecord.objects.filter(pk__in=list(closed), punch_out__isnull=True).update(
+            punch_out=Case(
+                *[When(pk=pk, then=Value(record.punch_out)) for pk, record in closed.items()],
+                output_field=DateTimeField()),
+            total_hours=Case(
+                *[When(pk=pk, then=Value(record.total_hours)) for pk, record in closed.items()],
+                output_field=DecimalField(max_digits=5, decimal_places=2)),
+        )
+        if updated != len(closed):
+            raise Conflict()
@@ -0,0 +1,234 @@
+"""List responses read straight from ``values_list()`` rows.
+
+The model serializers build a model instance per row (two for a punch
+record and its employee) and then run every DRF field on it, which is most
+of the time and memory of a large page.  The list actions of the punch
+record, employee and report endpoints read tuples instead, with computed
+values such as names, pay and an employee's total hours added as database
+columns.  A ``Rows`` compiles its output once into a single list
+comprehension that unpacks each tuple into locals and builds the response
+dict, so no per-field call is left except the few formatting helpers
+below, and a page is read from the cursor in chunks rather than listed
+first.  The JSON is the same as the serializers', key for key;
+``manage.py benchmark_lists`` checks that and measures both paths.
+
+Detail, create and update responses still use the serializers.
+"""
+from datetime import date
+
+from django.conf import settings
+from django.core.paginator import InvalidPage
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Concat
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+
+from .expressions import salary_expression
+from .models import PunchRecord
+
+
+# Rows fetched at a time while a page is serialized
+CHUNK_SIZE = 1000
+
+
+class ListPagination(PageNumberPagination):
+    """Page numbers, with ``?page_size=`` up to ``LIST_MAX_PAGE_SIZE`` rows"""
+    page_size_query_param = 'page_size'
+
+    @property
+    def max_page_size(self):
+        return settings.LIST_MAX_PAGE_SIZE
+
+    def paginate_rows(self, queryset, request, view=None):
+        """``paginate_queryset``, but the page's rows are streamed instead of listed"""
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        paginator = self.django_paginator_class(queryset, page_size)
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return self.page.object_list.iterator(chunk_size=CHUNK_SIZE)
+
+
+def page_size(query_params):
+    """The page size ``ListPagination`` would use, for views outside DRF"""
+    try:
+        size = int(query_params.get('page_size', ''))
+    except ValueError:
+        size = 0
+    if size <= 0:
+        return settings.REST_FRAMEWORK['PAGE_SIZE']
+    return min(size, settings.LIST_MAX_PAGE_SIZE)
+
+
+# Formatting, as the DRF fields the rows replace.  Each response gets fresh
+# value -> text tables, so a day, an amount or a name that repeats down the
+# page is formatted once and shares one string.
+
+class _Formatted(dict):
+    def __init__(self, format):
+        super().__init__()
+        self.format = format
+
+    def __missing__(self, value):
+        text = self[value] = None if value is None else self.format(value)
+        return text
+
+
+def _formatters():
+    zone = timezone.get_current_timezone()
+
+    def datetime_text(value):
+        # DateTimeField: ISO 8601 in the current timezone, "Z" for UTC
+        text = value.astimezone(zone).isoformat()
+        return text[:-6] + 'Z' if text.endswith('+00:00') else text
+
+    return {
+        '_datetime': _Formatted(datetime_text),
+        '_date': _Formatted(date.isoformat),
+        # DecimalField; the database returns them quantized already
+        '_decimal': _Formatted('{:f}'.format),
+        '_shared': _Formatted(str),
+    }
+
+
+FORMATTERS = list(_formatters())
+
+
+class Rows:
+    """A list response built from ``values_list`` rows.
+
+    ``columns`` maps each name to a field path or a database expression,
+    ``fields`` each output key to a Python expression over those names,
+    which may look values up in the ``_datetime``, ``_date``, ``_decimal``
+    and ``_shared`` tables.
+    """
+
+    def __init__(self, columns, fields):
+        self.annotations = {name: value for name, value in columns.items() if not isinstance(value, str)}
+        self.paths = [name if name in self.annotations else value for name, value in columns.items()]
+        items = ', '.join(f'{key!r}: {expression}' for key, expression in fields.items())
+        source = (
+            'def serialize(rows):\n'
+            f'    {", ".join(FORMATTERS)}, = _formatters().values()\n'
+            f'    return [{{{items}}} for ({", ".join(columns)},) in rows]\n'
+        )
+        namespace = {'_formatters': _formatters, '_float': float}
+        exec(compile(source, f'<rows {", ".join(fields)}>', 'exec'), namespace)
+        self.serialize = namespace['serialize']
+
+    def query(self, queryset):
+        return queryset.annotate(**self.annotations).values_list(*self.paths)
+
+
+PUNCH_RECORDS = Rows(
+    columns={
+        'id': 'id',
+        'employee': 'employee_id',
+        'employee_name': Concat('employee__first_name', Value(' '), 'employee__last_name'),
+        'punch_in': 'punch_in',
+        'punch_out': 'punch_out',
+        'date': 'date',
+        'total_hours': 'total_hours',
+        'daily_salary': salary_expression(),
+    },
+    fields={
+        'id': 'id',
+        'employee': 'employee',
+        'employee_name': '_shared[employee_name]',
+        'punch_in': '_datetime[punch_in]',
+        'punch_out': '_datetime[punch_out]',
+        'date': '_date[date]',
+        'total_hours': '_decimal[total_hours]',
+        # PunchRecord.daily_salary: 0 for an open or empty punch
+        'daily_salary': 'daily_salary or 0',
+    },
+)
+
+EMPLOYEES = Rows(
+    columns={
+        'id': 'id',
+        'employee_id': 'employee_id',
+        'first_name': 'first_name',
+        'last_name': 'last_name',
+        'email': 'email',
+        'phone_number': 'phone_number',
+        'address': 'address',
+        'campaign': 'campaign',
+        'timezone': 'timezone',
+        'role': 'role',
+        'hourly_rate': 'hourly_rate',
+        'manager': 'manager_id',
+        # All-time hours, one correlated sum per row instead of two queries
+        'hours': Subquery(
+            PunchRecord.objects.filter(employee=OuterRef('pk')).order_by()
+            .values('employee').annotate(total=Sum('total_hours')).values('total'),
+            output_field=DecimalField(max_digits=15, decimal_places=2),
+        ),
+        'is_active': 'is_active',
+        'username': 'username',
+    },
+    fields={
+        'id': 'id',
+        'employee_id': 'employee_id',
+        'first_name': 'first_name',
+        'last_name': 'last_name',
+        'email': 'email',
+        'phone_number': 'phone_number',
+        'address': 'address',
+        'campaign': 'campaign',
+        'timezone': 'timezone',
+        'role': 'role',
+        'hourly_rate': '_decimal[hourly_rate]',
+        'manager': 'manager',
+        'total_salary': '_float((hours or 0) * hourly_rate)',
+        'total_hours': '_float(hours or 0)',
+        'is_active': 'is_active',
+        'username': 'username',
+    },
+)
+
+REPORTS = Rows(
+    columns={
+        'id': 'id',
+        'title': 'title',
+        'report_type': 'report_type',
+        'generated_by': 'generated_by_id',
+        'generated_by_name': Concat('generated_by__first_name', Value(' '), 'generated_by__last_name'),
+        'generated_at': 'generated_at',
+        'start_date': 'start_date',
+        'end_date': 'end_date',
+        'data': 'data',
+    },
+    fields={
+        'id': 'id',
+        'title': 'title',
+        'report_type': 'report_type',
+        'generated_by': 'generated_by',
+        'generated_by_name': '_shared[generated_by_name]',
+        'generated_at': '_datetime[generated_at]',
+        'start_date': '_date[start_date]',
+        'end_date': '_date[end_date]',
+        'data': 'data',
+    },
+)
+
+
+class RowListMixin:
+    """``list`` for a viewset from ``list_rows`` instead of its serializer"""
+    list_rows = None
+
+    def list(self, request, *args, **kwargs):
+        rows = self.list_rows.query(self.filter_queryset(self.get_queryset()))
+        page = self.paginator.paginate_rows(rows, request, view=self) if self.paginator else None
+        if page is not None:
+            return self.get_paginated_response(self.list_rows.serialize(page))
+        return Response(self.list_rows.serialize(rows.iterator(chunk_size=CHUNK_SIZE)))
@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from employees.archive import archive_punches
+
+
+class Command(BaseCommand):
+    help = 'Move punch records older than the retention horizon into the punch archive.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days', type=int,
+            default=settings.PUNCH_ARCHIVE_RETENTION_DAYS,
+            help='Keep this many days of punches in the database.',
+        )
+        parser.add_argument(
+            '--before',
+            help='Archive punches dated before this day (YYYY-MM-DD). '
+                 'Overrides --retention-days.',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report what would be archived without writing anything.',
+        )
+
+    def handle(self, *args, **options):
+        if options['before']:
+            before = parse_date(options['before'])
+            if before is None:
+                raise CommandError('--before must be a date in YYYY-MM-DD format.')
+        else:
+            before = timezone.now().date() - timedelta(days=options['retention_days'])
+
+        summary = archive_punches(
+            before,
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {summary['archived']} punch records across "
+            f"{summary['months']} month(s) before {before}; "
+            f"deleted {summary['deleted']} from the database."
+        ))
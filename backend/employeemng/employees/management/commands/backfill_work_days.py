@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from employees.worktime import backfill
+
+
+class Command(BaseCommand):
+    help = ('Recompute the local work date and start minute of stored punches from each '
+            'employee\'s timezone, e.g. after upgrading or changing a timezone.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--employee', action='append', metavar='EMPLOYEE_ID',
+            help='Only punches of this employee (repeatable).',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        summary = backfill(
+            batch_size=options['batch_size'],
+            using=options['database'],
+            employee_ids=options['employee'],
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        for pk in summary['clashes']:
+            self.stderr.write(
+                f'Punch record {pk} left unchanged: its employee already has a punch on its new day.')
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {summary['checked']} punch records and updated {summary['updated']} "
+            f"in {time.perf_counter() - started:.1f}s."))
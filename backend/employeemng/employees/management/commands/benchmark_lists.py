@@ -0,0 +1,67 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from employees import listing, renderers
+from employees.models import Employee, PunchRecord, Report
+from employees.serializers import EmployeeSerializer, PunchRecordSerializer, ReportSerializer
+
+ENDPOINTS = {
+    'employees': (Employee.objects.order_by('pk'), EmployeeSerializer, listing.EMPLOYEES),
+    'punch-records': (
+        PunchRecord.objects.select_related('employee').order_by('pk'), PunchRecordSerializer,
+        listing.PUNCH_RECORDS),
+    'reports': (Report.objects.select_related('generated_by').order_by('pk'), ReportSerializer, listing.REPORTS),
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare list pages built by the model serializers with the values_list rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Rows per page.')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per path; the fastest counts.')
+        parser.add_argument('--endpoint', action='append', choices=list(ENDPOINTS))
+
+    def handle(self, *args, **options):
+        renderer = renderers.ORJSONRenderer()
+        for name in options['endpoint'] or list(ENDPOINTS):
+            queryset, serializer_class, rows = ENDPOINTS[name]
+            paths = [
+                ('serializer', lambda: serializer_class(list(queryset[:options['rows']]), many=True).data),
+                ('rows', lambda: rows.serialize(
+                    rows.query(queryset)[:options['rows']].iterator(chunk_size=listing.CHUNK_SIZE))),
+            ]
+            bodies, results = [], []
+            for label, build in paths:
+                cpu = min(self.cpu_seconds(build) for _ in range(options['repeat']))
+                tracemalloc.start()
+                try:
+                    data = build()
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+                bodies.append(renderer.render(data))
+                results.append((label, len(data), cpu, peak))
+
+            count = results[0][1]
+            if not count:
+                raise CommandError(f'No rows to benchmark for {name}; seed the database first.')
+            same = 'same JSON' if bodies[0] == bodies[1] else 'JSON DIFFERS'
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: {count} rows, {same}'))
+            baseline = results[0]
+            for label, _, cpu, peak in results:
+                self.stdout.write(
+                    f'  {label:<11} {cpu * 1000:9.1f} ms cpu {cpu / count * 1e6:8.1f} us/row '
+                    f'{peak / count:9.0f} B/row peak '
+                    f'x{baseline[2] / cpu:.1f} cpu x{baseline[3] / peak:.1f} memory'
+                )
+            if bodies[0] != bodies[1]:
+                raise CommandError(f'{name}: the rows path renders different JSON.')
+
+    @staticmethod
+    def cpu_seconds(build):
+        started = time.process_time()
+        build()
+        return time.process_time() - started
@@ -0,0 +1,58 @@
+import gzip
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from employees import renderers
+from employees.models import Employee, PunchRecord, Report
+from employees.serializers import EmployeeSerializer, PunchRecordSerializer, ReportSerializer
+
+ENDPOINTS = {
+    'employees': (Employee.objects.order_by('pk'), EmployeeSerializer),
+    'punch-records': (PunchRecord.objects.select_related('employee').order_by('pk'), PunchRecordSerializer),
+    'reports': (Report.objects.select_related('generated_by').order_by('pk'), ReportSerializer),
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare renderer throughput on the payloads each list endpoint produces.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='Rows per payload.')
+        parser.add_argument('--repeat', type=int, default=20, help='Renders per renderer.')
+        parser.add_argument('--endpoint', action='append', choices=list(ENDPOINTS))
+
+    def handle(self, *args, **options):
+        candidates = [('drf-json', JSONRenderer())]
+        if renderers.orjson is not None:
+            candidates.append(('orjson', renderers.ORJSONRenderer()))
+        if renderers.msgpack is not None:
+            candidates.append(('msgpack', renderers.MessagePackRenderer()))
+
+        for name in options['endpoint'] or list(ENDPOINTS):
+            queryset, serializer_class = ENDPOINTS[name]
+            rows = list(queryset[:options['rows']])
+            if not rows:
+                raise CommandError(f'No rows to benchmark for {name}; seed the database first.')
+
+            started = time.perf_counter()
+            data = serializer_class(rows, many=True).data
+            serialize_ms = (time.perf_counter() - started) * 1000
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{name}: {len(rows)} rows, serializer {serialize_ms:.1f} ms'))
+
+            baseline = None
+            for label, renderer in candidates:
+                body = renderer.render(data)
+                started = time.perf_counter()
+                for _ in range(options['repeat']):
+                    renderer.render(data)
+                per_render = (time.perf_counter() - started) / options['repeat']
+                baseline = baseline or per_render
+                self.stdout.write(
+                    f'  {label:<9} {per_render * 1000:8.2f} ms/render '
+                    f'{len(rows) / per_render:12.0f} rows/s '
+                    f'{len(body):9d} B  gzip {len(gzip.compress(body, 6)):8d} B '
+                    f'x{baseline / per_render:.1f}'
+                )
@@ -0,0 +1,53 @@
+import getpass
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from employees.models import Company, Employee
+from employees.tenants import shard_path, tenant_context
+
+
+class Command(BaseCommand):
+    help = 'Add a company (tenant), create and migrate its database and optionally its first admin.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('slug', help='Short name used in API tokens and logins, e.g. "acme".')
+        parser.add_argument('name')
+        parser.add_argument(
+            '--shard', default='',
+            help='DATABASES alias or SQLite file for the company '
+                 '(default: <TENANT_DATABASE_DIR>/<slug>.sqlite3).',
+        )
+        parser.add_argument('--admin-id', help='employee_id of an admin account to create.')
+        parser.add_argument('--admin-password', help='Prompted for when omitted.')
+
+    def handle(self, *args, **options):
+        company = Company(slug=options['slug'], name=options['name'], shard=options['shard'])
+        try:
+            company.full_clean()
+        except ValidationError as exc:
+            raise CommandError('; '.join(f'{field}: {" ".join(errors)}'
+                                         for field, errors in exc.message_dict.items()))
+        # Two companies in one database would see each other's rows
+        path = shard_path(company).resolve()
+        for other in Company.objects.all():
+            if (company.shard and other.shard == company.shard) or shard_path(other).resolve() == path:
+                raise CommandError(f'Company "{other.slug}" already uses that database.')
+
+        password = None
+        if options['admin_id']:
+            password = options['admin_password'] or getpass.getpass(
+                f"Password for {options['admin_id']}: ")
+
+        company.save()
+        with tenant_context(company) as tenant:
+            call_command('migrate', database=tenant.database,
+                         verbosity=max(0, options['verbosity'] - 1), stdout=self.stdout)
+            if options['admin_id']:
+                Employee.objects.create_user(
+                    employee_id=options['admin_id'], username=options['admin_id'].lower(),
+                    password=password, role='admin', is_staff=True,
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f'Created company "{company.slug}" in database "{tenant.database}".'))
@@ -0,0 +1,96 @@
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import StringIO
+
+from django.core.management import call_command, get_commands, load_command_class
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from employees.tenants import all_tenants, tenant_context
+
+
+def _init_worker(settings_module):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def run_for_tenant(slug, name, argv, stdout=None):
+    """Run command ``name`` with the tenant active: (slug, output, error, seconds)"""
+    out = stdout or StringIO()
+    started = time.perf_counter()
+    error = None
+    try:
+        with tenant_context(slug) as tenant:
+            command = load_command_class(get_commands()[name], name)
+            parser = command.create_parser('manage.py', name)
+            if any(action.dest == 'database' for action in parser._actions):
+                argv = [*argv, f'--database={tenant.database}']
+            call_command(command, *argv, stdout=out, stderr=out)
+    except BaseException as exc:  # SystemExit from argparse included
+        error = ''.join(traceback.format_exception_only(exc)).strip()
+        if not isinstance(exc, (CommandError, SystemExit)):
+            error = traceback.format_exc()
+    finally:
+        connections.close_all()
+    output = out.getvalue() if stdout is None else ''
+    return slug, output, error, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = ('Run a management command in every company database, e.g. '
+            '"for_each_tenant --parallel 8 migrate". Commands with a --database '
+            'option are pointed at the tenant database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tenant', action='append', dest='tenants', metavar='SLUG',
+                            help='Only this company (repeatable).')
+        parser.add_argument('--parallel', type=int, default=1,
+                            help='Worker processes; 1 runs the command in this process.')
+        parser.add_argument('command_name', metavar='command')
+        parser.add_argument('command_args', nargs='...', metavar='args')
+
+    def handle(self, *args, **options):
+        name = options['command_name']
+        if name not in get_commands():
+            raise CommandError(f'Unknown command: {name}')
+        argv = options['command_args']
+        tenants = all_tenants(options['tenants'])
+        missing = set(options['tenants'] or ()) - {tenant.slug for tenant in tenants}
+        if missing:
+            raise CommandError(f"Unknown or inactive companies: {', '.join(sorted(missing))}")
+
+        failed = []
+        parallel = max(1, options['parallel'])
+        if parallel == 1:
+            for tenant in tenants:
+                self.stdout.write(self.style.MIGRATE_HEADING(f'== {tenant.slug} =='))
+                self.report(*run_for_tenant(tenant.slug, name, argv, stdout=self.stdout), failed)
+        else:
+            # Children must not share the parent's SQLite connections
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=parallel,
+                initializer=_init_worker,
+                initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'employeemng.settings'),),
+            ) as pool:
+                futures = [pool.submit(run_for_tenant, tenant.slug, name, argv) for tenant in tenants]
+                for future in as_completed(futures):
+                    slug, output, error, seconds = future.result()
+                    self.stdout.write(self.style.MIGRATE_HEADING(f'== {slug} =='))
+                    self.stdout.write(output, ending='')
+                    self.report(slug, output, error, seconds, failed)
+
+        if failed:
+            raise CommandError(f"{name} failed for {len(failed)} of {len(tenants)} companies: "
+                               f"{', '.join(sorted(failed))}")
+        self.stdout.write(self.style.SUCCESS(f'{name} done for {len(tenants)} companies.'))
+
+    def report(self, slug, output, error, seconds, failed):
+        if error:
+            failed.append(slug)
+            self.stderr.write(self.style.ERROR(f'{slug}: {error}'))
+        else:
+            self.stdout.write(f'{slug}: done in {seconds:.1f}s')
@@ -0,0 +1,44 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from employees.payslips import FORMATS, PayslipError, batch_dir, generate
+
+
+class Command(BaseCommand):
+    help = ('Write a payslip for every employee for one month. Running it again '
+            'resumes an interrupted batch.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('month', help='YYYY-MM')
+        parser.add_argument('--format', choices=FORMATS, default='html')
+        parser.add_argument('--zip', action='store_true', help='Also bundle the batch into one zip file.')
+        parser.add_argument('--workers', type=int, default=settings.PAYSLIP_WORKERS,
+                            help='Rendering processes.')
+        parser.add_argument('--force', action='store_true',
+                            help='Discard an existing batch for the month and start over.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        last_report = [0.0]
+
+        def progress(done, total):
+            now = time.perf_counter()
+            if done < total and now - last_report[0] < 1:
+                return
+            last_report[0] = now
+            elapsed = now - started
+            self.stdout.write(f'{done}/{total} payslips ({done * 100 // (total or 1)}%) '
+                              f'after {elapsed:.1f}s')
+
+        try:
+            status = generate(
+                options['month'], options['format'], make_zip=options['zip'],
+                workers=options['workers'], force=options['force'], progress=progress,
+            )
+        except PayslipError as exc:
+            raise CommandError(str(exc))
+        directory = batch_dir(options['month'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {status['total']} payslips to {directory} in {time.perf_counter() - started:.1f}s."))
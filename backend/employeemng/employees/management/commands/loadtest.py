@@ -0,0 +1,336 @@
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from employees import worktime
+from employees.models import Employee, PunchRecord
+
+PREFIX = 'LOAD'
+PASSWORD = 'loadtest123'
+LOCKED = 'database is locked'
+
+SERVERS = {
+    'wsgi': ['employeemng.wsgi:application'],
+    'asgi': ['employeemng.asgi:application', '-k', 'uvicorn.workers.UvicornWorker'],
+}
+KINDS = ['punch', 'list', 'report']
+
+
+def synthetic_employees(count, role='employee', prefix=PREFIX):
+    """Create (or reuse) ``count`` load-test accounts sharing one password hash"""
+    ids = [f'{prefix}{n:05d}' for n in range(count)]
+    existing = set(Employee.objects.filter(employee_id__in=ids).values_list('employee_id', flat=True))
+    password = make_password(PASSWORD)
+    Employee.objects.bulk_create([
+        Employee(employee_id=employee_id, username=employee_id.lower(), password=password,
+                 first_name='Load', last_name=employee_id, role=role, campaign='Load test')
+        for employee_id in ids if employee_id not in existing
+    ])
+    return list(Employee.objects.filter(employee_id__in=ids).order_by('employee_id'))
+
+
+def parse_curve(value):
+    """``'10@5,20@40'``: 10 seconds at 5 arrivals/s, then 20 seconds at 40/s"""
+    try:
+        segments = [tuple(float(part) for part in item.split('@')) for item in value.split(',')]
+    except ValueError:
+        segments = None
+    if not segments or any(len(segment) != 2 or min(segment) <= 0 for segment in segments):
+        raise CommandError(f'Invalid --curve {value!r}; expected seconds@rate[,seconds@rate...]')
+    return segments
+
+
+def parse_mix(value):
+    try:
+        mix = {kind: float(weight) for kind, weight in (item.split('=') for item in value.split(','))}
+    except ValueError:
+        mix = None
+    if not mix or set(mix) - set(KINDS) or sum(mix.values()) <= 0:
+        raise CommandError(f'Invalid --mix {value!r}; expected e.g. punch=85,list=10,report=5')
+    return mix
+
+
+def arrivals(curve, mix, rng):
+    """Poisson arrival times (seconds from start) and request kinds"""
+    kinds, weights = zip(*mix.items())
+    schedule, offset = [], 0.0
+    for duration, rate in curve:
+        moment = offset + rng.expovariate(rate)
+        while moment < offset + duration:
+            schedule.append((moment, rng.choices(kinds, weights)[0]))
+            moment += rng.expovariate(rate)
+        offset += duration
+    return schedule
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Client:
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method, path, data=None, token=None):
+        """(status, body, headers); status is None when the server could not be reached"""
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Token {token}'
+        request = urllib.request.Request(
+            self.base_url + path, method=method, headers=headers,
+            data=json.dumps(data).encode() if data is not None else None)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.read(), response.headers
+        except urllib.error.HTTPError as exc:
+            return exc.code, exc.read(), exc.headers
+        except (urllib.error.URLError, OSError) as exc:
+            return None, str(exc).encode(), {}
+
+
+class Command(BaseCommand):
+    help = ('Replay a shift-change punch storm (punches, punch lists and reports on an '
+            'arrival curve) against a local WSGI/ASGI server or a running one.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', action='append', choices=list(SERVERS),
+                            help='Start this server locally; repeat to compare wsgi and asgi.')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000',
+                            help='Server to test when --server is not given.')
+        parser.add_argument('--api', choices=['auto', 'sync', 'async'], default='auto',
+                            help='auto uses the /api/async/ punch and list views under asgi.')
+        parser.add_argument('--employees', type=int, default=200)
+        parser.add_argument('--managers', type=int, default=2)
+        parser.add_argument('--curve', default='5@5,20@20,5@5',
+                            help='seconds@arrivals-per-second segments.')
+        parser.add_argument('--mix', default='punch=85,list=10,report=5')
+        parser.add_argument('--concurrency', type=int, default=200, help='Client threads.')
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--throttling', action='store_true',
+                            help='Keep API throttling on in locally started servers.')
+        parser.add_argument('--json', action='store_true', help='Print raw results as JSON.')
+
+    def handle(self, *args, **options):
+        curve = parse_curve(options['curve'])
+        mix = parse_mix(options['mix'])
+        employees = synthetic_employees(options['employees'])
+        managers = synthetic_employees(options['managers'], role='manager', prefix=f'{PREFIX}M')
+
+        summaries = []
+        for server in options['server'] or [None]:
+            # Each employee can punch in once a day; clear earlier runs
+            PunchRecord.objects.filter(employee__in=employees, date=worktime.today()).delete()
+            use_async = options['api'] == 'async' or (options['api'] == 'auto' and server == 'asgi')
+            schedule = arrivals(curve, mix, random.Random(options['seed']))
+            with self.server(server, options) as (base_url, log):
+                client = Client(base_url, options['timeout'])
+                tokens, login_stats = self.login(client, employees + managers, options)
+                results, elapsed = self.replay(
+                    client, tokens, employees, managers, schedule, use_async, options)
+                lock_timeouts = self.lock_timeouts(results, log)
+            summaries.append(self.summarize(
+                server or base_url, use_async, login_stats, results, elapsed, lock_timeouts))
+
+        if options['json']:
+            self.stdout.write(json.dumps(summaries, indent=2))
+            return
+        for summary in summaries:
+            self.print_summary(summary)
+
+    @contextmanager
+    def server(self, kind, options):
+        if kind is None:
+            yield options['base_url'], None
+            return
+        port = free_port()
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get(
+            'DJANGO_SETTINGS_MODULE', 'employeemng.settings'))
+        if not options['throttling']:
+            env['API_THROTTLING'] = 'off'
+        command = [sys.executable, '-m', 'gunicorn', *SERVERS[kind],
+                   '-w', str(options['workers']), '-b', f'127.0.0.1:{port}', '--log-level', 'warning']
+        with tempfile.TemporaryFile('w+') as log:
+            process = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env,
+                                       stdout=log, stderr=subprocess.STDOUT)
+            try:
+                base_url = f'http://127.0.0.1:{port}'
+                self.wait_until_up(base_url, process, log)
+                yield base_url, log
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+
+    @staticmethod
+    def wait_until_up(base_url, process, log):
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                log.seek(0)
+                raise CommandError(f'Server exited during startup:\n{log.read()}')
+            try:
+                urllib.request.urlopen(base_url + '/api/', timeout=1).close()
+                return
+            except urllib.error.HTTPError:
+                return
+            except (urllib.error.URLError, OSError):
+                time.sleep(0.2)
+        raise CommandError('Server did not start within 30 seconds')
+
+    def login(self, client, accounts, options):
+        """Log every account in through /api/login/, waiting out 429s"""
+        def login_one(employee):
+            started = time.perf_counter()
+            while True:
+                status, body, headers = client.request(
+                    'POST', '/api/login/', {'employee_id': employee.employee_id, 'password': PASSWORD})
+                if status != 429:
+                    break
+                time.sleep(float(headers.get('Retry-After', 1)))
+            if status != 200:
+                raise CommandError(f'Login failed for {employee.employee_id}: {status} {body[:200]!r}')
+            return employee.pk, json.loads(body)['token'], (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(options['concurrency'], 32)) as pool:
+            logged_in = list(pool.map(login_one, accounts))
+        latencies = sorted(latency for _, _, latency in logged_in)
+        stats = {
+            'count': len(logged_in),
+            'seconds': round(time.perf_counter() - started, 2),
+            'p50_ms': round(percentile(latencies, .5), 1),
+            'p95_ms': round(percentile(latencies, .95), 1),
+        }
+        return {pk: token for pk, token, _ in logged_in}, stats
+
+    def replay(self, client, tokens, employees, managers, schedule, use_async, options):
+        prefix = '/api/async/punch-records/' if use_async else '/api/punch-records/'
+        punches = iter([(employee, 'punch_in') for employee in employees]
+                       + [(employee, 'punch_out') for employee in employees])
+        punches_lock = threading.Lock()
+        rng = random.Random(options['seed'] + 1)
+        today = timezone.now().date()
+
+        def send(scheduled, kind):
+            if kind == 'punch':
+                with punches_lock:
+                    employee, action = next(punches, (None, None))
+                if employee is None:
+                    return kind, 'skipped', 0.0, b''
+                request = ('POST', prefix + 'punch/', {'action': action}, tokens[employee.pk])
+            elif kind == 'list':
+                request = ('GET', prefix, None, tokens[rng.choice(employees).pk])
+            else:
+                start = today - timedelta(days=rng.randint(7, 92))
+                request = ('POST', '/api/reports/', {
+                    'title': 'Load test', 'report_type': rng.choice(['attendance', 'salary', 'employee']),
+                    'start_date': start.isoformat(), 'end_date': today.isoformat(),
+                }, tokens[rng.choice(managers).pk])
+            status, body, _ = client.request(*request)
+            # Latency counts from the scheduled arrival, so client-side queueing shows up too
+            return kind, status, (time.perf_counter() - scheduled) * 1000, body
+
+        started = time.perf_counter()
+        futures = []
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            for offset, kind in schedule:
+                delay = started + offset - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(pool.submit(send, started + offset, kind))
+            results = [future.result() for future in futures]
+        return results, time.perf_counter() - started
+
+    @staticmethod
+    def lock_timeouts(results, log):
+        if log is None:
+            return sum(1 for _, status, _, body in results if status == 500 and LOCKED.encode() in body)
+        log.flush()
+        log.seek(0)
+        return sum(1 for line in log if line.startswith('django.db.utils.OperationalError') and LOCKED in line)
+
+    @staticmethod
+    def summarize(target, use_async, login_stats, results, elapsed, lock_timeouts):
+        sent = [result for result in results if result[1] != 'skipped']
+        summary = {
+            'target': target,
+            'api': 'async' if use_async else 'sync',
+            'login': login_stats,
+            'seconds': round(elapsed, 2),
+            'requests': len(sent),
+            'throughput': round(len(sent) / elapsed, 1) if elapsed else 0.0,
+            'skipped_punches': len(results) - len(sent),
+            'lock_timeouts': lock_timeouts,
+            'lock_timeout_rate': round(lock_timeouts / len(sent), 4) if sent else 0.0,
+            'kinds': {},
+        }
+        for kind in KINDS:
+            rows = [result for result in sent if result[0] == kind]
+            if not rows:
+                continue
+            latencies = sorted(latency for _, _, latency, _ in rows)
+            statuses = [status for _, status, _, _ in rows]
+            errors = sum(1 for status in statuses if status is None or status >= 500)
+            summary['kinds'][kind] = {
+                'count': len(rows),
+                'ok': sum(1 for status in statuses if status is not None and status < 400),
+                'client_errors': sum(
+                    1 for status in statuses if status is not None and 400 <= status < 500 and status != 429),
+                'throttled': statuses.count(429),
+                'errors': errors,
+                'error_rate': round(errors / len(rows), 4),
+                'p50_ms': round(percentile(latencies, .5), 1),
+                'p95_ms': round(percentile(latencies, .95), 1),
+                'p99_ms': round(percentile(latencies, .99), 1),
+                'max_ms': round(latencies[-1], 1),
+                'mean_ms': round(statistics.fmean(latencies), 1),
+            }
+        return summary
+
+    def print_summary(self, summary):
+        login = summary['login']
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{summary['target']} ({summary['api']} API): {summary['requests']} requests "
+            f"in {summary['seconds']} s, {summary['throughput']} req/s"))
+        self.stdout.write(
+            f"  login    {login['count']} accounts in {login['seconds']} s "
+            f"(p50 {login['p50_ms']} ms, p95 {login['p95_ms']} ms)")
+        self.stdout.write(
+            f"  {'':<8} {'count':>6} {'ok':>6} {'4xx':>5} {'429':>5} {'err':>5} "
+            f"{'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+        for kind, stats in summary['kinds'].items():
+            self.stdout.write(
+                f"  {kind:<8} {stats['count']:6d} {stats['ok']:6d} {stats['client_errors']:5d} "
+                f"{stats['throttled']:5d} {stats['errors']:5d} {stats['p50_ms']:8.1f} "
+                f"{stats['p95_ms']:8.1f} {stats['p99_ms']:8.1f} {stats['max_ms']:8.1f}")
+        self.stdout.write(
+            f"  lock timeouts {summary['lock_timeouts']} ({summary['lock_timeout_rate']:.2%})"
+            + (f", {summary['skipped_punches']} punches skipped (every employee already punched)"
+               if summary['skipped_punches'] else ''))
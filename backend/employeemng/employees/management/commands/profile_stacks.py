@@ -0,0 +1,54 @@
+import statistics
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from employees.profiling import folded_from_cprofile, folded_from_samples, stored_profiles
+
+
+class Command(BaseCommand):
+    help = ('Aggregate stored request profiles into per-endpoint folded stacks '
+            '(microseconds) for flamegraph.pl, speedscope or inferno.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Profile directory (default PROFILE_DIR).')
+        parser.add_argument('--endpoint', action='append', help='Only these view names.')
+        parser.add_argument('--output', help='Write <endpoint>.folded files here.')
+
+    def handle(self, *args, **options):
+        stacks = defaultdict(Counter)
+        metas = defaultdict(list)
+        for meta, path in stored_profiles(options['dir']):
+            endpoint = meta['endpoint']
+            if options['endpoint'] and endpoint not in options['endpoint']:
+                continue
+            if meta['mode'] == 'sampling':
+                stacks[endpoint].update(folded_from_samples(path, meta['interval_us']))
+            else:
+                stacks[endpoint].update(folded_from_cprofile(path))
+            metas[endpoint].append(meta)
+
+        if not metas:
+            self.stdout.write('No profiles found.')
+            return
+
+        self.stdout.write(
+            f"  {'endpoint':<32} {'profiles':>8} {'median ms':>10} {'queries':>8} {'query ms':>9}")
+        for endpoint, rows in sorted(metas.items()):
+            self.stdout.write(
+                f'  {endpoint:<32} {len(rows):8d} '
+                f"{statistics.median(row['duration_ms'] for row in rows):10.1f} "
+                f"{statistics.median(row['queries'] for row in rows):8.1f} "
+                f"{statistics.median(row['query_ms'] for row in rows):9.1f}")
+
+        if options['output']:
+            output = Path(options['output'])
+            output.mkdir(parents=True, exist_ok=True)
+            for endpoint, folded in stacks.items():
+                path = output / f'{endpoint}.folded'
+                with open(path, 'w') as handle:
+                    for stack, weight in sorted(folded.items()):
+                        if round(weight):
+                            handle.write(f'{stack} {round(weight)}\n')
+                self.stdout.write(f'Wrote {path}')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from employees.models import Employee
+from employees.profiling import issue_token
+
+
+class Command(BaseCommand):
+    help = 'Issue a signed token that makes requests carrying it get profiled.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('employee_id', help='Admin the token is issued to.')
+
+    def handle(self, *args, **options):
+        try:
+            user = Employee.objects.get(employee_id=options['employee_id'], role='admin', is_active=True)
+        except Employee.DoesNotExist:
+            raise CommandError(f"{options['employee_id']} is not an active admin")
+        token = issue_token(user)
+        self.stdout.write(token)
+        self.stderr.write(
+            f'Send it as an "X-Profile: <token>" header or a "_profile=<token>" query parameter. '
+            f'The profile name comes back in the X-Profile-Id response header.')
@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from employees.models import PunchSyncKey
+
+
+class Command(BaseCommand):
+    help = 'Delete kiosk idempotency keys older than the retention period.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days', type=int,
+            default=settings.KIOSK_KEY_RETENTION_DAYS,
+            help='Keep keys from this many days. Kiosks must not retry older punches.',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['retention_days'])
+        deleted, _ = PunchSyncKey.objects.filter(created_at__lt=cutoff).delete()
+        self.stdout.write(f'Deleted {deleted} idempotency key(s) created before {cutoff:%Y-%m-%d %H:%M}.')
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from employees.hierarchy import HierarchyError, rebuild
+
+
+class Command(BaseCommand):
+    help = ('Recompute the reporting lines (who is under whom) from each employee\'s manager, '
+            'e.g. after managers were changed with raw SQL or queryset.update().')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            rows = rebuild(options['database'])
+        except HierarchyError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {rows} reporting lines in {time.perf_counter() - started:.1f}s.'))
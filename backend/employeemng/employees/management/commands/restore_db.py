@@ -0,0 +1,41 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from employees.snapshots import SnapshotError, pending_migrations, restore, snapshot_path
+
+
+class Command(BaseCommand):
+    help = 'Replace the contents of a SQLite database with a snapshot taken by snapshot_db.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help='Snapshot name or file path.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive',
+                            help='Do not ask for confirmation.')
+
+    def handle(self, *args, **options):
+        database = options['database']
+        path = snapshot_path(options['name'])
+        if options['interactive']:
+            confirm = input(
+                f'This replaces everything in database "{database}" with {path}.\n'
+                "Type 'yes' to continue, or 'no' to cancel: ")
+            if confirm != 'yes':
+                raise CommandError('Restore cancelled.')
+
+        started = time.perf_counter()
+        try:
+            restore(path, using=database)
+        except SnapshotError as exc:
+            raise CommandError(str(exc))
+        # Cached reports and dashboards describe the old data
+        cache.clear()
+        seconds = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Restored database "{database}" from {path} in {seconds:.1f}s.'))
+        if pending_migrations(database):
+            self.stdout.write(self.style.WARNING(
+                'The snapshot is older than the code; run "manage.py migrate" to bring it up to date.'))
+        connections[database].close()
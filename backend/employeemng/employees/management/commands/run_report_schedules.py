@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from employees.scheduler import run_due
+
+
+class Command(BaseCommand):
+    help = ('Precompute the scheduled reports that are due, catching up days missed '
+            'since the last run. Run it from cron, or keep it running with --loop.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep running and check for due schedules every REPORT_SCHEDULE_POLL_SECONDS.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            written = run_due(log=self.stdout.write if options['verbosity'] > 1 else None)
+            if written or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Wrote {written} scheduled report(s) in {time.perf_counter() - started:.1f}s.'))
+            if not options['loop']:
+                return
+            time.sleep(settings.REPORT_SCHEDULE_POLL_SECONDS)
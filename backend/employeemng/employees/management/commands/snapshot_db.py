@@ -0,0 +1,37 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from employees.snapshots import SnapshotError, list_snapshots, snapshot
+
+
+class Command(BaseCommand):
+    help = ('Take a binary snapshot of a SQLite database with the online backup API. '
+            'Restore it with restore_db.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', nargs='?',
+                            help='Snapshot name or file path (default: a timestamp).')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--list', action='store_true', help='List existing snapshots instead.')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for path in list_snapshots():
+                stat = path.stat()
+                taken = datetime.fromtimestamp(stat.st_mtime)
+                self.stdout.write(f'{path.stem:<32} {stat.st_size / 2 ** 20:>9.1f} MiB  {taken:%Y-%m-%d %H:%M}')
+            return
+
+        name = options['name'] or timezone.now().strftime('%Y%m%d-%H%M%S')
+        started = time.perf_counter()
+        try:
+            path = snapshot(name, using=options['database'])
+        except SnapshotError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {path} ({path.stat().st_size / 2 ** 20:.1f} MiB) '
+            f'in {time.perf_counter() - started:.1f}s.'))
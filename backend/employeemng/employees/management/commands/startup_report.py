@@ -0,0 +1,54 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+PHASES = ['interpreter', 'django_setup', 'wsgi_application', 'migrate',
+          'first_request', 'second_request', 'total']
+
+
+class Command(BaseCommand):
+    help = 'Measure cold-start time: imports, migrate and first-request latency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=3, help='Fresh processes to start.')
+        parser.add_argument('--path', default='/api/', help='URL requested after boot.')
+        parser.add_argument('--skip-migrate', action='store_true')
+        parser.add_argument('--json', action='store_true', help='Print raw results as JSON.')
+
+    def handle(self, *args, **options):
+        command = [sys.executable, '-m', 'employees.startup', options['path']]
+        if options['skip_migrate']:
+            command.append('--skip-migrate')
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get(
+            'DJANGO_SETTINGS_MODULE', 'employeemng.settings'))
+
+        runs = []
+        for _ in range(options['runs']):
+            started = time.perf_counter()
+            result = subprocess.run(
+                command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+            wall = (time.perf_counter() - started) * 1000
+            if result.returncode != 0:
+                raise CommandError(f'Startup probe failed:\n{result.stderr}')
+            timings = json.loads(result.stdout.strip().splitlines()[-1])
+            timings['interpreter'] = round(wall - timings['total'], 2)
+            timings['total'] = round(wall, 2)
+            runs.append(timings)
+
+        if options['json']:
+            self.stdout.write(json.dumps(runs, indent=2))
+            return
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Startup report ({options['runs']} cold runs, median / max in ms)"))
+        for phase in PHASES:
+            values = [run[phase] for run in runs if phase in run]
+            if values:
+                self.stdout.write(
+                    f'  {phase:<18} {statistics.median(values):9.1f} {max(values):9.1f}')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from employees.throttling import rejection_counts
+
+
+class Command(BaseCommand):
+    help = 'Show how many requests each throttle bucket and the report slots have rejected.'
+
+    def handle(self, *args, **options):
+        for scope, count in rejection_counts().items():
+            self.stdout.write(f'  {scope:<14} {count:9d}')
@@ -0,0 +1,274 @@
+"""In-process Prometheus metrics.
+
+Counters and histograms live in plain dicts in each process, so recording
+a request costs a couple of microseconds.  When ``METRICS_DIR`` is set
+(required with several gunicorn workers) every process also writes a
+snapshot of its metrics to ``<METRICS_DIR>/<pid>.json`` from a background
+thread every ``METRICS_FLUSH_INTERVAL`` seconds, and ``/metrics`` sums the
+snapshots of all processes.  Snapshots of exited workers are kept so counters never go
+backwards; empty the directory when the server is (re)started.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+from django.conf import settings
+
+from .tenants import database_label
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+REPORT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+ROW_BUCKETS = (0, 10, 100, 1000, 10000, 100000)
+
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_registry = []
+_flusher = None
+_flushed = None
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values = {}
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        with _lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self, values):
+        for labels, value in sorted(values.items()):
+            yield self.name, zip(self.labels, labels), value
+
+    @staticmethod
+    def merge(into, value):
+        return (into or 0) + value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.values = {}
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        # Series: a count per bucket, one for +Inf, then the sum
+        with _lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [0] * (len(self.buckets) + 2)
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def samples(self, values):
+        bounds = [format_value(bound) for bound in self.buckets] + ['+Inf']
+        for labels, series in sorted(values.items()):
+            pairs = list(zip(self.labels, labels))
+            cumulative = 0
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                yield f'{self.name}_bucket', pairs + [('le', bound)], cumulative
+            yield f'{self.name}_sum', pairs, series[-1]
+            yield f'{self.name}_count', pairs, cumulative
+
+    @staticmethod
+    def merge(into, value):
+        return [a + b for a, b in zip(into, value)] if into else list(value)
+
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Request latency by route.', ('route', 'method'))
+RESPONSES = Counter(
+    'http_responses_total', 'Responses by route and status code.', ('route', 'status'))
+QUERY_SECONDS = Histogram(
+    'db_query_duration_seconds', 'Database query time.', ('database',), QUERY_BUCKETS)
+REPORT_SECONDS = Histogram(
+    'report_generation_duration_seconds', 'Report generation time.', ('report_type',), REPORT_BUCKETS)
+REPORT_ROWS = Histogram(
+    'report_rows', 'Rows in generated reports.', ('report_type',), ROW_BUCKETS)
+CACHE_LOOKUPS = Counter(
+    'cache_lookups_total', 'Cache lookups by cache and result (hit or miss).', ('cache', 'result'))
+PUNCHES = Counter(
+    'punches_total', 'Punch requests by action and outcome.', ('action', 'outcome'))
+
+# URL names -> route label; anything else is reported as "other"
+ROUTES = {
+    'login': 'login',
+    'analytics': 'analytics',
+    'dashboard': 'dashboard',
+    'punchrecord-punch': 'punch',
+    'async-punch-record-punch': 'punch',
+}
+ROUTE_PREFIXES = [
+    ('employee-', 'employees'),
+    ('punchrecord-', 'punch-records'),
+    ('async-punch-record-', 'punch-records'),
+    ('report-', 'reports'),
+    ('payslip-', 'payslips'),
+]
+_route_cache = {}
+
+
+def route_label(request):
+    match = getattr(request, 'resolver_match', None)
+    name = match.url_name if match else None
+    label = _route_cache.get(name)
+    if label is None:
+        label = ROUTES.get(name)
+        if label is None:
+            label = next((route for prefix, route in ROUTE_PREFIXES
+                          if name and name.startswith(prefix)), 'other')
+        _route_cache[name] = label
+    return label
+
+
+def observe_request(request, response, seconds):
+    route = route_label(request)
+    method = request.method if request.method in METHODS else 'other'
+    REQUEST_SECONDS.observe(seconds, route, method)
+    RESPONSES.inc(route, str(response.status_code))
+    if _flusher is None and settings.METRICS_DIR:
+        start_flusher()
+
+
+def observe_query(execute, sql, params, many, context):
+    """Database execute wrapper, installed on every connection (see signals)"""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        QUERY_SECONDS.observe(
+            time.perf_counter() - started, database_label(context['connection'].alias))
+
+
+def cache_lookup(cache, hits, misses=0):
+    if hits:
+        CACHE_LOOKUPS.inc(cache, 'hit', amount=hits)
+    if misses:
+        CACHE_LOOKUPS.inc(cache, 'miss', amount=misses)
+
+
+def snapshot():
+    with _lock:
+        return {metric.name: dict(metric.values) for metric in _registry}
+
+
+def flush():
+    """Write this process's snapshot to METRICS_DIR if it changed"""
+    global _flushed
+    data = json.dumps({name: [[list(labels), value] for labels, value in values.items()]
+                       for name, values in snapshot().items()})
+    with _flush_lock:
+        if data == _flushed:
+            return
+        directory = Path(settings.METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f'{os.getpid()}.json'
+        temporary = path.with_suffix('.tmp')
+        temporary.write_text(data)
+        os.replace(temporary, path)
+        _flushed = data
+
+
+def start_flusher():
+    global _flusher
+    with _lock:
+        if _flusher is not None:
+            return
+        _flusher = threading.Thread(target=_flush_forever, name='metrics-flusher', daemon=True)
+    _flusher.start()
+
+
+def _flush_forever():
+    while True:
+        time.sleep(settings.METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            pass  # retried on the next interval
+
+
+def collect():
+    """{metric name: {labels: value}} summed over every process"""
+    if not settings.METRICS_DIR:
+        return snapshot()
+    flush()
+    kinds = {metric.name: metric for metric in _registry}
+    merged = {name: {} for name in kinds}
+    for path in Path(settings.METRICS_DIR).glob('*.json'):
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        for name, series in data.items():
+            if name not in kinds:
+                continue
+            values = merged[name]
+            for labels, value in series:
+                labels = tuple(labels)
+                values[labels] = kinds[name].merge(values.get(labels), value)
+    return merged
+
+
+def render():
+    values = collect()
+    lines = []
+    for metric in _registry:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in metric.samples(values.get(metric.name, {})):
+            label_text = ','.join(f'{key}="{escape(label)}"' for key, label in labels)
+            lines.append(f'{name}{{{label_text}}} {format_value(value)}' if label_text
+                         else f'{name} {format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def format_value(value):
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value)) if value else '0'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _reset_after_fork():
+    # A preloaded parent's numbers are already in its own snapshot
+    global _lock, _flush_lock, _flusher, _flushed
+    _lock = threading.Lock()
+    _flush_lock = threading.Lock()
+    _flusher = _flushed = None
+    for metric in _registry:
+        metric.values = {}
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        if settings.configured and settings.METRICS_DIR:
+            flush()
+    except Exception:  # pragma: no cover - interpreter shutdown
+        pass
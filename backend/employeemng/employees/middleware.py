@@ -0,0 +1,211 @@
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+from .audit import request_context
+from .metrics import observe_request
+from .profiling import RequestProfile, token_user_id
+from .tenants import tenant_context
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+re_accepts_br = _lazy_re_compile(r'\bbr\b')
+
+COMPRESSIBLE_TYPES = (
+    'application/json',
+    'application/msgpack',
+    'application/javascript',
+    'text/',
+)
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compress API responses with brotli when the client and server support
+    it, gzip otherwise.  Responses under ``COMPRESSION_MIN_SIZE`` bytes and
+    content types that are already compressed are passed through, and
+    streaming responses are compressed chunk by chunk.
+    """
+
+    def process_response(self, request, response):
+        content_type = response.get('Content-Type', '')
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+        if response.has_header('Content-Encoding'):
+            return response
+
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if brotli is None or not re_accepts_br.search(accept_encoding):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        quality = settings.COMPRESSION_BROTLI_QUALITY
+        if response.streaming:
+            response.streaming_content = self._brotli_stream(response, quality)
+            del response.headers['Content-Length']
+        else:
+            compressed = brotli.compress(response.content, quality=quality)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
+
+    @staticmethod
+    def _brotli_stream(response, quality):
+        original = response.streaming_content
+        compressor = brotli.Compressor(quality=quality)
+
+        if response.is_async:
+            async def brotli_wrapper():
+                async for chunk in original:
+                    yield compressor.process(chunk) + compressor.flush()
+                yield compressor.finish()
+            return brotli_wrapper()
+
+        def brotli_wrapper():
+            for chunk in original:
+                yield compressor.process(chunk) + compressor.flush()
+            yield compressor.finish()
+        return brotli_wrapper()
+
+
+class ProfilingMiddleware:
+    """
+    Profile requests carrying a signed ``X-Profile`` header or ``_profile``
+    query parameter issued to an admin, plus a ``PROFILE_SAMPLE_RATE``
+    fraction of all requests.  Other requests pass straight through.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        trigger = self.trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+        profile = RequestProfile()
+        response = profile.run(self.get_response, request)
+        response['X-Profile-Id'] = profile.save(request, response, trigger)
+        return response
+
+    async def __acall__(self, request):
+        if self.requested(request):
+            trigger = await sync_to_async(self.trigger)(request)
+        else:
+            trigger = self.sampled()
+        if trigger is None:
+            return await self.get_response(request)
+        # Profiles the event loop thread, including other requests it serves meanwhile
+        profile = RequestProfile()
+        response = await profile.arun(self.get_response, request)
+        response['X-Profile-Id'] = await sync_to_async(profile.save)(request, response, trigger)
+        return response
+
+    @staticmethod
+    def requested(request):
+        return 'HTTP_X_PROFILE' in request.META or '_profile' in request.GET
+
+    @staticmethod
+    def sampled():
+        rate = settings.PROFILE_SAMPLE_RATE
+        return 'sample' if rate and random.random() < rate else None
+
+    def trigger(self, request):
+        if self.requested(request):
+            token = request.META.get('HTTP_X_PROFILE') or request.GET.get('_profile', '')
+            if token_user_id(token) is not None:
+                return 'token'
+        return self.sampled()
+
+
+class MetricsMiddleware:
+    """Record every request's latency and status in ``employees.metrics``"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        observe_request(request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        observe_request(request, response, time.perf_counter() - started)
+        return response
+
+
+class AuditContextMiddleware:
+    """Make the request's user the actor of changes audited while serving it"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with request_context(request):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with request_context(request):
+            return await self.get_response(request)
+
+
+class TenantMiddleware:
+    """Serve each request outside any tenant until token authentication picks one"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with tenant_context(None):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with tenant_context(None):
+            return await self.get_response(request)
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-19 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='punchrecord',
+            index=models.Index(fields=['date'], name='punch_date_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.3 on 2026-10-19 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0002_punchrecord_date_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='punchrecord',
+            name='punch_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='punchrecord',
+            index=models.Index(fields=['date', 'punch_in'], name='punch_date_in_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['generated_at'], name='report_generated_at_idx'),
+        ),
+    ]
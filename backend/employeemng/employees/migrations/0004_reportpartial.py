@@ -0,0 +1,26 @@
+# Generated by Django 5.2.3 on 2026-10-19 10:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0003_admin_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportPartial',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('month', 'Month')], max_length=5)),
+                ('start_date', models.DateField()),
+                ('totals', models.JSONField(default=dict)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('period', 'start_date')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 10:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('employees', '0005_employee_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['campaign'], name='employee_campaign_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.3 on 2026-10-19 10:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0007_auditlog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PunchSyncKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('device', models.CharField(blank=True, max_length=64)),
+                ('status', models.CharField(max_length=20)),
+                ('detail', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('punch_record', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='employees.punchrecord')),
+            ],
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.3 on 2026-10-19 10:53
+
+import django.db.models.deletion
+import employees.tenants
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0008_punchsynckey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Company',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.SlugField(unique=True)),
+                ('name', models.CharField(max_length=200)),
+                ('shard', models.CharField(blank=True, max_length=255)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'companies',
+            },
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='company',
+            field=models.ForeignKey(blank=True, db_constraint=False, db_index=False, default=employees.tenants.current_company_id, editable=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='employees.company'),
+        ),
+        migrations.AddField(
+            model_name='punchrecord',
+            name='company',
+            field=models.ForeignKey(blank=True, db_constraint=False, db_index=False, default=employees.tenants.current_company_id, editable=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='employees.company'),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='company',
+            field=models.ForeignKey(blank=True, db_constraint=False, db_index=False, default=employees.tenants.current_company_id, editable=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='employees.company'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_reporting_lines(apps, schema_editor):
+    Employee = apps.get_model('employees', 'Employee')
+    ReportingLine = apps.get_model('employees', 'ReportingLine')
+    db = schema_editor.connection.alias
+    # Managers used to see every employee.  Where there is a single manager
+    # that stays true by making everyone report to them; with several there
+    # is no way to tell the teams apart, so they are left to be assigned.
+    managers = list(
+        Employee.objects.using(db).filter(role='manager', is_active=True).values_list('pk', flat=True)[:2])
+    if len(managers) == 1:
+        Employee.objects.using(db).filter(role='employee', manager=None).update(manager=managers[0])
+
+    # The closure table as employees.hierarchy.rebuild() built it when this
+    # migration was written, over the historical models.  Every manager
+    # set above has no manager of their own, so there can't be a loop.
+    connection = schema_editor.connection
+    table = connection.ops.quote_name(ReportingLine._meta.db_table)
+    employees = connection.ops.quote_name(Employee._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (ancestor_id, descendant_id, depth) '
+            f'WITH RECURSIVE up (descendant_id, ancestor_id, depth) AS ('
+            f'SELECT id, manager_id, 1 FROM {employees} WHERE manager_id IS NOT NULL '
+            f'UNION ALL '
+            f'SELECT up.descendant_id, e.manager_id, up.depth + 1 '
+            f'FROM up JOIN {employees} e ON e.id = up.ancestor_id '
+            f'WHERE e.manager_id IS NOT NULL) '
+            f'SELECT ancestor_id, descendant_id, depth FROM up'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0009_company'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='manager',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='direct_reports', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.CreateModel(
+            name='ReportingLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('ancestor', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('descendant', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='reporting_lines', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='reportingline_up_idx')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(build_reporting_lines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:18
+
+from datetime import timezone
+
+import employees.worktime
+from django.db import migrations, models
+from django.db.models.functions import ExtractHour, ExtractMinute
+
+
+def fill_start_minutes(apps, schema_editor):
+    # Existing dates were taken in UTC, so the start minutes are too; run
+    # `manage.py backfill_work_days` to move both to the employees' zones.
+    PunchRecord = apps.get_model('employees', 'PunchRecord')
+    PunchRecord.objects.using(schema_editor.connection.alias).update(
+        start_minute=ExtractHour('punch_in', tzinfo=timezone.utc) * 60
+        + ExtractMinute('punch_in', tzinfo=timezone.utc))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0010_reporting_lines'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='timezone',
+            field=models.CharField(blank=True, max_length=64, validators=[employees.worktime.validate_timezone]),
+        ),
+        migrations.AddField(
+            model_name='punchrecord',
+            name='start_minute',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_start_minutes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:44
+
+import datetime
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0011_work_days'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200)),
+                ('report_type', models.CharField(choices=[('attendance', 'Attendance Report'), ('salary', 'Salary Report'), ('employee', 'Employee Report')], max_length=20)),
+                ('period', models.CharField(choices=[('daily', 'Daily (yesterday)'), ('weekly', 'Weekly (last Monday to Sunday)'), ('month_to_date', 'Month to date'), ('previous_month', 'Previous month')], max_length=20)),
+                ('run_at', models.TimeField(default=datetime.time(2, 0))),
+                ('is_active', models.BooleanField(default=True)),
+                ('last_run_on', models.DateField(blank=True, editable=False, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('generated_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='report_schedules', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ScheduledRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('checked_at', models.DateTimeField(auto_now=True)),
+                ('report', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='employees.report')),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='runs', to='employees.reportschedule')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['start_date', 'end_date'], name='scheduledrun_range_idx')],
+                'unique_together': {('schedule', 'start_date', 'end_date')},
+            },
+        ),
+    ]
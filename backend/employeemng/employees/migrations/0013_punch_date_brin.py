@@ -0,0 +1,33 @@
+from django.db import migrations
+
+# Punches arrive in date order, so on PostgreSQL a BRIN index (a few pages
+# for millions of rows) covers date range scans of reports and the archive.
+CREATE = [
+    'CREATE INDEX IF NOT EXISTS punch_date_brin ON employees_punchrecord '
+    'USING brin (date) WITH (pages_per_range = 32)',
+]
+
+DROP = [
+    'DROP INDEX IF EXISTS punch_date_brin',
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        # BRIN is PostgreSQL only; SQLite keeps using punch_date_in_idx
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0012_report_schedules'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE), run(DROP)),
+    ]
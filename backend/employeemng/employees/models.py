@@ -1,8 +1,67 @@
+import datetime
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 
-class Employee(AbstractUser):
+from .tenants import current_company_id, shard_error
+from .worktime import validate_timezone, work_day, zone_of
+
+
+class Company(models.Model):
+    """A client company (tenant).
+
+    Companies are stored in the ``default`` database; everything else a
+    company owns lives in its own database, see ``employees.tenants``.
+    """
+    slug = models.SlugField(max_length=50, unique=True)
+    name = models.CharField(max_length=200)
+    # A DATABASES alias or a SQLite file path; blank for
+    # <TENANT_DATABASE_DIR>/<slug>.sqlite3
+    shard = models.CharField(max_length=255, blank=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'companies'
+
+    def __str__(self):
+        return f"{self.name} ({self.slug})"
+
+    def clean(self):
+        error = shard_error(self)
+        if error:
+            raise ValidationError({'shard': error})
+
+
+class AuditedModel(models.Model):
+    """Keeps the values a row was loaded with, so saves can be diffed for the audit log"""
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Just a reference to the row tuple; diffs are only built on save
+        instance._audit_loaded = (field_names, values)
+        return instance
+
+
+class TenantModel(AuditedModel):
+    """Data owned by one company, stamped with the tenant active when it was created"""
+    # Companies live in another database, hence no constraint and no reverse accessor
+    company = models.ForeignKey(
+        Company, on_delete=models.DO_NOTHING, null=True, blank=True, editable=False,
+        default=current_company_id, db_constraint=False, db_index=False, related_name='+')
+
+    class Meta:
+        abstract = True
+
+
+class Employee(TenantModel, AbstractUser):
     ROLE_CHOICES = [
         ('admin', 'Admin'),
         ('manager', 'Manager'),
@@ -15,9 +74,19 @@ class Employee(AbstractUser):
     address = models.TextField(blank=True)
     campaign = models.CharField(max_length=100, blank=True)
     hourly_rate = models.DecimalField(max_digits=10, decimal_places=2, default=6.00)
+    # IANA name such as "America/New_York"; blank for settings.WORK_TIME_ZONE
+    timezone = models.CharField(max_length=64, blank=True, validators=[validate_timezone])
+    # Direct manager; everyone further up is found through ReportingLine
+    manager = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='direct_reports')
     
     USERNAME_FIELD = 'employee_id'
     REQUIRED_FIELDS = ['username', 'email']
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['campaign'], name='employee_campaign_idx'),
+        ]
     
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.employee_id})"
@@ -26,20 +95,63 @@ class Employee(AbstractUser):
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
 
-class PunchRecord(models.Model):
+    def clean(self):
+        super().clean()
+        from .hierarchy import HierarchyError, check_manager
+        try:
+            check_manager(self.pk, self.manager_id)
+        except HierarchyError as exc:
+            raise ValidationError({'manager': str(exc)})
+
+class ReportingLine(models.Model):
+    """One manager-above/employee-below pair of the org chart (a closure table).
+
+    ``depth`` is 1 for a direct report, 2 for a report's report and so on.
+    Rows are kept in step with ``Employee.manager`` by ``employees.hierarchy``.
+    """
+    ancestor = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='+', db_index=False)
+    descendant = models.ForeignKey(
+        Employee, on_delete=models.CASCADE, related_name='reporting_lines', db_index=False)
+    depth = models.PositiveSmallIntegerField()
+
+    class Meta:
+        # (ancestor, descendant) answers "everyone under X"; the other index
+        # answers "everyone above X" when a subtree moves
+        unique_together = ['ancestor', 'descendant']
+        indexes = [
+            models.Index(fields=['descendant', 'depth'], name='reportingline_up_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} > {self.descendant_id} ({self.depth})"
+
+
+class PunchRecord(TenantModel):
     employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='punch_records')
     punch_in = models.DateTimeField()
     punch_out = models.DateTimeField(null=True, blank=True)
+    # Local work day and minute of the punch in, in the employee's timezone
     date = models.DateField()
+    start_minute = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
     total_hours = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     
     class Meta:
         unique_together = ['employee', 'date']
         ordering = ['-date', '-punch_in']
+        indexes = [
+            models.Index(fields=['date', 'punch_in'], name='punch_date_in_idx'),
+        ]
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored day so moving a punch can invalidate both days.
+        instance._loaded_date = instance.__dict__.get('date')
+        return instance
+
     def save(self, *args, **kwargs):
         if self.punch_in:
-            self.date = self.punch_in.date()
+            self.date, self.start_minute = work_day(self.punch_in, zone_of(self.employee))
         
         if self.punch_in and self.punch_out:
             time_diff = self.punch_out - self.punch_in
@@ -56,7 +168,23 @@ class PunchRecord(models.Model):
             return self.total_hours * self.employee.hourly_rate
         return 0
 
-class Report(models.Model):
+class PunchSyncKey(models.Model):
+    """Idempotency key of one kiosk punch and the outcome it was given.
+
+    A retried key gets the stored outcome back instead of being applied again.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    device = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=20)
+    detail = models.CharField(max_length=200, blank=True)
+    punch_record = models.ForeignKey(
+        PunchRecord, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.status})"
+
+class Report(TenantModel):
     REPORT_TYPES = [
         ('attendance', 'Attendance Report'),
         ('salary', 'Salary Report'),
@@ -73,6 +201,119 @@ class Report(models.Model):
     
     class Meta:
         ordering = ['-generated_at']
+        indexes = [
+            models.Index(fields=['generated_at'], name='report_generated_at_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.generated_at.date()}"
+
+
+class ReportSchedule(models.Model):
+    """A standard report precomputed off-peak by ``employees.scheduler``.
+
+    Each day after ``run_at`` (in ``WORK_TIME_ZONE``) the report for the
+    schedule's period is generated as ``generated_by`` would see it, unless
+    the stored one is still up to date.
+    """
+    PERIODS = [
+        ('daily', 'Daily (yesterday)'),
+        ('weekly', 'Weekly (last Monday to Sunday)'),
+        ('month_to_date', 'Month to date'),
+        ('previous_month', 'Previous month'),
+    ]
+
+    title = models.CharField(max_length=200)
+    report_type = models.CharField(max_length=20, choices=Report.REPORT_TYPES)
+    period = models.CharField(max_length=20, choices=PERIODS)
+    generated_by = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='report_schedules')
+    run_at = models.TimeField(default=datetime.time(2, 0))
+    is_active = models.BooleanField(default=True)
+    # Last day the schedule ran for; missed days after it are caught up
+    last_run_on = models.DateField(null=True, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.title} ({self.get_period_display()})"
+
+    def clean(self):
+        super().clean()
+        if self.generated_by_id and self.generated_by.role not in ('admin', 'manager'):
+            raise ValidationError({'generated_by': 'Scheduled reports are made for admins and managers.'})
+
+
+class ScheduledRun(models.Model):
+    """The report a schedule stored for one date range, and the data it was built from"""
+    schedule = models.ForeignKey(ReportSchedule, on_delete=models.CASCADE, related_name='runs')
+    start_date = models.DateField()
+    end_date = models.DateField()
+    # Digest of the punches and employees behind the report (scheduler.fingerprint)
+    fingerprint = models.CharField(max_length=64)
+    report = models.ForeignKey(Report, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    checked_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['schedule', 'start_date', 'end_date']
+        indexes = [
+            models.Index(fields=['start_date', 'end_date'], name='scheduledrun_range_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.schedule} {self.start_date} to {self.end_date}"
+
+
+class ReportPartial(models.Model):
+    """Per-employee totals for one closed day or month.
+
+    Reports are assembled from these immutable partials plus a fresh query
+    for the days that are still open, so regenerating an overlapping range
+    only pays for new data.  Partials are deleted whenever a punch inside
+    their period changes.
+    """
+    PERIODS = [
+        ('day', 'Day'),
+        ('month', 'Month'),
+    ]
+
+    period = models.CharField(max_length=5, choices=PERIODS)
+    start_date = models.DateField()
+    # {employee_pk: [days_worked, "total_hours"]}
+    totals = models.JSONField(default=dict)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['period', 'start_date']
+
+    def __str__(self):
+        return f"{self.get_period_display()} partial - {self.start_date}"
+
+
+class AuditLog(models.Model):
+    """One create, update or delete of an audited row, with field-level diffs"""
+    ACTIONS = [
+        ('create', 'Create'),
+        ('update', 'Update'),
+        ('delete', 'Delete'),
+    ]
+
+    # Model name (employee, punchrecord, report) and primary key of the row
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    # {field: [old, new]}; values of masked fields are not recorded
+    changes = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    actor = models.ForeignKey(
+        Employee, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='audit_entries', db_index=False)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['model', 'object_id', '-created_at'], name='audit_object_idx'),
+            models.Index(fields=['actor', '-created_at'], name='audit_actor_idx'),
+            models.Index(fields=['-created_at'], name='audit_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_action_display()} {self.model} {self.object_id}"
@@ -0,0 +1,368 @@
+"""Month-end payslips for every employee.
+
+A batch lives in ``PAYSLIP_DIR/<YYYY-MM>/`` (``PAYSLIP_DIR/<company>/...``
+for a tenant).  Planning reads the month's totals for everyone at once
+(``reports.punch_totals``) plus one query for the employees, and freezes
+the figures into chunk files of ``PAYSLIP_CHUNK_SIZE`` employees, so the
+payslips of one batch never mix data from before and after a correction.
+A process pool then renders each chunk into one HTML or CSV payslip per
+employee, without touching the database.  A chunk is marked done only once
+all its files are written, so running an interrupted batch again resumes
+it, redoing only the unfinished chunks.  Last come ``summary.csv`` and,
+when asked for, a zip of the whole batch.  ``status.json`` tracks progress
+for ``/api/payslips/``.
+"""
+import csv
+import io
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+# No models at import time: spawned pool workers import this module before django.setup()
+from . import archive
+from .tenants import current as current_tenant
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+FORMATS = ('html', 'csv')
+IN_PROGRESS = ('queued', 'planning', 'running')
+# A batch still queued after this long never got going; see log.txt
+QUEUED_TIMEOUT = 60
+MONTH_RE = re.compile(r'^\d{4}-(0[1-9]|1[0-2])$')
+CENT = Decimal('0.01')
+ONE_DAY = timedelta(days=1)
+
+# Payslip fields, in summary.csv column order
+FIELDS = [
+    ('employee_id', 'Employee ID'),
+    ('name', 'Name'),
+    ('email', 'Email'),
+    ('campaign', 'Campaign'),
+    ('days_worked', 'Days worked'),
+    ('total_hours', 'Total hours'),
+    ('hourly_rate', 'Hourly rate'),
+    ('gross_pay', 'Gross pay'),
+]
+
+
+class PayslipError(Exception):
+    pass
+
+
+class BatchRunning(PayslipError):
+    """Another process is generating the batch"""
+
+
+def month_range(month):
+    year, number = map(int, month.split('-'))
+    first = date(year, number, 1)
+    return first, archive.next_month(first) - ONE_DAY
+
+
+def batch_root():
+    tenant = current_tenant()
+    root = Path(settings.PAYSLIP_DIR)
+    return root / tenant.slug if tenant is not None else root
+
+
+def batch_dir(month):
+    return batch_root() / month
+
+
+def zip_name(month, fmt):
+    return f'payslips-{month}-{fmt}.zip'
+
+
+def _write_json(path, data):
+    temporary = path.with_suffix('.tmp')
+    temporary.write_text(json.dumps(data))
+    os.replace(temporary, path)
+
+
+def _read_json(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+@contextmanager
+def batch_lock(directory):
+    """Hold the batch's lock file, or raise BatchRunning"""
+    if fcntl is None:
+        yield
+        return
+    with open(directory / '.lock', 'a') as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise BatchRunning(f'Payslips for {directory.name} are already being generated.')
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def is_running(directory):
+    try:
+        with batch_lock(directory):
+            return False
+    except BatchRunning:
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def batch_status(month):
+    """Progress of a batch, or None if it was never started"""
+    directory = batch_dir(month)
+    status = _read_json(directory / 'status.json')
+    if status is None:
+        return None
+    state = status['state']
+    if state in IN_PROGRESS and not is_running(directory):
+        waited = timezone.now() - datetime.fromisoformat(status['updated_at'])
+        if state != 'queued' or waited.total_seconds() > QUEUED_TIMEOUT:
+            status['state'] = 'interrupted'
+    return status
+
+
+def all_statuses():
+    root = batch_root()
+    if not root.is_dir():
+        return []
+    months = sorted((path.name for path in root.iterdir() if MONTH_RE.match(path.name)), reverse=True)
+    return [status for status in map(batch_status, months) if status is not None]
+
+
+def _set_status(directory, status, **changes):
+    status.update(changes, updated_at=timezone.now().isoformat())
+    _write_json(directory / 'status.json', status)
+
+
+def plan(directory, month):
+    """Freeze every employee's figures for the month into chunk files and summary.csv"""
+    from .models import Company, Employee
+    from .reports import STREAM_CHUNK_SIZE, punch_totals
+
+    first, last = month_range(month)
+    totals = punch_totals(first, last)
+    rows = []
+    employees = Employee.objects.order_by('employee_id').values_list(
+        'pk', 'employee_id', 'first_name', 'last_name', 'email', 'campaign',
+        'hourly_rate', 'is_active').iterator(chunk_size=STREAM_CHUNK_SIZE)
+    for pk, employee_id, first_name, last_name, email, campaign, rate, is_active in employees:
+        days, hours = totals.get(pk, (0, Decimal(0)))
+        # Everyone active, plus whoever left during the month but still has hours to be paid
+        if not is_active and not days:
+            continue
+        rows.append({
+            'employee_id': employee_id,
+            'name': f'{first_name} {last_name}'.strip(),
+            'email': email,
+            'campaign': campaign,
+            'days_worked': days,
+            'total_hours': str(hours.quantize(CENT)),
+            'hourly_rate': str(rate),
+            'gross_pay': str((hours * rate).quantize(CENT, ROUND_HALF_UP)),
+        })
+
+    chunks = directory / 'chunks'
+    chunks.mkdir(exist_ok=True)
+    size = settings.PAYSLIP_CHUNK_SIZE
+    for number, offset in enumerate(range(0, len(rows), size)):
+        _write_json(chunks / f'{number:05d}.json', rows[offset:offset + size])
+    with open(directory / 'summary.csv', 'w', newline='') as handle:
+        writer = csv.writer(handle)
+        writer.writerow([label for _, label in FIELDS])
+        writer.writerows([row[field] for field, _ in FIELDS] for row in rows)
+
+    tenant = current_tenant()
+    company = Company.objects.get(pk=tenant.company_id).name if tenant is not None else ''
+    manifest = {
+        'month': month,
+        'start_date': first.isoformat(),
+        'end_date': last.isoformat(),
+        'company': company,
+        'total': len(rows),
+        'chunks': -(-len(rows) // size),
+        'chunk_size': size,
+        'planned_at': timezone.now().isoformat(),
+    }
+    # Written last: a batch without a manifest is planned again from scratch
+    _write_json(directory / 'manifest.json', manifest)
+    return manifest
+
+
+def render_payslip(row, fmt, context):
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['Field', 'Value'])
+        if context['company']:
+            writer.writerow(['Company', context['company']])
+        writer.writerow(['Period', f"{context['start_date']} to {context['end_date']}"])
+        for field, label in FIELDS:
+            writer.writerow([label, row[field]])
+        return buffer.getvalue()
+    return get_template('employees/payslip.html').render({**context, 'payslip': row})
+
+
+def done_marker(directory, number, fmt):
+    return directory / 'chunks' / f'{number:05d}.{fmt}.done'
+
+
+def render_chunk(directory, number, fmt, context):
+    """Write the payslips of one chunk; runs in the pool.  Returns (chunk, payslips)"""
+    directory = Path(directory)
+    rows = json.loads((directory / 'chunks' / f'{number:05d}.json').read_text())
+    output = directory / fmt
+    for row in rows:
+        path = output / f"{get_valid_filename(row['employee_id'])}.{fmt}"
+        path.write_text(render_payslip(row, fmt, context))
+    done_marker(directory, number, fmt).touch()
+    return number, len(rows)
+
+
+def _init_worker(settings_module):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def write_zip(directory, month, fmt):
+    target = directory / zip_name(month, fmt)
+    temporary = target.with_suffix('.tmp')
+    with zipfile.ZipFile(temporary, 'w', zipfile.ZIP_DEFLATED) as bundle:
+        bundle.write(directory / 'summary.csv', 'summary.csv')
+        for path in sorted((directory / fmt).iterdir()):
+            bundle.write(path, f'{fmt}/{path.name}')
+    os.replace(temporary, target)
+
+
+def generate(month, fmt='html', make_zip=False, workers=None, force=False, progress=None):
+    """Generate (or resume) the payslip batch for ``month``; returns its status.
+
+    Every format of a batch is rendered from the same frozen figures; pass
+    ``force`` to read them from the database again.  ``progress(done,
+    total)`` is called as chunks complete.
+    """
+    if not MONTH_RE.match(month):
+        raise PayslipError('month must be in YYYY-MM format.')
+    if fmt not in FORMATS:
+        raise PayslipError(f"format must be one of: {', '.join(FORMATS)}.")
+    directory = batch_dir(month)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    with batch_lock(directory):
+        manifest = None if force else _read_json(directory / 'manifest.json')
+        if manifest is None:
+            for path in directory.iterdir():
+                if path.name not in ('.lock', 'log.txt'):
+                    shutil.rmtree(path) if path.is_dir() else path.unlink()
+
+        status = {'month': month, 'format': fmt, 'zip': None, 'total': None, 'done': 0,
+                  'started_at': timezone.now().isoformat(), 'finished_at': None, 'error': None}
+        _set_status(directory, status, state='planning')
+        try:
+            if manifest is None:
+                manifest = plan(directory, month)
+            (directory / fmt).mkdir(exist_ok=True)
+            status = _run(directory, manifest, fmt, workers, status, progress)
+            archive_path = directory / zip_name(month, fmt)
+            if make_zip and not archive_path.exists():
+                write_zip(directory, month, fmt)
+        except Exception as exc:
+            # A killed or interrupted run leaves 'running' behind, which
+            # batch_status() reports as interrupted once the lock is gone
+            _set_status(directory, status, state='failed', error=str(exc) or type(exc).__name__)
+            raise
+        _set_status(directory, status, state='complete',
+                    zip=archive_path.name if archive_path.exists() else None,
+                    finished_at=timezone.now().isoformat())
+        return status
+
+
+def _run(directory, manifest, fmt, workers, status, progress):
+    total, size = manifest['total'], manifest['chunk_size']
+    pending = [number for number in range(manifest['chunks'])
+               if not done_marker(directory, number, fmt).exists()]
+    done = total - sum(min(size, total - number * size) for number in pending)
+    _set_status(directory, status, state='running', total=total, done=done)
+    if progress:
+        progress(done, total)
+
+    context = {key: manifest[key] for key in ('month', 'start_date', 'end_date', 'company')}
+    workers = workers or settings.PAYSLIP_WORKERS
+    if workers < 2 or len(pending) < 2:
+        completed = (render_chunk(directory, number, fmt, context) for number in pending)
+        return _track(directory, status, completed, done, total, progress)
+
+    # Spawned, not forked: workers must not inherit the batch lock (or they
+    # would keep holding it if this process is killed) nor its connections
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(pending)),
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'employeemng.settings'),),
+    ) as pool:
+        futures = [pool.submit(render_chunk, str(directory), number, fmt, context)
+                   for number in pending]
+        try:
+            return _track(directory, status, (future.result() for future in as_completed(futures)),
+                          done, total, progress)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def _track(directory, status, completed, done, total, progress):
+    for _, count in completed:
+        done += count
+        _set_status(directory, status, done=done)
+        if progress:
+            progress(done, total)
+    return status
+
+
+def start(month, fmt='html', make_zip=True, force=False):
+    """Run ``manage.py generate_payslips`` for the active tenant in the background"""
+    directory = batch_dir(month)
+    directory.mkdir(parents=True, exist_ok=True)
+    command = [sys.executable, str(Path(settings.BASE_DIR) / 'manage.py')]
+    tenant = current_tenant()
+    if tenant is not None:
+        command += ['for_each_tenant', '--tenant', tenant.slug]
+    command += ['generate_payslips', month, '--format', fmt]
+    if make_zip:
+        command.append('--zip')
+    if force:
+        command.append('--force')
+    if batch_status(month) is None:
+        _write_json(directory / 'status.json', {
+            'month': month, 'format': fmt, 'state': 'queued', 'zip': None, 'total': None,
+            'done': 0, 'started_at': None, 'finished_at': None, 'error': None,
+            'updated_at': timezone.now().isoformat()})
+    with open(directory / 'log.txt', 'ab') as log:
+        # Its own session, so the batch outlives the worker that started it
+        subprocess.Popen(command, cwd=settings.BASE_DIR, stdin=subprocess.DEVNULL,
+                         stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
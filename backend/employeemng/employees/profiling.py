@@ -0,0 +1,242 @@
+"""On-demand request profiling.
+
+``ProfilingMiddleware`` profiles a request when it carries a valid
+``X-Profile`` header or ``_profile`` query parameter (a signed token issued
+to an admin by ``manage.py profile_token``), or when it is picked by
+``PROFILE_SAMPLE_RATE``.  Each profile is written to ``PROFILE_DIR`` as a
+``.prof`` (cProfile) or ``.folded`` (sampling) file plus a ``.json`` with
+the endpoint, status, duration and query count.  ``manage.py
+profile_stacks`` folds them into per-endpoint flame graph stacks.
+"""
+import cProfile
+import itertools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+
+TOKEN_SALT = 'employees.profiling'
+# Call paths worth less than this are dropped when folding cProfile output
+MIN_FOLDED_SECONDS = 10e-6
+MAX_DEPTH = 200
+
+_sequence = itertools.count()
+
+
+def issue_token(user):
+    return signing.dumps({'user': user.pk}, salt=TOKEN_SALT, compress=True)
+
+
+def token_user_id(value):
+    """The admin a profiling token was issued to, or None if it is invalid or expired"""
+    from .models import Employee
+
+    try:
+        payload = signing.loads(value, salt=TOKEN_SALT, max_age=settings.PROFILE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    user_id = payload.get('user')
+    if not Employee.objects.filter(pk=user_id, role='admin', is_active=True).exists():
+        return None
+    return user_id
+
+
+def _root(function, *args):
+    # Entered after the profiler starts, so it is the single root of every profile
+    return function(*args)
+
+
+async def _aroot(function, *args):
+    return await function(*args)
+
+
+ROOT_CODES = {_root.__code__, _aroot.__code__}
+
+
+class QueryCounter:
+    """Database execute wrapper counting queries and their time"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class SamplingProfiler:
+    """Samples one thread's stack every ``interval`` seconds into folded stacks"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self.thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._run, daemon=True)
+
+    def enable(self):
+        self._sampler.start()
+
+    def disable(self):
+        self._stop.set()
+        self._sampler.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(frame_label(code.co_name, code.co_filename, code.co_firstlineno))
+                if code in ROOT_CODES:
+                    break
+                frame = frame.f_back
+            else:
+                continue  # not inside the profiled request right now
+            self.stacks[';'.join(reversed(names))] += 1
+
+
+class RequestProfile:
+    """Profiles one call and records its query count and duration"""
+
+    def __init__(self, mode=None):
+        self.mode = mode or settings.PROFILE_MODE
+        if self.mode == 'sampling':
+            self.profiler = SamplingProfiler(settings.PROFILE_SAMPLING_INTERVAL)
+        else:
+            self.profiler = cProfile.Profile()
+        self.queries = QueryCounter()
+        self._stack = ExitStack()
+
+    def __enter__(self):
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self.queries))
+        self.started = time.perf_counter()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.disable()
+        self.duration = time.perf_counter() - self.started
+        self._stack.close()
+
+    def run(self, function, *args):
+        with self:
+            return _root(function, *args)
+
+    async def arun(self, function, *args):
+        with self:
+            return await _aroot(function, *args)
+
+    def save(self, request, response, trigger):
+        directory = Path(settings.PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        match = getattr(request, 'resolver_match', None)
+        endpoint = (match.view_name if match else '') or 'unresolved'
+        name = '{}-{}-{}-{}'.format(
+            time.strftime('%Y%m%dT%H%M%S'), endpoint.replace(':', '.'), os.getpid(), next(_sequence))
+
+        if self.mode == 'sampling':
+            with open(directory / f'{name}.folded', 'w') as handle:
+                for stack, count in self.profiler.stacks.items():
+                    handle.write(f'{stack} {count}\n')
+        else:
+            self.profiler.dump_stats(directory / f'{name}.prof')
+        meta = {
+            'endpoint': endpoint,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(self.duration * 1000, 3),
+            'queries': self.queries.count,
+            'query_ms': round(self.queries.seconds * 1000, 3),
+            'mode': self.mode,
+            'interval_us': round(settings.PROFILE_SAMPLING_INTERVAL * 1e6),
+            'trigger': trigger,
+        }
+        # Metadata last: profile_stacks ignores profiles without it
+        with open(directory / f'{name}.json', 'w') as handle:
+            json.dump(meta, handle)
+        return name
+
+
+def frame_label(name, filename, line):
+    if filename.startswith('~') or not filename:
+        return name.replace(';', ',')
+    for prefix in sorted(sys.path, key=len, reverse=True):
+        if prefix and filename.startswith(prefix):
+            filename = filename[len(prefix):].lstrip(os.sep)
+            break
+    return f'{name} ({filename}:{line})'.replace(';', ',')
+
+
+def folded_from_cprofile(path):
+    """Approximate folded stacks (in microseconds) from a cProfile dump.
+
+    cProfile only records caller/callee pairs, so each function's own time
+    is split across its callers in proportion to the time spent under each.
+    """
+    stats = pstats.Stats(str(path)).stats
+    children = defaultdict(list)
+    for function, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            children[caller].append((function, edge[3]))
+
+    folded = Counter()
+
+    def walk(function, cumulative, path, seen):
+        _, _, own, total, _ = stats[function]
+        fraction = cumulative / total if total else 0.0
+        path = path + [frame_label(function[2], function[0], function[1])]
+        if own * fraction:
+            folded[';'.join(path)] += own * fraction * 1e6
+        if len(path) >= MAX_DEPTH:
+            return
+        for child, edge_cumulative in children.get(function, ()):
+            share = edge_cumulative * fraction
+            if child not in seen and share >= MIN_FOLDED_SECONDS:
+                walk(child, share, path, seen | {child})
+
+    # Start below the profiler's own frames (and, for coroutines, the event loop)
+    for function, (_, _, _, total, _) in stats.items():
+        if function[0] == __file__ and function[2] in ('_root', '_aroot'):
+            walk(function, total, [], {function})
+    return folded
+
+
+def folded_from_samples(path, interval_us):
+    folded = Counter()
+    with open(path) as handle:
+        for line in handle:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack:
+                folded[stack] += int(count) * interval_us
+    return folded
+
+
+def stored_profiles(directory=None):
+    """(metadata, profile path) for every complete profile in the directory"""
+    directory = Path(directory or settings.PROFILE_DIR)
+    if not directory.is_dir():
+        return
+    for meta_path in sorted(directory.glob('*.json')):
+        with open(meta_path) as handle:
+            meta = json.load(handle)
+        suffix = '.folded' if meta['mode'] == 'sampling' else '.prof'
+        profile_path = meta_path.with_suffix(suffix)
+        if profile_path.exists():
+            yield meta, profile_path
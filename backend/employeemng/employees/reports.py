@@ -0,0 +1,241 @@
+"""Report generation shared by the API and the admin.
+
+Totals are aggregated in the database for punches still in the hot
+``PunchRecord`` table and read from the punch archive for ranges that have
+been moved to cold storage, so callers never need to know where a punch
+lives.
+
+A report range is split into whole closed months, closed days at the
+edges and the still-open days (today onwards).  Closed periods are read
+from stored ``ReportPartial`` rows, computed once on first use, so
+regenerating an overlapping range (month-to-date every morning, say) only
+queries the days that are new or still open.
+"""
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from . import archive
+from .metrics import REPORT_ROWS, REPORT_SECONDS, cache_lookup
+from .models import Employee, PunchRecord, ReportPartial
+
+ONE_DAY = timedelta(days=1)
+# Rows fetched at a time when iterating over every employee or total (a
+# server-side cursor on PostgreSQL), and the most ids sent as one IN list:
+# PostgreSQL takes at most 65535 parameters per query
+STREAM_CHUNK_SIZE = 2000
+IN_LIST_LIMIT = 10000
+
+
+def as_date(value):
+    """Accept a date or an ISO formatted string"""
+    if isinstance(value, date):
+        return value
+    parsed = parse_date(str(value))
+    if parsed is None:
+        raise ValueError(f'Invalid date: {value!r}')
+    return parsed
+
+
+def raw_totals(start_date, end_date):
+    """Compute {employee_pk: [days_worked, total_hours]} from the punches themselves"""
+    totals = {}
+    rows = (
+        PunchRecord.objects
+        .filter(date__gte=start_date, date__lte=end_date)
+        .order_by()
+        .values('employee')
+        .annotate(days=Count('id'), hours=Sum('total_hours'))
+    )
+    for row in rows.iterator(chunk_size=STREAM_CHUNK_SIZE):
+        totals[row['employee']] = [row['days'], row['hours'] or Decimal(0)]
+    return archive.employee_totals(start_date, end_date, totals)
+
+
+def raw_totals_by_day(days):
+    """Compute {day: {employee_pk: [days_worked, total_hours]}} for the given days"""
+    totals = {day: {} for day in days}
+    rows = (
+        PunchRecord.objects
+        .filter(date__in=days)
+        .order_by()
+        .values('date', 'employee')
+        .annotate(days=Count('id'), hours=Sum('total_hours'))
+    )
+    for row in rows.iterator(chunk_size=STREAM_CHUNK_SIZE):
+        totals[row['date']][row['employee']] = [row['days'], row['hours'] or Decimal(0)]
+    archived = archive.employee_totals_by_day(min(days), max(days))
+    for day, day_totals in archived.items():
+        if day in totals:
+            _merge(totals[day], day_totals)
+    return totals
+
+
+def plan_range(start_date, end_date, today):
+    """Split a range into closed months, closed days and an open tail"""
+    months, days = [], []
+    closed_end = min(end_date, today - ONE_DAY)
+    cursor = start_date
+    while cursor <= closed_end:
+        first = cursor.replace(day=1)
+        last = archive.next_month(first) - ONE_DAY
+        if cursor == first and last <= closed_end:
+            months.append(first)
+            cursor = last + ONE_DAY
+        else:
+            stop = min(last, closed_end)
+            days.extend(cursor + timedelta(days=i) for i in range((stop - cursor).days + 1))
+            cursor = stop + ONE_DAY
+    open_range = (max(start_date, today), end_date) if end_date >= today else None
+    return months, days, open_range
+
+
+def _encode(totals):
+    return {str(pk): [days, str(hours)] for pk, (days, hours) in totals.items()}
+
+
+def _merge(into, totals):
+    for pk, (days, hours) in totals.items():
+        pk = int(pk)
+        entry = into.get(pk)
+        if entry is None:
+            entry = into[pk] = [0, Decimal(0)]
+        entry[0] += days
+        entry[1] += Decimal(hours)
+
+
+def punch_totals(start_date, end_date):
+    """Return {employee_pk: [days_worked, total_hours]} for the date range"""
+    start_date, end_date = as_date(start_date), as_date(end_date)
+    months, days, open_range = plan_range(start_date, end_date, timezone.localdate())
+
+    stored = {}
+    if months or days:
+        partials = ReportPartial.objects.filter(
+            Q(period='month', start_date__in=months) | Q(period='day', start_date__in=days)
+        ).values_list('period', 'start_date', 'totals')
+        stored = {(period, start): data for period, start, data in partials}
+
+    cache_lookup('report_partials', len(stored), len(months) + len(days) - len(stored))
+    new_partials = []
+    for first in months:
+        if ('month', first) not in stored:
+            data = _encode(raw_totals(first, archive.next_month(first) - ONE_DAY))
+            stored[('month', first)] = data
+            new_partials.append(ReportPartial(period='month', start_date=first, totals=data))
+    missing_days = [day for day in days if ('day', day) not in stored]
+    if missing_days:
+        for day, day_totals in raw_totals_by_day(missing_days).items():
+            data = _encode(day_totals)
+            stored[('day', day)] = data
+            new_partials.append(ReportPartial(period='day', start_date=day, totals=data))
+    if new_partials:
+        ReportPartial.objects.bulk_create(new_partials, batch_size=500, ignore_conflicts=True)
+
+    totals = {}
+    for data in stored.values():
+        _merge(totals, data)
+    if open_range:
+        _merge(totals, raw_totals(*open_range))
+    return totals
+
+
+def invalidate_partials(dates):
+    """Drop stored partials covering any of the given punch dates"""
+    dates = {day for day in dates if day is not None}
+    if not dates:
+        return
+    months = {day.replace(day=1) for day in dates}
+    ReportPartial.objects.filter(
+        Q(period='day', start_date__in=dates) | Q(period='month', start_date__in=months)
+    ).delete()
+
+
+def generate_report_data(report_type, start_date, end_date, employees=None):
+    """Generate report data based on type and date range.
+
+    ``employees`` limits the report to a queryset, e.g. a manager's team.
+    """
+    started = time.perf_counter()
+    if employees is None:
+        employees = Employee.objects.all()
+    if report_type == 'attendance':
+        data = generate_attendance_report(start_date, end_date, employees)
+    elif report_type == 'salary':
+        data = generate_salary_report(start_date, end_date, employees)
+    elif report_type == 'employee':
+        data = generate_employee_report(start_date, end_date, employees)
+    else:
+        return {}
+    REPORT_SECONDS.observe(time.perf_counter() - started, report_type)
+    REPORT_ROWS.observe(len(data), report_type)
+    return data
+
+
+def _employees_with_totals(totals, employees):
+    if len(totals) <= IN_LIST_LIMIT:
+        employees = employees.filter(pk__in=list(totals))
+    for employee in employees.order_by('employee_id').iterator(chunk_size=STREAM_CHUNK_SIZE):
+        if employee.pk in totals:
+            yield employee
+
+
+def generate_attendance_report(start_date, end_date, employees):
+    """Generate attendance report data"""
+    totals = punch_totals(start_date, end_date)
+
+    attendance_data = {}
+    for employee in _employees_with_totals(totals, employees):
+        days, hours = totals[employee.pk]
+        total_hours = float(hours)
+        attendance_data[employee.employee_id] = {
+            'name': employee.full_name,
+            'days_worked': days,
+            'total_hours': total_hours,
+            'avg_hours_per_day': round(total_hours / days, 2) if days else 0,
+        }
+
+    return attendance_data
+
+
+def generate_salary_report(start_date, end_date, employees):
+    """Generate salary report data"""
+    totals = punch_totals(start_date, end_date)
+
+    salary_data = {}
+    for employee in _employees_with_totals(totals, employees):
+        total_hours = float(totals[employee.pk][1])
+        salary_data[employee.employee_id] = {
+            'name': employee.full_name,
+            'hourly_rate': float(employee.hourly_rate),
+            'total_hours': total_hours,
+            'total_salary': total_hours * float(employee.hourly_rate),
+        }
+
+    return salary_data
+
+
+def generate_employee_report(start_date, end_date, employees):
+    """Generate employee report data"""
+    totals = punch_totals(start_date, end_date)
+
+    employee_data = {}
+    for employee in employees.filter(role='employee').iterator(chunk_size=STREAM_CHUNK_SIZE):
+        days, hours = totals.get(employee.pk, (0, Decimal(0)))
+        total_hours = float(hours)
+        employee_data[employee.employee_id] = {
+            'name': employee.full_name,
+            'email': employee.email,
+            'role': employee.role,
+            'campaign': employee.campaign,
+            'hourly_rate': float(employee.hourly_rate),
+            'total_hours': total_hours,
+            'total_salary': total_hours * float(employee.hourly_rate),
+            'days_worked': days,
+        }
+
+    return employee_data
@@ -0,0 +1,210 @@
+"""Off-peak precomputation of standard reports.
+
+``ReportSchedule`` rows name a report type, a period (yesterday, last week,
+month to date or last month) and whose view of the data to use.  The
+``run_report_schedules`` command, from cron or with ``--loop`` as a
+long-running process, runs every schedule once a day after its ``run_at``
+time and stores the result as an ordinary ``Report``.
+
+Before generating, a schedule takes a fingerprint of the data behind the
+range: the stored report partials of its closed days and months (see
+``employees.reports``) and a few aggregates over its employees.  If the
+report already stored for that range was built from the same fingerprint,
+nothing is regenerated, so the nightly re-check of last week or last month
+is nearly free.  A month-to-date report is updated in place as the month
+goes on.  Days missed while the scheduler was down are caught up on the
+next run, up to ``REPORT_SCHEDULE_CATCH_UP_DAYS`` back.
+
+``precomputed`` lets the report API hand out a stored report's data when a
+user asks for exactly that report and it is still up to date.
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+
+from . import audit, hierarchy, worktime
+from .metrics import cache_lookup
+from .models import AuditLog, Employee, PunchRecord, Report, ReportPartial, ReportSchedule, ScheduledRun
+from .reports import as_date, generate_report_data, plan_range
+
+ONE_DAY = timedelta(days=1)
+
+
+def period_range(period, run_on):
+    """(start, end) of the report a schedule with ``period`` makes on ``run_on``"""
+    yesterday = run_on - ONE_DAY
+    if period == 'daily':
+        return yesterday, yesterday
+    if period == 'weekly':
+        end = run_on - timedelta(days=run_on.weekday() + 1)
+        return end - timedelta(days=6), end
+    if period == 'month_to_date':
+        return yesterday.replace(day=1), yesterday
+    if period == 'previous_month':
+        end = run_on.replace(day=1) - ONE_DAY
+        return end.replace(day=1), end
+    raise ValueError(f'Unknown period: {period!r}')
+
+
+def due_days(schedule, now=None):
+    """The days ``schedule`` still has to run for, oldest first"""
+    local = (now or timezone.now()).astimezone(worktime.zone_of())
+    latest = local.date() if local.time() >= schedule.run_at else local.date() - ONE_DAY
+    first = schedule.last_run_on + ONE_DAY if schedule.last_run_on else latest
+    first = max(first, latest - timedelta(days=settings.REPORT_SCHEDULE_CATCH_UP_DAYS - 1))
+    return [first + timedelta(days=i) for i in range((latest - first).days + 1)]
+
+
+def due_ranges(schedule, days):
+    """Distinct ranges for ``days``, without those a later range extends (month to date)"""
+    ranges = list(dict.fromkeys(period_range(schedule.period, day) for day in days))
+    return [
+        (start, end) for index, (start, end) in enumerate(ranges)
+        if not any(later_start == start and later_end > end for later_start, later_end in ranges[index + 1:])
+    ]
+
+
+def scope(user):
+    """The employees a report made for ``user`` covers"""
+    if user.role == 'manager':
+        return hierarchy.employees_under(user)
+    if user.role == 'admin':
+        return Employee.objects.all()
+    return Employee.objects.none()
+
+
+def fingerprint(start_date, end_date, employees):
+    """Digest of everything a report over the range and employees is built from.
+
+    Closed days and months are represented by their ``ReportPartial`` rows,
+    which are deleted whenever a punch in them changes, so no punch is
+    read.  Returns None while a partial is missing: the data is then
+    unknown and never matches a stored fingerprint.
+    """
+    months, days, open_range = plan_range(start_date, end_date, timezone.localdate())
+    partials = list(
+        ReportPartial.objects.filter(
+            Q(period='month', start_date__in=months) | Q(period='day', start_date__in=days))
+        .order_by('pk').values_list('pk', flat=True)
+    )
+    if len(partials) != len(months) + len(days):
+        return None
+    punches = None
+    if open_range:
+        punches = (
+            PunchRecord.objects.filter(date__gte=open_range[0], date__lte=open_range[1]).order_by()
+            .aggregate(count=Count('id'), ids=Sum('id'), hours=Sum('total_hours'), last_out=Max('punch_out'))
+        )
+    staff = employees.order_by().aggregate(
+        count=Count('id'), ids=Sum('id'), rates=Sum('hourly_rate'),
+        active=Count('id', filter=Q(is_active=True)))
+    # Name, email and campaign edits only show up in the audit log
+    audit.flush()
+    edited = (
+        AuditLog.objects.filter(model='employee').order_by('-created_at', '-id')
+        .values_list('id', flat=True).first()
+    )
+    payload = json.dumps([partials, punches, staff, edited], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def run_range(schedule, start_date, end_date):
+    """Store the schedule's report for one range; returns 'created', 'updated' or 'unchanged'"""
+    owner = schedule.generated_by
+    employees = scope(owner)
+    runs = ScheduledRun.objects.filter(
+        schedule=schedule, start_date=start_date, report__isnull=False,
+    ).select_related('report').defer('report__data')
+    run = runs.filter(end_date=end_date).first()
+    if run is not None and run.fingerprint == fingerprint(start_date, end_date, employees):
+        run.save(update_fields=['checked_at'])
+        return 'unchanged'
+    if run is None:
+        # A longer range from the same start (month to date) takes over the
+        # shorter one's report instead of adding another
+        run = runs.filter(end_date__lt=end_date).order_by('-end_date').first()
+
+    data = generate_report_data(schedule.report_type, start_date, end_date, employees=employees)
+    # Taken after generating, which stores any partials that were missing;
+    # a punch changing in between leaves a fingerprint that won't match
+    digest = fingerprint(start_date, end_date, employees) or ''
+    with transaction.atomic():
+        if run is not None:
+            report, outcome = run.report, 'updated'
+            report.title = f'{schedule.title} ({start_date} to {end_date})'
+            report.end_date = end_date
+            report.data = data
+            report.save(update_fields=['title', 'end_date', 'data'])
+            run.end_date, run.fingerprint = end_date, digest
+            run.save(update_fields=['end_date', 'fingerprint', 'checked_at'])
+        else:
+            outcome = 'created'
+            report = Report.objects.create(
+                title=f'{schedule.title} ({start_date} to {end_date})',
+                report_type=schedule.report_type,
+                generated_by=owner,
+                start_date=start_date,
+                end_date=end_date,
+                data=data,
+            )
+            ScheduledRun.objects.update_or_create(
+                schedule=schedule, start_date=start_date, end_date=end_date,
+                defaults={'fingerprint': digest, 'report': report})
+    return outcome
+
+
+def run_schedule(schedule, now=None):
+    """Run every range ``schedule`` is due for; returns [(start, end, outcome)]"""
+    days = due_days(schedule, now)
+    if not days:
+        return []
+    results = [
+        (start, end, run_range(schedule, start, end))
+        for start, end in due_ranges(schedule, days)
+    ]
+    schedule.last_run_on = days[-1]
+    schedule.save(update_fields=['last_run_on'])
+    return results
+
+
+def run_due(now=None, log=None):
+    """Run all active schedules that are due; returns how many reports were written"""
+    written = 0
+    for schedule in ReportSchedule.objects.filter(is_active=True).select_related('generated_by'):
+        for start, end, outcome in run_schedule(schedule, now):
+            if outcome != 'unchanged':
+                written += 1
+            if log:
+                log(f'{schedule}: {start} to {end} {outcome}')
+    return written
+
+
+def precomputed(report_type, start_date, end_date, user):
+    """Data of a stored scheduled report ``user`` may reuse as is, or None"""
+    try:
+        start_date, end_date = as_date(start_date), as_date(end_date)
+    except ValueError:
+        return None
+    runs = ScheduledRun.objects.filter(
+        start_date=start_date, end_date=end_date, schedule__report_type=report_type,
+        report__isnull=False)
+    # Same scope: the user's own schedules, or any admin's for an admin
+    if user.role == 'admin':
+        runs = runs.filter(schedule__generated_by__role='admin')
+    else:
+        runs = runs.filter(schedule__generated_by=user)
+    candidates = list(runs.values_list('fingerprint', 'report_id'))
+    if not candidates:
+        return None
+    digest = fingerprint(start_date, end_date, scope(user))
+    for stored, report_id in candidates:
+        if digest is not None and stored == digest:
+            cache_lookup('scheduled_reports', 1)
+            return Report.objects.filter(pk=report_id).values_list('data', flat=True).first()
+    cache_lookup('scheduled_reports', 0, 1)
+    return None
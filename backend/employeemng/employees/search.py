@@ -0,0 +1,127 @@
+"""Full-text employee search.
+
+On SQLite, employees are indexed in the ``employees_employee_fts`` FTS5
+table (see migration 0005), which triggers keep in step with
+``employees_employee`` for every write path, including ``bulk_create`` and
+``update()``.  SQLite's schema editor rebuilds the table for most column
+changes, which drops its triggers, so ``restore_index`` puts them back and
+reindexes after every ``migrate``.  Other databases fall back to
+``icontains`` lookups.
+"""
+import re
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'employees_employee_fts'
+FTS_COLUMNS = ['employee_id', 'first_name', 'last_name', 'email', 'campaign']
+# bm25 weights, in FTS_COLUMNS order: an employee_id hit outranks a campaign hit
+FTS_WEIGHTS = [10.0, 5.0, 5.0, 2.0, 1.0]
+
+TOKEN_RE = re.compile(r'\w+')
+
+_COLUMNS = ', '.join(FTS_COLUMNS)
+_NEW_VALUES = ', '.join(f'new.{column}' for column in FTS_COLUMNS)
+_OLD_VALUES = ', '.join(f'old.{column}' for column in FTS_COLUMNS)
+TRIGGERS = {
+    f'{FTS_TABLE}_ai': f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON employees_employee BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {_COLUMNS}) VALUES (new.id, {_NEW_VALUES});
+    END""",
+    f'{FTS_TABLE}_ad': f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON employees_employee BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_COLUMNS}) VALUES ('delete', old.id, {_OLD_VALUES});
+    END""",
+    f'{FTS_TABLE}_au': f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF {_COLUMNS} ON employees_employee BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_COLUMNS}) VALUES ('delete', old.id, {_OLD_VALUES});
+        INSERT INTO {FTS_TABLE}(rowid, {_COLUMNS}) VALUES (new.id, {_NEW_VALUES});
+    END""",
+}
+
+
+def fts_enabled(queryset):
+    return connections[queryset.db].vendor == 'sqlite'
+
+
+def restore_index(using):
+    """Recreate any missing sync trigger and rebuild the index; True if it had to.
+
+    Does nothing when the index is intact or absent (before migration 0005,
+    or on databases other than SQLite).
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name IN (%s, %s, %s, %s)",
+            [FTS_TABLE, *TRIGGERS],
+        )
+        present = {row[0] for row in cursor.fetchall()}
+    if FTS_TABLE not in present or present.issuperset(TRIGGERS):
+        return False
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        for name, create in TRIGGERS.items():
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute(create)
+        # Rows written while the triggers were gone are missing or stale
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def match_expression(query):
+    """Turn user input into an FTS5 query: every word must match as a prefix"""
+    return ' '.join(f'"{token}"*' for token in TOKEN_RE.findall(query.lower()))
+
+
+def filter_matching(queryset, query):
+    """Filter ``queryset`` to employees matching ``query``, unordered"""
+    match = match_expression(query)
+    if not match:
+        return queryset.none()
+    if not fts_enabled(queryset):
+        return queryset.filter(_fallback_filter(query))
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]))
+
+
+def ranked_matches(queryset, query, limit=20):
+    """The ``limit`` best matches for ``query`` within ``queryset``, best first.
+
+    bm25 ranking costs time in proportion to the number of hits, so queries
+    matching more than ``SEARCH_RANK_LIMIT`` employees (one or two typed
+    letters on a large table) return hits in index order instead.
+    """
+    match = match_expression(query)
+    if not match:
+        return []
+    if not fts_enabled(queryset):
+        return list(queryset.filter(_fallback_filter(query)).order_by('employee_id')[:limit])
+
+    rank_limit = settings.SEARCH_RANK_LIMIT
+    hits = f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'SELECT count(*) FROM ({hits} LIMIT %s)', [match, rank_limit + 1])
+        if cursor.fetchone()[0] > rank_limit:
+            return list(queryset.filter(
+                pk__in=RawSQL(f'{hits} LIMIT %s', [match, rank_limit]))[:limit])
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        cursor.execute(f'{hits} ORDER BY bm25({FTS_TABLE}, {weights})', [match])
+        ids = [row[0] for row in cursor.fetchall()]
+
+    if queryset.query.where:
+        allowed = set(queryset.filter(pk__in=RawSQL(hits, [match])).values_list('pk', flat=True))
+        ids = [pk for pk in ids if pk in allowed]
+    ids = ids[:limit]
+    found = queryset.in_bulk(ids)
+    return [found[pk] for pk in ids if pk in found]
+
+
+def _fallback_filter(query):
+    condition = Q()
+    for token in TOKEN_RE.findall(query):
+        token_condition = Q()
+        for column in FTS_COLUMNS:
+            token_condition |= Q(**{f'{column}__icontains': token})
+        condition &= token_condition
+    return condition
@@ -1,8 +1,17 @@
+from datetime import timedelta
+from decimal import Decimal
+
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.db.models import Sum
 from django.utils import timezone
-from .models import Employee, PunchRecord, Report
+from . import hierarchy, tenants, worktime
+from .analytics import BUCKETS, GROUPS, METRICS
+from .models import AuditLog, Company, Employee, PunchRecord, Report
+from .payslips import FORMATS, MONTH_RE
+from .reports import generate_report_data
 
 
 class EmployeeSerializer(serializers.ModelSerializer):
@@ -14,7 +23,7 @@ class EmployeeSerializer(serializers.ModelSerializer):
         model = Employee
         fields = [
             'id', 'employee_id', 'first_name', 'last_name', 'email',
-            'phone_number', 'address', 'campaign', 'role', 'hourly_rate',
+            'phone_number', 'address', 'campaign', 'timezone', 'role', 'hourly_rate', 'manager',
             'password', 'total_salary', 'total_hours', 'is_active', 'username'
         ]
         extra_kwargs = {
@@ -22,19 +31,50 @@ class EmployeeSerializer(serializers.ModelSerializer):
             'username': {'required': False},
         }
 
-    def create(self, validated_data):
-        password = validated_data.pop('password')
-
+    @staticmethod
+    def default_username(validated_data):
         # Ensure username is set (required by Django's User model)
         if 'username' not in validated_data or not validated_data['username']:
             # Use email as username if not provided
-            validated_data['username'] = validated_data.get(
-                'email', validated_data.get('employee_id', ''))
+            validated_data['username'] = (
+                validated_data.get('email') or validated_data.get('employee_id', ''))
+        return validated_data
+
+    @staticmethod
+    def default_manager(validated_data, user):
+        # Employees a manager adds join that manager's team
+        if user is not None and user.role == 'manager' and 'manager' not in validated_data:
+            validated_data['manager'] = user
+        return validated_data
+
+    def validate_manager(self, manager):
+        request = self.context.get('request')
+        user = request.user if request is not None else None
+        if user is None or manager is None or manager == getattr(self.instance, 'manager', None):
+            return manager
+        if user.role == 'employee':
+            raise serializers.ValidationError('Only managers and admins can assign managers.')
+        if user.role == 'manager' and manager != user and not hierarchy.is_under(manager.pk, user.pk):
+            raise serializers.ValidationError('Choose yourself or someone in your team.')
+        return manager
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if self.instance is not None and attrs.get('manager') is not None:
+            try:
+                hierarchy.check_manager(self.instance.pk, attrs['manager'].pk)
+            except hierarchy.HierarchyError as exc:
+                raise serializers.ValidationError({'manager': [str(exc)]})
+        return attrs
+
+    def create(self, validated_data):
+        password = validated_data.pop('password', None)
+        self.default_username(validated_data)
+        request = self.context.get('request')
+        self.default_manager(validated_data, request.user if request is not None else None)
 
-        employee = Employee.objects.create_user(**validated_data)
-        employee.set_password(password)
-        employee.save()
-        return employee
+        # create_user hashes the password and inserts the row in one go
+        return Employee.objects.create_user(password=password, **validated_data)
 
     def update(self, instance, validated_data):
         # Handle password separately
@@ -68,6 +108,30 @@ class EmployeeSerializer(serializers.ModelSerializer):
         return float(total_hours)
 
 
+class BulkEmployeeSerializer(EmployeeSerializer):
+    """Validates one row of a bulk employee request.
+
+    Uniqueness of ``employee_id`` and ``username`` is checked for the whole
+    batch with a single query instead of one query per row.
+    """
+    BATCH_UNIQUE_FIELDS = ('employee_id', 'username')
+
+    class Meta(EmployeeSerializer.Meta):
+        fields = [
+            field for field in EmployeeSerializer.Meta.fields
+            if field not in ('total_salary', 'total_hours')
+        ]
+
+    def get_fields(self):
+        fields = super().get_fields()
+        for name in self.BATCH_UNIQUE_FIELDS:
+            fields[name].validators = [
+                validator for validator in fields[name].validators
+                if not isinstance(validator, UniqueValidator)
+            ]
+        return fields
+
+
 class PunchRecordSerializer(serializers.ModelSerializer):
     employee_name = serializers.CharField(
         source='employee.full_name', read_only=True)
@@ -82,15 +146,119 @@ class PunchRecordSerializer(serializers.ModelSerializer):
         read_only_fields = ['date', 'total_hours']
 
 
+class PunchRecordFilterSerializer(serializers.Serializer):
+    """Query parameters accepted by the punch record list"""
+    employee = serializers.IntegerField(required=False, min_value=1)
+    employee_id = serializers.CharField(required=False)
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+    campaign = serializers.CharField(required=False)
+    status = serializers.ChoiceField(choices=['open', 'closed'], required=False)
+    min_hours = serializers.DecimalField(
+        max_digits=5, decimal_places=2, min_value=Decimal('0'), required=False)
+
+    def validate(self, attrs):
+        start, end = attrs.get('start_date'), attrs.get('end_date')
+        if start and end and start > end:
+            raise serializers.ValidationError("start_date must be on or before end_date")
+        return attrs
+
+
+class KioskPunchSerializer(serializers.Serializer):
+    """One punch buffered by a kiosk, stamped with the device's clock"""
+    key = serializers.CharField(max_length=64)
+    employee_id = serializers.CharField(max_length=20)
+    action = serializers.ChoiceField(choices=['punch_in', 'punch_out'])
+    timestamp = serializers.DateTimeField()
+
+    def validate_timestamp(self, value):
+        now = timezone.now()
+        if value > now + timedelta(seconds=settings.KIOSK_MAX_CLOCK_SKEW):
+            raise serializers.ValidationError("Timestamp is in the future.")
+        if value < now - timedelta(hours=settings.KIOSK_MAX_BACKLOG):
+            raise serializers.ValidationError(
+                f"Timestamp is more than {settings.KIOSK_MAX_BACKLOG} hours old.")
+        return value
+
+
+class AuditLogSerializer(serializers.ModelSerializer):
+    actor_employee_id = serializers.CharField(
+        source='actor.employee_id', read_only=True, default=None)
+
+    class Meta:
+        model = AuditLog
+        fields = ['id', 'model', 'object_id', 'action', 'changes',
+                  'actor', 'actor_employee_id', 'created_at']
+
+
+class AuditLogFilterSerializer(serializers.Serializer):
+    """Query parameters accepted by the audit log"""
+    model = serializers.ChoiceField(choices=['employee', 'punchrecord', 'report'], required=False)
+    object_id = serializers.IntegerField(required=False, min_value=1)
+    actor = serializers.IntegerField(required=False, min_value=1)
+    actor_employee_id = serializers.CharField(required=False)
+    action = serializers.ChoiceField(choices=AuditLog.ACTIONS, required=False)
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        if 'object_id' in attrs and 'model' not in attrs:
+            raise serializers.ValidationError("object_id needs model")
+        return attrs
+
+
+class PayslipBatchSerializer(serializers.Serializer):
+    """Request to generate (or resume) a month's payslips"""
+    month = serializers.RegexField(MONTH_RE, error_messages={'invalid': 'Use the YYYY-MM format.'})
+    format = serializers.ChoiceField(choices=FORMATS, default='html')
+    zip = serializers.BooleanField(default=True)
+    force = serializers.BooleanField(default=False)
+
+
+class EmployeeSearchResultSerializer(serializers.ModelSerializer):
+    """Typeahead rows: no per-employee totals, so no queries per result"""
+    full_name = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = Employee
+        fields = [
+            'id', 'employee_id', 'first_name', 'last_name', 'full_name',
+            'email', 'campaign', 'role', 'is_active'
+        ]
+
+
+class PresenceSerializer(serializers.ModelSerializer):
+    employee_id = serializers.CharField(
+        source='employee.employee_id', read_only=True)
+    employee_name = serializers.CharField(
+        source='employee.full_name', read_only=True)
+
+    class Meta:
+        model = PunchRecord
+        fields = ['id', 'employee', 'employee_id', 'employee_name', 'punch_in']
+
+
 class LoginSerializer(serializers.Serializer):
     employee_id = serializers.CharField()
     password = serializers.CharField()
+    # Slug of the user's company; omitted for the default database
+    company = serializers.SlugField(required=False)
 
     def validate(self, attrs):
         employee_id = attrs.get('employee_id')
         password = attrs.get('password')
 
         if employee_id and password:
+            attrs['tenant'] = None
+            if attrs.get('company'):
+                try:
+                    attrs['tenant'] = tenants.get_tenant(attrs['company'])
+                except Company.DoesNotExist:
+                    msg = 'Unable to log in with provided credentials.'
+                    raise serializers.ValidationError(msg, code='authorization')
+                # Authenticate against, and issue the token in, the company's database
+                tenants.activate(attrs['tenant'])
+
             user = authenticate(
                 request=self.context.get('request'),
                 username=employee_id,
@@ -133,112 +301,11 @@ class ReportSerializer(serializers.ModelSerializer):
 
         # Generate data if not provided
         if 'data' not in validated_data or not validated_data['data']:
-            validated_data['data'] = self.generate_report_data(
+            validated_data['data'] = generate_report_data(
                 report_type, start_date, end_date)
 
         return super().create(validated_data)
 
-    def generate_report_data(self, report_type, start_date, end_date):
-        """Generate report data based on type and date range"""
-        if report_type == 'attendance':
-            return self.generate_attendance_report(start_date, end_date)
-        elif report_type == 'salary':
-            return self.generate_salary_report(start_date, end_date)
-        elif report_type == 'employee':
-            return self.generate_employee_report(start_date, end_date)
-        else:
-            return {}
-
-    def generate_attendance_report(self, start_date, end_date):
-        """Generate attendance report data"""
-        # Get all punch records in the date range
-        punch_records = PunchRecord.objects.filter(
-            date__gte=start_date,
-            date__lte=end_date
-        )
-
-        # Group by employee
-        attendance_data = {}
-        for record in punch_records:
-            employee_id = record.employee.employee_id
-            if employee_id not in attendance_data:
-                attendance_data[employee_id] = {
-                    'name': record.employee.full_name,
-                    'days_worked': 0,
-                    'total_hours': 0,
-                    'avg_hours_per_day': 0
-                }
-
-            attendance_data[employee_id]['days_worked'] += 1
-            attendance_data[employee_id]['total_hours'] += float(
-                record.total_hours or 0)
-
-        # Calculate averages
-        for employee_id in attendance_data:
-            days = attendance_data[employee_id]['days_worked']
-            if days > 0:
-                attendance_data[employee_id]['avg_hours_per_day'] = round(
-                    attendance_data[employee_id]['total_hours'] / days, 2
-                )
-
-        return attendance_data
-
-    def generate_salary_report(self, start_date, end_date):
-        """Generate salary report data"""
-        # Get all punch records in the date range
-        punch_records = PunchRecord.objects.filter(
-            date__gte=start_date,
-            date__lte=end_date
-        )
-
-        # Group by employee
-        salary_data = {}
-        for record in punch_records:
-            employee_id = record.employee.employee_id
-            if employee_id not in salary_data:
-                salary_data[employee_id] = {
-                    'name': record.employee.full_name,
-                    'hourly_rate': float(record.employee.hourly_rate),
-                    'total_hours': 0,
-                    'total_salary': 0
-                }
-
-            hours = float(record.total_hours or 0)
-            salary_data[employee_id]['total_hours'] += hours
-            salary_data[employee_id]['total_salary'] += hours * \
-                float(record.employee.hourly_rate)
-
-        return salary_data
-
-    def generate_employee_report(self, start_date, end_date):
-        """Generate employee report data"""
-        employees = Employee.objects.filter(role='employee')
-        employee_data = {}
-
-        for employee in employees:
-            employee_records = PunchRecord.objects.filter(
-                employee=employee,
-                date__gte=start_date,
-                date__lte=end_date
-            )
-
-            total_hours = sum(float(record.total_hours or 0)
-                              for record in employee_records)
-            total_salary = total_hours * float(employee.hourly_rate)
-
-            employee_data[employee.employee_id] = {
-                'name': employee.full_name,
-                'email': employee.email,
-                'role': employee.role,
-                'campaign': employee.campaign,
-                'hourly_rate': float(employee.hourly_rate),
-                'total_hours': total_hours,
-                'total_salary': total_salary,
-                'days_worked': employee_records.count()
-            }
-
-        return employee_data
-
 
 class PunchInOutSerializer(serializers.Serializer):
     action = serializers.ChoiceField(choices=['punch_in', 'punch_out'])
@@ -251,7 +318,7 @@ class PunchInOutSerializer(serializers.Serializer):
             # Check if already punched in today
             today_record = PunchRecord.objects.filter(
                 employee=user,
-                date=timezone.now().date(),
+                date=worktime.today(user),
                 punch_out__isnull=True
             ).first()
 
@@ -259,10 +326,10 @@ class PunchInOutSerializer(serializers.Serializer):
                 raise serializers.ValidationError("Already punched in today")
 
         elif action == 'punch_out':
-            # Check if punched in today and not punched out
+            # Check if punched in today (or last night) and not punched out
             today_record = PunchRecord.objects.filter(
                 employee=user,
-                date=timezone.now().date(),
+                date__in=worktime.shift_days(user),
                 punch_out__isnull=True
             ).first()
 
@@ -271,3 +338,32 @@ class PunchInOutSerializer(serializers.Serializer):
                     "No punch in record found for today")
 
         return attrs
+
+
+class EmployeeSearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(trim_whitespace=True)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class AnalyticsQuerySerializer(serializers.Serializer):
+    group_by = serializers.ChoiceField(choices=list(GROUPS), default='employee')
+    bucket = serializers.ChoiceField(choices=list(BUCKETS), default='day')
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    metrics = serializers.CharField(required=False, default=','.join(METRICS))
+
+    def validate_metrics(self, value):
+        metrics = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in metrics if name not in METRICS]
+        if unknown or not metrics:
+            raise serializers.ValidationError(
+                f"Choose from: {', '.join(METRICS)}")
+        return metrics
+
+    def validate(self, attrs):
+        if attrs['start_date'] > attrs['end_date']:
+            raise serializers.ValidationError("start_date must be on or before end_date")
+        if (attrs['end_date'] - attrs['start_date']).days > settings.ANALYTICS_MAX_DAYS:
+            raise serializers.ValidationError(
+                f"Date range is limited to {settings.ANALYTICS_MAX_DAYS} days")
+        return attrs
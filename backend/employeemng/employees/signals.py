@@ -1,63 +1,166 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models.signals import post_migrate
+from django.db import DEFAULT_DB_ALIAS
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete
 from django.dispatch import receiver
+from django.utils import timezone
+
+from . import audit, hierarchy, search
+from .metrics import observe_query
+from .models import Employee, PunchRecord, Report
+from .reports import invalidate_partials
+
+
+DEMO_ACCOUNTS = [
+    {
+        "employee_id": "ADMIN001",
+        "username": "admin",
+        "first_name": "System",
+        "last_name": "Administrator",
+        "email": "admin@company.com",
+        "role": "admin",
+        "password": "admin123",
+        "is_staff": True,
+        "is_superuser": True,
+    },
+    {
+        "employee_id": "MGR001",
+        "username": "manager",
+        "first_name": "John",
+        "last_name": "Manager",
+        "email": "manager@company.com",
+        "role": "manager",
+        "password": "manager123",
+        "is_staff": False,
+        "is_superuser": False,
+    },
+    {
+        "employee_id": "EMP001",
+        "username": "employee",
+        "first_name": "Jane",
+        "last_name": "Employee",
+        "email": "employee@company.com",
+        "role": "employee",
+        "reports_to": "MGR001",
+        "password": "employee123",
+        "campaign": "Marketing Campaign 2024",
+        "is_staff": False,
+        "is_superuser": False,
+    },
+]
 
 
 @receiver(post_migrate)
-def create_default_users(sender, **kwargs):
-    """Ensure default demo accounts exist after migrations."""
+def create_default_users(sender, using='default', **kwargs):
+    """Ensure default demo accounts exist after migrations.
+
+    ``settings.DEMO_ACCOUNTS`` controls the cost on every boot:
+
+    * ``off`` - do nothing (production).
+    * ``ensure`` - create missing accounts; existing ones are left alone.
+    * ``enforce`` - also reset changed fields and passwords.  A password is
+      only re-hashed when the stored hash no longer matches.
+    """
+    # post_migrate fires once per installed app; only run for ours.  Company
+    # databases never get the demo accounts.
+    if sender.label != 'employees' or settings.DEMO_ACCOUNTS == 'off' or using != DEFAULT_DB_ALIAS:
+        return
+
     User = get_user_model()
+    manager = User.objects.db_manager(using)
+    existing = manager.in_bulk(
+        [account["employee_id"] for account in DEMO_ACCOUNTS],
+        field_name='employee_id',
+    )
 
-    defaults = [
-        {
-            "employee_id": "ADMIN001",
-            "username": "admin",
-            "first_name": "System",
-            "last_name": "Administrator",
-            "email": "admin@company.com",
-            "role": "admin",
-            "password": "admin123",
-            "is_staff": True,
-            "is_superuser": True,
-        },
-        {
-            "employee_id": "MGR001",
-            "username": "manager",
-            "first_name": "John",
-            "last_name": "Manager",
-            "email": "manager@company.com",
-            "role": "manager",
-            "password": "manager123",
-            "is_staff": False,
-            "is_superuser": False,
-        },
-        {
-            "employee_id": "EMP001",
-            "username": "employee",
-            "first_name": "Jane",
-            "last_name": "Employee",
-            "email": "employee@company.com",
-            "role": "employee",
-            "password": "employee123",
-            "campaign": "Marketing Campaign 2024",
-            "is_staff": False,
-            "is_superuser": False,
-        },
-    ]
-
-    for data in defaults:
-        employee_id = data["employee_id"]
+    for account in DEMO_ACCOUNTS:
+        data = dict(account)
+        employee_id = data.pop("employee_id")
         password = data.pop("password")
+        if "reports_to" in data:
+            data["manager"] = existing.get(data.pop("reports_to"))
+        user = existing.get(employee_id)
+
+        if user is None:
+            existing[employee_id] = manager.create_user(
+                employee_id=employee_id, password=password, **data)
+            continue
+        if settings.DEMO_ACCOUNTS != 'enforce':
+            continue
+
+        changed = [field for field, value in data.items() if getattr(user, field) != value]
+        for field in changed:
+            setattr(user, field, data[field])
+        # Always enforce known demo credentials for hosted demos, but only
+        # pay for a new hash when the stored one doesn't match.
+        if not user.check_password(password):
+            user.set_password(password)
+            changed.append('password')
+        if changed:
+            user.save(using=using, update_fields=changed)
+
+
+@receiver(post_migrate)
+def restore_search_index(sender, using='default', **kwargs):
+    """Put back the employee search triggers a table rebuild dropped.
+
+    Migrations 0009-0011 each made SQLite rebuild ``employees_employee``,
+    and any later column change will again.
+    """
+    if sender.label == 'employees':
+        search.restore_index(using)
+
+
+@receiver(post_save, sender=PunchRecord)
+@receiver(post_delete, sender=PunchRecord)
+def invalidate_report_partials(sender, instance, **kwargs):
+    """Drop stored report partials for the day(s) a punch touched."""
+    today = timezone.localdate()
+    dates = {instance.date, getattr(instance, '_loaded_date', None)}
+    # Open days are never stored, so the common punch-in/out path is free.
+    invalidate_partials(day for day in dates if day is not None and day < today)
+
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    """Feed every query's duration into the db_query_duration_seconds metric."""
+    if observe_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, observe_query)
+
+
+@receiver(post_save, sender=Employee)
+def update_reporting_lines(sender, instance, created, update_fields=None, using='default', raw=False, **kwargs):
+    """Move the employee's subtree in the closure table when its manager changed."""
+    if raw or (update_fields is not None and not {'manager', 'manager_id'} & update_fields):
+        return
+    if created:
+        if instance.manager_id is not None:
+            hierarchy.move(instance.pk, instance.manager_id, using)
+    elif hierarchy.manager_in_table(instance.pk, using) != instance.manager_id:
+        hierarchy.move(instance.pk, instance.manager_id, using)
+
+
+@receiver(pre_delete, sender=Employee)
+def detach_reporting_lines(sender, instance, using='default', **kwargs):
+    """Cut a deleted employee's team loose from the managers above it.
+
+    Direct reports lose their manager (SET_NULL) and keep their own teams.
+    """
+    hierarchy.move(instance.pk, None, using)
+
 
-        user, created = User.objects.get_or_create(
-            employee_id=employee_id,
-            defaults=data,
-        )
+@receiver(post_save, sender=Employee)
+@receiver(post_save, sender=PunchRecord)
+@receiver(post_save, sender=Report)
+def audit_save(sender, instance, created, update_fields=None, using='default', raw=False, **kwargs):
+    """Queue the field-level diff of a save for the audit log."""
+    if not raw:
+        audit.record_save(instance, created, update_fields, using)
 
-        if not created:
-            for field, value in data.items():
-                setattr(user, field, value)
 
-        # Always enforce known demo credentials for hosted demos.
-        user.set_password(password)
-        user.save()
\ No newline at end of file
+@receiver(post_delete, sender=Employee)
+@receiver(post_delete, sender=PunchRecord)
+@receiver(post_delete, sender=Report)
+def audit_delete(sender, instance, using='default', **kwargs):
+    audit.record_delete(instance, using)
@@ -0,0 +1,142 @@
+"""Binary snapshots of SQLite databases.
+
+A snapshot is a page-for-page copy of a database file made with SQLite's
+online backup API, so taking one is consistent while the server keeps
+writing and restoring one is as fast as copying the file; nothing is
+serialised or re-inserted row by row.  Snapshots are kept under
+``settings.SNAPSHOT_DIR``, or its ``<company slug>`` subdirectory for a
+tenant.
+
+``SnapshotTestRunner`` uses the same restore to start the test database
+from a prepared snapshot (``TEST_DATABASE_TEMPLATE``) instead of running
+every migration, and leaves the per-worker copies for ``--parallel`` to
+Django's usual cloning.
+"""
+import os
+import sqlite3
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.test.runner import DiscoverRunner
+
+from .tenants import current as current_tenant
+
+SUFFIX = '.sqlite3'
+HEADER = b'SQLite format 3\x00'
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def snapshot_dir():
+    tenant = current_tenant()
+    root = Path(settings.SNAPSHOT_DIR)
+    return root / tenant.slug if tenant is not None else root
+
+
+def snapshot_path(name):
+    """A snapshot name resolves inside ``snapshot_dir()``; anything path-like is used as is"""
+    name = str(name)
+    if os.sep in name or '/' in name or name.endswith(SUFFIX):
+        return Path(name)
+    return snapshot_dir() / f'{name}{SUFFIX}'
+
+
+def list_snapshots():
+    directory = snapshot_dir()
+    if not directory.is_dir():
+        return []
+    return sorted(directory.glob(f'*{SUFFIX}'), key=lambda path: path.stat().st_mtime)
+
+
+def _raw_connection(using):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        raise SnapshotError(f'Database "{using}" is {connection.vendor}; snapshots need SQLite.')
+    connection.ensure_connection()
+    return connection.connection
+
+
+def snapshot(name, using=DEFAULT_DB_ALIAS):
+    """Copy database ``using`` to the snapshot ``name`` and return its path"""
+    source = _raw_connection(using)
+    path = snapshot_path(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_suffix('.tmp')
+    target = sqlite3.connect(temporary)
+    try:
+        # One step: the copy is a single consistent read of the source
+        source.backup(target)
+    finally:
+        target.close()
+    os.replace(temporary, path)
+    return path
+
+
+def restore(name, using=DEFAULT_DB_ALIAS):
+    """Overwrite database ``using`` with the snapshot ``name`` and return its path"""
+    path = snapshot_path(name)
+    try:
+        with open(path, 'rb') as handle:
+            header = handle.read(len(HEADER))
+    except FileNotFoundError:
+        raise SnapshotError(f'No snapshot at {path}.')
+    if header != HEADER:
+        raise SnapshotError(f'{path} is not a SQLite database.')
+
+    target = _raw_connection(using)
+    source = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+    return path
+
+
+def pending_migrations(using=DEFAULT_DB_ALIAS):
+    executor = MigrationExecutor(connections[using])
+    return executor.migration_plan(executor.loader.graph.leaf_nodes())
+
+
+class SnapshotTestRunner(DiscoverRunner):
+    """Start the default test database from ``TEST_DATABASE_TEMPLATE`` when it is set.
+
+    Migrations newer than the template are applied on top of it.  Other
+    databases, and everything when no template is set, are created the
+    usual way.
+    """
+
+    def setup_databases(self, aliases=None, serialized_aliases=None, **kwargs):
+        template = settings.TEST_DATABASE_TEMPLATE
+        connection = connections[DEFAULT_DB_ALIAS]
+        if not template or DEFAULT_DB_ALIAS not in (aliases or ()) or connection.vendor != 'sqlite':
+            return super().setup_databases(
+                aliases=aliases, serialized_aliases=serialized_aliases, **kwargs)
+
+        others = set(aliases) - {DEFAULT_DB_ALIAS}
+        old_config = super().setup_databases(
+            aliases=others, serialized_aliases=set(serialized_aliases or ()) & others, **kwargs)
+
+        with self.time_keeper.timed(f'  Restoring test database from {template}'):
+            creation = connection.creation
+            old_name = connection.settings_dict['NAME']
+            test_name = creation._create_test_db(
+                self.verbosity, autoclobber=not self.interactive, keepdb=self.keepdb)
+            connection.close()
+            settings.DATABASES[DEFAULT_DB_ALIAS]['NAME'] = test_name
+            connection.settings_dict['NAME'] = test_name
+            path = restore(template)
+            if self.verbosity >= 1:
+                self.log(f"Restored test database for alias '{DEFAULT_DB_ALIAS}' from {path}")
+            if pending_migrations():
+                call_command('migrate', database=DEFAULT_DB_ALIAS, interactive=False,
+                             verbosity=max(self.verbosity - 1, 0))
+            for index in range(self.parallel if self.parallel > 1 else 0):
+                creation.clone_test_db(
+                    suffix=str(index + 1), verbosity=self.verbosity, keepdb=self.keepdb)
+        old_config.append((connection, old_name, True))
+        return old_config
@@ -0,0 +1,53 @@
+"""Cold-start probe used by ``manage.py startup_report``.
+
+Run as ``python -m employees.startup`` in a fresh interpreter so imports,
+app loading and the first request are measured cold.  Prints one JSON
+object with the duration of each boot phase in milliseconds.
+"""
+import json
+import os
+import sys
+import time
+
+
+def measure(path='/api/', migrate=True):
+    timings = {}
+    started = time.perf_counter()
+
+    def mark(phase, since):
+        now = time.perf_counter()
+        timings[phase] = round((now - since) * 1000, 2)
+        return now
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'employeemng.settings')
+    import django
+    django.setup()
+    cursor = mark('django_setup', started)
+
+    from django.core.wsgi import get_wsgi_application
+    get_wsgi_application()
+    cursor = mark('wsgi_application', cursor)
+
+    if migrate:
+        from django.core.management import call_command
+        call_command('migrate', interactive=False, verbosity=0)
+        cursor = mark('migrate', cursor)
+
+    from django.conf import settings
+    from django.test import Client
+    client = Client(HTTP_HOST=(settings.ALLOWED_HOSTS or ['localhost'])[0])
+    client.get(path)
+    cursor = mark('first_request', cursor)
+    client.get(path)
+    mark('second_request', cursor)
+
+    timings['total'] = round((time.perf_counter() - started) * 1000, 2)
+    return timings
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    print(json.dumps(measure(
+        path=args[0] if args else '/api/',
+        migrate='--skip-migrate' not in args,
+    )))
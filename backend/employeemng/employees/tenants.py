@@ -0,0 +1,171 @@
+"""Company tenants, each in its own database (shard).
+
+``Company`` rows live in the ``default`` database, which doubles as the
+tenant directory.  The employees, punches, reports, tokens and audit log of
+a company live in its shard: the ``DATABASES`` alias named by
+``Company.shard``, or a SQLite file at that path, by default
+``<TENANT_DATABASE_DIR>/<slug>.sqlite3``.  File shards are registered as
+``tenant_<slug>`` connections the first time a process uses them, so one
+pool of workers serves every tenant.
+
+API tokens carry their tenant as ``<slug>:<key>``.  Authentication activates
+that tenant for the rest of the request and ``TenantRouter`` sends every
+query to its shard, so a request never touches another tenant's tables.
+Unprefixed tokens, and code running outside any tenant, use ``default``.
+"""
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+ALIAS_PREFIX = 'tenant_'
+SQLITE_ENGINE = 'django.db.backends.sqlite3'
+COMPANY = 'employees.company'
+
+Tenant = namedtuple('Tenant', 'company_id slug database')
+
+_tenant = ContextVar('tenant', default=None)
+_tenants = {}  # slug -> (Tenant, expiry)
+_lock = threading.Lock()
+
+
+def current():
+    return _tenant.get()
+
+
+def current_company_id():
+    """Default of ``TenantModel.company``: the active tenant's company"""
+    tenant = _tenant.get()
+    return tenant.company_id if tenant is not None else None
+
+
+def current_database():
+    tenant = _tenant.get()
+    return tenant.database if tenant is not None else DEFAULT_DB_ALIAS
+
+
+def activate(tenant):
+    """Route this context's queries to ``tenant`` (None for ``default``)"""
+    return _tenant.set(tenant)
+
+
+@contextmanager
+def tenant_context(tenant):
+    """Activate a Tenant, Company or company slug (None: no tenant) inside the block"""
+    if tenant is not None and not isinstance(tenant, Tenant):
+        tenant = get_tenant(tenant)
+    token = _tenant.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _tenant.reset(token)
+
+
+def get_tenant(company):
+    """The Tenant of a Company or an active company's slug.
+
+    Slugs are looked up in ``default`` at most every ``TENANT_CACHE_SECONDS``
+    per process; unknown or inactive ones raise ``Company.DoesNotExist``.
+    """
+    from .models import Company
+
+    if isinstance(company, Company):
+        return Tenant(company.pk, company.slug, register(company))
+    now = time.monotonic()
+    cached = _tenants.get(company)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+    instance = Company.objects.using(DEFAULT_DB_ALIAS).get(slug=company, is_active=True)
+    tenant = Tenant(instance.pk, instance.slug, register(instance))
+    _tenants[company] = (tenant, now + settings.TENANT_CACHE_SECONDS)
+    return tenant
+
+
+def shard_path(company):
+    return Path(company.shard) if company.shard else Path(settings.TENANT_DATABASE_DIR) / f'{company.slug}.sqlite3'
+
+
+def shard_error(company):
+    """Why ``company.shard`` can't hold a tenant, or None.
+
+    A shard must not be the ``default`` database, which holds the company
+    directory and the unprefixed accounts, nor a ``DATABASES`` alias left
+    out of ``TENANT_SHARD_ALIASES``.
+    """
+    shard = company.shard
+    if shard == DEFAULT_DB_ALIAS:
+        return 'The default database is not a company shard.'
+    if shard in settings.DATABASES:
+        if shard not in settings.TENANT_SHARD_ALIASES:
+            return f'"{shard}" is not listed in TENANT_SHARD_ALIASES.'
+        return None
+    default = settings.DATABASES[DEFAULT_DB_ALIAS]
+    if default['ENGINE'] == SQLITE_ENGINE and shard_path(company).resolve() == Path(default['NAME']).resolve():
+        return 'That file is the default database, not a company shard.'
+    return None
+
+
+def register(company):
+    """The database alias of a company's shard, adding a connection for file shards"""
+    if company.shard in connections.settings:
+        return company.shard
+    alias = ALIAS_PREFIX + company.slug
+    if alias in connections.settings:
+        return alias
+    path = shard_path(company)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    template = connections.settings[DEFAULT_DB_ALIAS]
+    config = {
+        **template,
+        'ENGINE': SQLITE_ENGINE,
+        'NAME': path,
+        'OPTIONS': template['OPTIONS'] if template['ENGINE'] == SQLITE_ENGINE else {},
+        'TEST': {**template['TEST'], 'NAME': None},
+    }
+    with _lock:
+        # connections.settings is settings.DATABASES, so close_old_connections()
+        # and `--database` options see the new alias too
+        connections.settings.setdefault(alias, config)
+    return alias
+
+
+def all_tenants(slugs=None):
+    """Tenants of every active company (or just ``slugs``), by slug"""
+    from .models import Company
+
+    companies = Company.objects.using(DEFAULT_DB_ALIAS).filter(is_active=True).order_by('slug')
+    if slugs:
+        companies = companies.filter(slug__in=slugs)
+    return [get_tenant(company) for company in companies]
+
+
+def database_label(alias):
+    """Collapse file shard aliases for metrics labels"""
+    return 'tenant' if alias.startswith(ALIAS_PREFIX) else alias
+
+
+class TenantRouter:
+    """Companies stay in ``default``; all other models follow the active tenant"""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower == COMPANY:
+            return DEFAULT_DB_ALIAS
+        tenant = _tenant.get()
+        return tenant.database if tenant is not None else None
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if COMPANY in (obj1._meta.label_lower, obj2._meta.label_lower):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if f'{app_label}.{model_name}' == COMPANY:
+            return db == DEFAULT_DB_ALIAS
+        return None
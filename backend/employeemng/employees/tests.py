@@ -1,3 +1,432 @@
-from django.test import TestCase
+import tempfile
+from io import StringIO
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import audit, kiosk, listing, throttling, worktime
+from .archive import archive_punches
+from .inserts import insert_new
+from .models import AuditLog, Company, Employee, PunchRecord, PunchSyncKey, Report
+from .renderers import ORJSONRenderer
+from .search import TRIGGERS
+from .serializers import EmployeeSerializer, PunchRecordSerializer, ReportSerializer
+from .tenants import shard_error
+
+
+class APITestCase(TestCase):
+    """Requests as the demo admin, manager or employee"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = Employee.objects.get(employee_id='ADMIN001')
+        self.manager = Employee.objects.get(employee_id='MGR001')
+        self.employee = Employee.objects.get(employee_id='EMP001')
+
+    def as_user(self, user):
+        self.client.force_authenticate(user)
+        return self.client
+
+
+class EmployeeSearchTests(APITestCase):
+
+    def search(self, q):
+        response = self.as_user(self.admin).get('/api/employees/search/', {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return [row['employee_id'] for row in response.json()]
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 index is SQLite only')
+    def test_triggers_survive_migrations(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+            triggers = {row[0] for row in cursor.fetchall()}
+        self.assertTrue(triggers.issuperset(TRIGGERS))
+
+    def test_created_employee_is_found(self):
+        response = self.as_user(self.admin).post('/api/employees/', {
+            'employee_id': 'ZED123', 'first_name': 'Zebulon', 'last_name': 'Quist',
+            'email': 'zebulon@example.com', 'password': 'Secretpw!9',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(self.search('Zebu'), ['ZED123'])
+        self.assertEqual(self.search('zed12 quis'), ['ZED123'])
+
+    def test_updated_and_deleted_employee(self):
+        employee = Employee.objects.create(
+            employee_id='ZED124', username='zora', first_name='Zora', last_name='Pell', email='zora@example.com')
+        response = self.as_user(self.admin).patch(
+            f'/api/employees/{employee.pk}/', {'last_name': 'Wyndham'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.search('wyndh'), ['ZED124'])
+        self.assertEqual(self.search('pell'), [])
+
+        Employee.objects.filter(pk=employee.pk).update(first_name='Xanthe')
+        self.assertEqual(self.search('xanth'), ['ZED124'])
+        employee.delete()
+        self.assertEqual(self.search('xanth'), [])
+
+
+class BulkEmployeeTests(APITestCase):
+
+    def test_malformed_ids_are_row_errors(self):
+        response = self.as_user(self.admin).post('/api/employees/bulk/', {
+            'update': [{'id': [1], 'first_name': 'A'}, {'id': self.employee.pk, 'first_name': 'Janet'}],
+            'deactivate': [[1], 'x', 999999],
+        }, format='json')
+        self.assertEqual(response.status_code, 400, response.content)
+        errors = response.json()['errors']
+        self.assertEqual(
+            [(error['op'], error['index']) for error in errors],
+            [('update', 0), ('deactivate', 0), ('deactivate', 1), ('deactivate', 2)])
+        self.employee.refresh_from_db()
+        self.assertEqual(self.employee.first_name, 'Jane')
+
+    def test_non_object_body(self):
+        response = self.as_user(self.admin).post('/api/employees/bulk/', [1, 2], format='json')
+        self.assertEqual(response.status_code, 400, response.content)
+
+    def test_update_and_deactivate(self):
+        response = self.as_user(self.admin).post('/api/employees/bulk/', {
+            'update': [{'id': str(self.employee.pk), 'first_name': 'Janet'}],
+            'deactivate': [self.employee.pk],
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.employee.refresh_from_db()
+        self.assertEqual((self.employee.first_name, self.employee.is_active), ('Janet', False))
+
+
+class InsertNewTests(TestCase):
+
+    def setUp(self):
+        self.employee = Employee.objects.get(employee_id='EMP001')
+        self.start = timezone.now() - timedelta(days=3)
+
+    def punch(self, days):
+        moment = self.start + timedelta(days=days)
+        day, minute = worktime.work_day(moment, worktime.zone_of(self.employee))
+        return PunchRecord(employee=self.employee, punch_in=moment, date=day, start_minute=minute)
+
+    def test_conflicting_rows_are_skipped(self):
+        taken = self.punch(0)
+        self.assertEqual(insert_new([taken], key=['employee', 'date']), [taken])
+        self.assertIsNotNone(taken.pk)
+
+        again, fresh = self.punch(0), self.punch(1)
+        inserted = insert_new([again, fresh], key=['employee', 'date'], conflict_fields=['employee', 'date'])
+        self.assertEqual(inserted, [fresh])
+        self.assertIsNone(again.pk)
+        self.assertEqual(PunchRecord.objects.get(pk=fresh.pk).date, fresh.date)
+        self.assertEqual(PunchRecord.objects.count(), 2)
+
+    def test_punch_in_on_a_taken_day(self):
+        self.assertIsNotNone(kiosk.punch_in(self.employee, self.start))
+        self.assertIsNone(kiosk.punch_in(self.employee, self.start + timedelta(minutes=5)))
+        self.assertEqual(PunchRecord.objects.count(), 1)
+
+
+class RowListTests(APITestCase):
+    """The values_list rows render the same JSON as the model serializers"""
+
+    def setUp(self):
+        super().setUp()
+        Employee.objects.filter(pk=self.employee.pk).update(hourly_rate=Decimal('17.35'), timezone='Asia/Tokyo')
+        self.employee.refresh_from_db()
+        start = timezone.now().replace(microsecond=123456) - timedelta(days=5)
+        for days in range(4):
+            PunchRecord.objects.create(
+                employee=self.employee, punch_in=start + timedelta(days=days),
+                punch_out=start + timedelta(days=days, hours=7, minutes=50))
+        PunchRecord.objects.create(employee=self.manager, punch_in=start)
+        Report.objects.create(
+            title='Team', report_type='salary', generated_by=self.manager,
+            start_date=start.date(), end_date=timezone.localdate(), data={'EMP001': {'total_hours': 31.33}})
+
+    def assertSameJSON(self, queryset, serializer_class, rows):
+        renderer = ORJSONRenderer()
+        expected = renderer.render(serializer_class(list(queryset), many=True).data)
+        self.assertEqual(renderer.render(rows.serialize(rows.query(queryset))), expected)
+
+    def test_punch_records(self):
+        self.assertSameJSON(
+            PunchRecord.objects.select_related('employee').order_by('pk'), PunchRecordSerializer,
+            listing.PUNCH_RECORDS)
+
+    def test_employees(self):
+        self.assertSameJSON(Employee.objects.order_by('pk'), EmployeeSerializer, listing.EMPLOYEES)
+
+    def test_reports(self):
+        self.assertSameJSON(
+            Report.objects.select_related('generated_by').order_by('pk'), ReportSerializer, listing.REPORTS)
+
+    def test_list_endpoint_pages(self):
+        response = self.as_user(self.admin).get('/api/punch-records/', {'page_size': 2, 'page': 2})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['count'], len(body['results'])), (5, 2))
+        self.assertEqual(self.as_user(self.admin).get('/api/punch-records/', {'page': 9}).status_code, 404)
+
+    def test_managers_see_their_team(self):
+        response = self.as_user(self.manager).get('/api/employees/')
+        self.assertEqual([row['employee_id'] for row in response.json()['results']], ['EMP001'])
+        response = self.as_user(self.manager).get('/api/punch-records/')
+        self.assertEqual({row['employee'] for row in response.json()['results']}, {self.employee.pk})
+
+
+class KioskSyncTests(APITestCase):
+
+    def sync(self, user, *punches):
+        return self.as_user(user).post('/api/punch-records/sync/', {
+            'device': 'test', 'punches': [
+                {'key': key, 'employee_id': 'EMP001', 'action': action, 'timestamp': moment.isoformat()}
+                for key, action, moment in punches
+            ],
+        }, format='json')
+
+    def statuses(self, response):
+        self.assertEqual(response.status_code, 200, response.content)
+        return [result['status'] for result in response.json()['results']]
+
+    def test_duplicates_and_resends(self):
+        start = timezone.now() - timedelta(hours=10)
+        punches = [('in', 'punch_in', start), ('in', 'punch_in', start),
+                   ('out', 'punch_out', start + timedelta(hours=8))]
+        self.assertEqual(self.statuses(self.sync(self.manager, *punches)), ['applied', 'duplicate', 'applied'])
+        record = PunchRecord.objects.get()
+        self.assertEqual(record.total_hours, Decimal('8.00'))
+
+        # A kiosk resending the batch after a timeout gets the original outcomes
+        results = self.sync(self.manager, *punches).json()['results']
+        self.assertEqual([result['status'] for result in results], ['duplicate'] * 3)
+        self.assertEqual([result['original_status'] for result in results], ['applied'] * 3)
+        self.assertEqual({result['punch_record'] for result in results}, {record.pk})
+        self.assertEqual(PunchRecord.objects.count(), 1)
+
+    def test_second_punch_in_is_rejected(self):
+        start = timezone.now() - timedelta(hours=3)
+        response = self.sync(self.manager, ('a', 'punch_in', start), ('b', 'punch_in', start + timedelta(hours=1)))
+        self.assertEqual(self.statuses(response), ['applied', 'rejected'])
+
+    def test_conflicting_write_is_retried(self):
+        # Another request punches the employee in after the batch has read
+        # the day's records, before it writes
+        moment = timezone.now() - timedelta(hours=1)
+        replay = kiosk.KioskSyncBatch._replay
+        calls = []
+
+        def racing_replay(*args):
+            if not calls:
+                PunchRecord.objects.create(employee=self.employee, punch_in=moment - timedelta(minutes=1))
+            calls.append(args)
+            return replay(*args)
+
+        with mock.patch.object(kiosk.KioskSyncBatch, '_replay', staticmethod(racing_replay)):
+            response = self.sync(self.manager, ('k', 'punch_in', moment))
+        self.assertEqual(self.statuses(response), ['rejected'])
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(PunchRecord.objects.count(), 1)
+
+    def test_employees_cannot_sync(self):
+        now = timezone.now()
+        response = self.sync(self.employee, ('k1', 'punch_in', now - timedelta(days=1)))
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(PunchRecord.objects.exists())
+
+    def test_timestamps_outside_the_window_are_invalid(self):
+        now = timezone.now()
+        backlog = timedelta(hours=settings.KIOSK_MAX_BACKLOG)
+        response = self.sync(
+            self.manager,
+            ('old', 'punch_in', now - backlog - timedelta(minutes=1)),
+            ('future', 'punch_in', now + timedelta(hours=1)),
+            ('recent', 'punch_in', now - backlog + timedelta(minutes=1)),
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['status'] for result in response.json()['results']], ['invalid', 'invalid', 'applied'])
+
+
+class PunchTests(APITestCase):
+
+    def test_punch_in_and_out(self):
+        client = self.as_user(self.employee)
+        self.assertEqual(client.post('/api/punch-records/punch/', {'action': 'punch_in'}, format='json').json(),
+                         {'status': 'punched in'})
+        response = client.post('/api/punch-records/punch/', {'action': 'punch_in'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(client.post('/api/punch-records/punch/', {'action': 'punch_out'}, format='json').json(),
+                         {'status': 'punched out'})
+        self.assertEqual(PunchRecord.objects.filter(employee=self.employee, punch_out__isnull=False).count(), 1)
+
+    def test_malformed_bodies(self):
+        for body in [[1], {}, {'action': 'nap'}]:
+            response = self.as_user(self.employee).post('/api/punch-records/punch/', body, format='json')
+            self.assertEqual(response.status_code, 400, body)
+
+
+class CreateCompanyTests(TestCase):
+
+    def test_default_database_is_not_a_shard(self):
+        with self.assertRaisesMessage(CommandError, 'shard: The default database is not a company shard.'):
+            call_command('create_company', 'acme', 'Acme', shard='default', stdout=StringIO())
+        self.assertFalse(Company.objects.exists())
+
+    def test_unlisted_alias_is_not_a_shard(self):
+        company = Company(slug='acme', name='Acme', shard='default')
+        with override_settings(DATABASES={**settings.DATABASES, 'reporting': {}}):
+            company.shard = 'reporting'
+            self.assertEqual(shard_error(company), '"reporting" is not listed in TENANT_SHARD_ALIASES.')
+            with override_settings(TENANT_SHARD_ALIASES=['reporting']):
+                self.assertIsNone(shard_error(company))
+
+
+class WorkDayTests(TestCase):
+
+    def test_punch_is_dated_by_the_employees_local_day(self):
+        employee = Employee.objects.get(employee_id='EMP001')
+        employee.timezone = 'Pacific/Auckland'
+        employee.save()
+        # 20:30 UTC on 1 March is 09:30 on 2 March in Auckland (UTC+13)
+        moment = datetime(2025, 3, 1, 20, 30, tzinfo=dt_timezone.utc)
+        record = PunchRecord.objects.create(employee=employee, punch_in=moment)
+        self.assertEqual((record.date, record.start_minute), (date(2025, 3, 2), 9 * 60 + 30))
+
+
+class ArchiveTests(TestCase):
+
+    def test_archiving_punches_with_sync_keys(self):
+        employee = Employee.objects.get(employee_id='EMP001')
+        start = timezone.now() - timedelta(days=400)
+        record = PunchRecord.objects.create(
+            employee=employee, punch_in=start, punch_out=start + timedelta(hours=8))
+        key = PunchSyncKey.objects.create(key='k1', status='applied', punch_record=record)
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(PUNCH_ARCHIVE_DIR=directory):
+            summary = archive_punches(timezone.localdate() - timedelta(days=365))
+
+        self.assertEqual(summary['deleted'], 1)
+        self.assertFalse(PunchRecord.objects.exists())
+        key.refresh_from_db()
+        self.assertIsNone(key.punch_record_id)
+
+
+class ReportAdminTests(TestCase):
+
+    def test_regenerate_keeps_a_managers_report_to_their_team(self):
+        admin = Employee.objects.get(employee_id='ADMIN001')
+        manager = Employee.objects.get(employee_id='MGR001')
+        Employee.objects.create(employee_id='OUT001', username='outsider', email='out@example.com')
+        today = timezone.localdate()
+        reports = [
+            Report.objects.create(title='Team', report_type='employee', generated_by=manager,
+                                  start_date=today, end_date=today, data={}),
+            Report.objects.create(title='Company', report_type='employee', generated_by=admin,
+                                  start_date=today, end_date=today, data={}),
+        ]
+
+        self.client.force_login(admin)
+        response = self.client.post('/admin/employees/report/', {
+            'action': 'regenerate_reports', '_selected_action': [report.pk for report in reports]})
+        self.assertEqual(response.status_code, 302)
+
+        team, company = (Report.objects.get(pk=report.pk).data for report in reports)
+        self.assertEqual(sorted(team), ['EMP001'])
+        self.assertEqual(sorted(company), ['EMP001', 'OUT001'])
+
+
+class ThrottleTests(APITestCase):
+
+    def test_bucket_spending(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(THROTTLE_DB=f'{directory}/throttle.sqlite3'):
+            self.assertEqual([throttling.spend('k', 2, 5, 1.0) for _ in range(2)], [0, 0])
+            self.assertAlmostEqual(throttling.spend('k', 2, 5, 1.0), 1.0, delta=0.1)
+            throttling.record_rejection('reports')
+            self.assertEqual(throttling.rejection_counts()['reports'], 1)
+
+    def test_impossible_dates(self):
+        with override_settings(API_THROTTLING='on'):
+            client = self.as_user(self.admin)
+            response = client.post('/api/reports/', {
+                'title': 'Feb', 'report_type': 'salary', 'start_date': '2024-02-30', 'end_date': '2024-03-05',
+            }, format='json')
+            self.assertEqual(response.status_code, 400, response.content)
+            response = client.get('/api/analytics/', {'start_date': '2024-02-30', 'end_date': '2024-03-05'})
+            self.assertEqual(response.status_code, 400, response.content)
+
+    def test_bulk_with_non_list_parts(self):
+        with override_settings(API_THROTTLING='on'):
+            response = self.as_user(self.admin).post('/api/employees/bulk/', {'create': 5}, format='json')
+        self.assertEqual(response.status_code, 400, response.content)
+
+    def test_report_with_a_non_object_body(self):
+        with override_settings(API_THROTTLING='on'):
+            response = self.as_user(self.admin).post('/api/reports/', [1], format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class AuditFlushTests(TestCase):
+
+    def setUp(self):
+        # No background flusher: these tests flush by hand
+        patches = [mock.patch.object(audit, '_flusher', object()), mock.patch.object(audit, '_queue', [])]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        audit._push('default', [
+            AuditLog(model='report', object_id=pk, action='update', changes={}) for pk in (901, 902)])
+
+    def failing_insert(self):
+        return mock.patch('django.db.models.query.QuerySet.bulk_create',
+                          side_effect=OperationalError('database is locked'))
+
+    def test_failed_batch_is_retried(self):
+        with self.failing_insert(), self.assertRaises(OperationalError):
+            audit.flush()
+        self.assertEqual(len(audit._queue), 2)
+        self.assertEqual(audit.flush(), 2)
+        self.assertEqual(AuditLog.objects.filter(model='report', object_id__in=[901, 902]).count(), 2)
+
+    @override_settings(AUDIT_FLUSH_ATTEMPTS=2)
+    def test_batch_is_dropped_after_the_last_attempt(self):
+        with self.failing_insert():
+            with self.assertRaises(OperationalError):
+                audit.flush()
+            self.assertEqual(len(audit._queue), 2)
+            with self.assertRaises(OperationalError), self.assertLogs('employees.audit', 'ERROR') as logs:
+                audit.flush()
+        self.assertEqual(audit._queue, [])
+        self.assertIn('Dropped 2 audit log entries after 2 failed attempts', logs.output[0])
+
+
+class AuditLogTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        patches = [mock.patch.object(audit, '_flusher', object()), mock.patch.object(audit, '_queue', [])]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_manager_sees_changes_to_team_punches(self):
+        record = PunchRecord.objects.create(employee=self.employee, punch_in=timezone.now())
+        AuditLog.objects.create(model='punchrecord', object_id=record.pk, action='update',
+                                actor=self.admin, changes={'notes': ['', 'fixed']})
+        response = self.as_user(self.manager).get('/api/audit-log/', {'model': 'punchrecord'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(record.pk, [row['object_id'] for row in response.json()['results']])
+
+    def test_failed_flush_does_not_fail_the_read(self):
+        audit._push('default', [AuditLog(model='report', object_id=903, action='update', changes={})])
+        with mock.patch('django.db.models.query.QuerySet.bulk_create',
+                        side_effect=OperationalError('database is locked')), \
+                self.assertLogs('employees.audit', 'ERROR'):
+            response = self.as_user(self.admin).get('/api/audit-log/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(audit._queue), 1)
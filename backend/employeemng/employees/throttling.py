@@ -0,0 +1,228 @@
+"""Cost-aware throttling and admission control.
+
+Every API request spends tokens from a per-user bucket for its endpoint
+class (``THROTTLE_BUCKETS``).  Cheap requests cost one token, and reports,
+analytics and bulk writes cost more the more work they ask for.  Buckets
+live in a small SQLite file (``THROTTLE_DB``) shared by every worker on
+the host.  Refilling and spending a bucket is a single ``INSERT ... ON
+CONFLICT DO UPDATE ... WHERE`` statement, so concurrent workers can't both
+spend the same tokens, and no directory is scanned on any request.
+
+Report generation is also limited host-wide to ``REPORT_MAX_CONCURRENT``
+at a time through lock files.  Keep that below the worker count so some
+workers are always free for punches; the punch action is never throttled.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+
+from django.conf import settings
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+from .tenants import current as current_tenant
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+# Stale buckets (full again, so the same as none) are deleted every this
+# many requests per process
+PRUNE_EVERY = 1000
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS bucket ('
+    'key TEXT PRIMARY KEY, tokens REAL NOT NULL, stamp REAL NOT NULL, expires REAL NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE TABLE IF NOT EXISTS rejection (scope TEXT PRIMARY KEY, count INTEGER NOT NULL) WITHOUT ROWID',
+]
+
+# Refill from the time since the last spend, then spend ``cost`` only if
+# the bucket holds it; no row comes back when it doesn't
+SPEND = (
+    'INSERT INTO bucket (key, tokens, stamp, expires) '
+    'VALUES (:key, :capacity - :cost, :now, :now + :full_after) '
+    'ON CONFLICT (key) DO UPDATE SET '
+    'tokens = min(:capacity, tokens + max(0, :now - stamp) * :rate) - :cost, '
+    'stamp = :now, expires = :now + :full_after '
+    'WHERE min(:capacity, tokens + max(0, :now - stamp) * :rate) >= :cost '
+    'RETURNING tokens'
+)
+
+_local = threading.local()
+
+
+def _db():
+    """This thread's connection to ``THROTTLE_DB``; reopened after a fork"""
+    connection = getattr(_local, 'connection', None)
+    path = Path(settings.THROTTLE_DB)
+    if connection is None or _local.pid != os.getpid() or _local.path != path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit: every statement below is its own short transaction
+        connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        for statement in SCHEMA:
+            connection.execute(statement)
+        _local.connection, _local.pid, _local.path, _local.calls = connection, os.getpid(), path, 0
+    return connection
+
+
+def spend(key, cost, capacity, rate):
+    """Take ``cost`` tokens from the bucket; returns 0, or the seconds until it could"""
+    db = _db()
+    now = time.time()
+    _local.calls += 1
+    if _local.calls % PRUNE_EVERY == 0:
+        db.execute('DELETE FROM bucket WHERE expires < ?', [now])
+    params = {'key': key, 'cost': cost, 'capacity': capacity, 'rate': rate,
+              'now': now, 'full_after': capacity / rate}
+    if db.execute(SPEND, params).fetchone() is not None:
+        return 0
+    tokens, stamp = db.execute('SELECT tokens, stamp FROM bucket WHERE key = ?', [key]).fetchone()
+    return max(cost - min(capacity, tokens + max(0, now - stamp) * rate), 0) / rate
+
+
+def record_rejection(scope):
+    _db().execute(
+        'INSERT INTO rejection (scope, count) VALUES (?, 1) '
+        'ON CONFLICT (scope) DO UPDATE SET count = count + 1', [scope])
+
+
+def rejection_counts():
+    scopes = list(settings.THROTTLE_BUCKETS) + ['report_slots']
+    counts = dict(_db().execute('SELECT scope, count FROM rejection'))
+    return {scope: counts.get(scope, 0) for scope in scopes}
+
+
+def _parse_date(value):
+    # Malformed or impossible dates (2024-02-30) cost one token and are left
+    # to the view's validation
+    if isinstance(value, date) or not value:
+        return value or None
+    try:
+        return parse_date(str(value))
+    except ValueError:
+        return None
+
+
+def range_cost(start, end, days_per_token=31):
+    """One token plus one per ``days_per_token`` days in the requested range"""
+    start, end = _parse_date(start), _parse_date(end)
+    if not start or not end or end < start:
+        return 1
+    return 1 + (end - start).days // days_per_token
+
+
+class CostThrottle(BaseThrottle):
+    """Token bucket per user (or client IP) and endpoint class"""
+    scope = 'default'
+
+    def get_scope(self, request, view):
+        return self.scope
+
+    def get_cost(self, request, view):
+        return 1
+
+    def allow_request(self, request, view):
+        if settings.API_THROTTLING == 'off':
+            return True
+        scope = self.get_scope(request, view)
+        capacity, per_minute = settings.THROTTLE_BUCKETS[scope]
+        rate = per_minute / 60
+        cost = min(self.get_cost(request, view), capacity)
+        ident = request.user.pk if request.user and request.user.is_authenticated else self.get_ident(request)
+        tenant = current_tenant()
+        key = f'throttle:{scope}:{tenant.slug}:{ident}' if tenant else f'throttle:{scope}:{ident}'
+
+        self._wait = spend(key, cost, capacity, rate)
+        if self._wait:
+            record_rejection(scope)
+            return False
+        return True
+
+    def wait(self):
+        return self._wait
+
+
+class ReportThrottle(CostThrottle):
+    scope = 'reports'
+
+    def get_scope(self, request, view):
+        return self.scope if request.method == 'POST' else 'default'
+
+    def get_cost(self, request, view):
+        if request.method != 'POST':
+            return 1
+        data = request.data if isinstance(request.data, dict) else {}
+        return range_cost(data.get('start_date'), data.get('end_date'))
+
+
+class AnalyticsThrottle(CostThrottle):
+    scope = 'analytics'
+
+    def get_cost(self, request, view):
+        params = request.query_params
+        return range_cost(params.get('start_date'), params.get('end_date'))
+
+
+class BulkThrottle(CostThrottle):
+    scope = 'bulk'
+
+    def get_cost(self, request, view):
+        data = request.data if isinstance(request.data, dict) else {}
+        rows = sum(len(value) for value in (data.get(key) for key in ('create', 'update', 'deactivate'))
+                   if isinstance(value, list))
+        return 1 + rows // 100
+
+
+_local_slots = None
+_local_slots_lock = threading.Lock()
+
+
+def _acquire_slot():
+    limit = settings.REPORT_MAX_CONCURRENT
+    if fcntl is None:
+        global _local_slots
+        with _local_slots_lock:
+            if _local_slots is None:
+                _local_slots = threading.BoundedSemaphore(limit)
+        return _local_slots if _local_slots.acquire(blocking=False) else None
+
+    directory = Path(settings.REPORT_SLOT_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    for number in range(limit):
+        handle = open(directory / f'slot-{number}.lock', 'a')
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            handle.close()
+            continue
+        return handle
+    return None
+
+
+@contextmanager
+def report_slot():
+    """Hold one of the host-wide report generation slots, or raise 429"""
+    slot = _acquire_slot()
+    if slot is None:
+        record_rejection('report_slots')
+        raise Throttled(
+            wait=settings.REPORT_SLOT_RETRY_AFTER,
+            detail='Too many reports are being generated right now. Try again shortly.'
+        )
+    try:
+        yield
+    finally:
+        if fcntl is None:
+            slot.release()
+        else:
+            fcntl.flock(slot, fcntl.LOCK_UN)
+            slot.close()
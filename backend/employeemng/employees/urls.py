@@ -1,13 +1,25 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import EmployeeViewSet, PunchRecordViewSet, ReportViewSet, login
+from . import async_views
+from .views import (
+    AuditLogViewSet, EmployeeViewSet, PayslipViewSet, PunchRecordViewSet, ReportViewSet,
+    analytics, dashboard, login, metrics
+)
 
 router = DefaultRouter()
 router.register(r'employees', EmployeeViewSet)
 router.register(r'punch-records', PunchRecordViewSet)
 router.register(r'reports', ReportViewSet)
+router.register(r'audit-log', AuditLogViewSet)
+router.register(r'payslips', PayslipViewSet, basename='payslip')
 
 urlpatterns = [
+    path('metrics', metrics, name='metrics'),
     path('api/login/', login, name='login'),
+    path('api/analytics/', analytics, name='analytics'),
+    path('api/dashboard/', dashboard, name='dashboard'),
+    path('api/async/punch-records/', async_views.punch_record_list, name='async-punch-record-list'),
+    path('api/async/punch-records/punch/', async_views.punch, name='async-punch-record-punch'),
+    path('api/async/punch-records/presence/', async_views.presence, name='async-punch-record-presence'),
     path('api/', include(router.urls)),
 ]
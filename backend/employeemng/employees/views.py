@@ -1,15 +1,41 @@
-from rest_framework import viewsets, status
-from rest_framework.decorators import api_view, action, permission_classes
+from rest_framework import serializers, viewsets, status
+from rest_framework.decorators import api_view, action, permission_classes, throttle_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import Throttled
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
 from django.utils import timezone
-from django.db.models import Sum
-from .models import Employee, PunchRecord, Report
+from django.db.models import Q, Sum
+from .analytics import cached_analytics
+from .bulk import BulkConflict, BulkEmployeeBatch
+from .dashboard import cached_dashboard
+from .kiosk import KioskSyncBatch
+from .listing import RowListMixin
+from . import metrics as app_metrics
+from .metrics import PUNCHES
+from . import audit
+from . import hierarchy
+from . import kiosk
+from . import listing
+from . import worktime
+from . import payslips
+from . import scheduler
+from . import tenants
+from .models import AuditLog, Employee, PunchRecord, Report
+from .reports import as_date, generate_report_data
+from .search import ranked_matches
+from .throttling import AnalyticsThrottle, BulkThrottle, ReportThrottle, report_slot
 from .serializers import (
     EmployeeSerializer, PunchRecordSerializer, LoginSerializer,
-    ReportSerializer, PunchInOutSerializer
+    ReportSerializer, PunchInOutSerializer, AnalyticsQuerySerializer,
+    PresenceSerializer, EmployeeSearchQuerySerializer, EmployeeSearchResultSerializer,
+    PunchRecordFilterSerializer, AuditLogSerializer, AuditLogFilterSerializer,
+    PayslipBatchSerializer
 )
 import json
 
@@ -20,45 +46,200 @@ def login(request):
     serializer = LoginSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.validated_data['user']
+        tenant = serializer.validated_data['tenant']
         token, _ = Token.objects.get_or_create(user=user)
         response_data = {
-            'token': token.key,
+            # Tokens name their company so authentication can pick its database
+            'token': f'{tenant.slug}:{token.key}' if tenant else token.key,
             'employee_id': user.employee_id,
             'role': user.role,
+            'company': tenant.slug if tenant else None,
         }
         return Response(response_data, status=status.HTTP_200_OK)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class EmployeeViewSet(viewsets.ModelViewSet):
+@require_GET
+def metrics(request):
+    """Prometheus metrics, summed over all worker processes"""
+    if settings.METRICS_TOKEN and not constant_time_compare(
+            request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}'):
+        return HttpResponse(status=401)
+    return HttpResponse(app_metrics.render(), content_type=app_metrics.CONTENT_TYPE)
+
+
+@api_view(['GET'])
+@throttle_classes([AnalyticsThrottle])
+def analytics(request):
+    """Grouped, time-bucketed punch metrics as columnar JSON"""
+    serializer = AnalyticsQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+
+    user = request.user
+    queryset = PunchRecordViewSet.visible_to(user)
+    scope = 'all' if user.role == 'admin' else f'user:{user.pk}'
+    tenant = tenants.current()
+    if tenant is not None:
+        scope = f'{tenant.slug}:{scope}'
+    payload = cached_analytics(scope, queryset, **serializer.validated_data)
+
+    response = Response(payload)
+    response['Cache-Control'] = f'private, max-age={settings.ANALYTICS_CACHE_SECONDS}'
+    return response
+
+
+@api_view(['GET'])
+def dashboard(request):
+    """Headcount, presence, hours, pay and recent activity for the user's role"""
+    user = request.user
+    payload = cached_dashboard(
+        user, PunchRecordViewSet.visible_to(user), EmployeeViewSet.visible_to(user))
+    response = Response(payload)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+class EmployeeViewSet(RowListMixin, viewsets.ModelViewSet):
     queryset = Employee.objects.all()
     serializer_class = EmployeeSerializer
     permission_classes = [IsAuthenticated]
+    list_rows = listing.EMPLOYEES
 
-    def get_queryset(self):
-        user = self.request.user
+    @staticmethod
+    def visible_to(user):
+        # Managers see everyone below them in the org chart, at any depth
         if user.role == 'manager':
-            return Employee.objects.filter(role='employee')
-        return self.queryset
+            return hierarchy.employees_under(user)
+        return Employee.objects.all()
+
+    def get_queryset(self):
+        return self.visible_to(self.request.user)
 
     def perform_create(self, serializer):
         serializer.save()
 
+    @action(detail=False, methods=['post'], throttle_classes=[BulkThrottle])
+    def bulk(self, request):
+        """Create, update and deactivate many employees in one transaction"""
+        if request.user.role not in ('admin', 'manager'):
+            return Response({'error': 'Not allowed.'}, status=status.HTTP_403_FORBIDDEN)
+
+        if not isinstance(request.data, dict):
+            return Response({'error': 'Expected an object with create, update and deactivate lists'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        parts = {key: request.data.get(key) or [] for key in ('create', 'update', 'deactivate')}
+        if not all(isinstance(value, list) for value in parts.values()):
+            return Response(
+                {'error': 'create, update and deactivate must be lists'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if sum(len(value) for value in parts.values()) > settings.BULK_MAX_ROWS:
+            return Response(
+                {'error': f'At most {settings.BULK_MAX_ROWS} rows per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-class PunchRecordViewSet(viewsets.ModelViewSet):
+        batch = BulkEmployeeBatch(self.get_queryset(), context=self.get_serializer_context(), **parts)
+        if not batch.is_valid():
+            return Response({'errors': batch.errors}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            return Response(batch.save(), status=status.HTTP_200_OK)
+        except BulkConflict as exc:
+            return Response({'errors': exc.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Best matches first; every word of ``q`` matches as a prefix"""
+        params = EmployeeSearchQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        employees = ranked_matches(
+            self.get_queryset(), params.validated_data['q'], params.validated_data['limit'])
+        return Response(EmployeeSearchResultSerializer(employees, many=True).data)
+
+
+class PunchRecordViewSet(RowListMixin, viewsets.ModelViewSet):
     queryset = PunchRecord.objects.all()
     serializer_class = PunchRecordSerializer
     permission_classes = [IsAuthenticated]
+    list_rows = listing.PUNCH_RECORDS
 
-    def get_queryset(self):
-        user = self.request.user
+    @staticmethod
+    def visible_to(user):
+        queryset = PunchRecord.objects.all()
         if user.role == 'employee':
-            return self.queryset.filter(employee=user)
+            return queryset.filter(employee=user)
         elif user.role == 'manager':
-            return self.queryset.filter(employee__role='employee')
-        return self.queryset
+            return queryset.filter(employee__in=hierarchy.team(user))
+        return queryset
+
+    @staticmethod
+    def filtered(queryset, query_params):
+        """Apply validated list filters; each maps to an indexed column where possible"""
+        params = PunchRecordFilterSerializer(data=query_params)
+        params.is_valid(raise_exception=True)
+        filters = params.validated_data
+        lookups = {}
+        if 'employee' in filters:
+            lookups['employee_id'] = filters['employee']
+        if 'employee_id' in filters:
+            lookups['employee__employee_id'] = filters['employee_id']
+        if 'start_date' in filters:
+            lookups['date__gte'] = filters['start_date']
+        if 'end_date' in filters:
+            lookups['date__lte'] = filters['end_date']
+        if 'campaign' in filters:
+            lookups['employee__campaign'] = filters['campaign']
+        if 'status' in filters:
+            lookups['punch_out__isnull'] = filters['status'] == 'open'
+        if 'min_hours' in filters:
+            lookups['total_hours__gte'] = filters['min_hours']
+        return queryset.filter(**lookups)
 
-    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def get_queryset(self):
+        queryset = self.visible_to(self.request.user).select_related('employee')
+        if self.action == 'list':
+            queryset = self.filtered(queryset, self.request.query_params)
+        return queryset
+
+    @staticmethod
+    def presence_querysets(user):
+        """The user's own open punch today, and everyone visible who is in now"""
+        today = worktime.today(user)
+        own = PunchRecord.objects.filter(
+            employee=user, date__in=worktime.shift_days(user), punch_out__isnull=True)
+        present = None
+        if user.role != 'employee':
+            present = (
+                PunchRecordViewSet.visible_to(user)
+                .filter(date=today, punch_out__isnull=True)
+                .select_related('employee')
+                .order_by('punch_in')
+            )
+        return own, present
+
+    @staticmethod
+    def presence_payload(own_record, present_records):
+        payload = {
+            'punched_in': own_record is not None,
+            'punch_in': (
+                serializers.DateTimeField().to_representation(own_record.punch_in)
+                if own_record else None
+            ),
+        }
+        if present_records is not None:
+            payload['present_count'] = len(present_records)
+            payload['present'] = PresenceSerializer(present_records, many=True).data
+        return payload
+
+    @action(detail=False, methods=['get'])
+    def presence(self, request):
+        own, present = self.presence_querysets(request.user)
+        return Response(self.presence_payload(
+            own.first(), list(present) if present is not None else None))
+
+    # Punches skip throttling entirely so they stay responsive under load
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated],
+            throttle_classes=[])
     def punch(self, request):
         serializer = PunchInOutSerializer(
             data=request.data, context={'request': request})
@@ -67,44 +248,88 @@ class PunchRecordViewSet(viewsets.ModelViewSet):
             action = serializer.validated_data['action']
 
             if action == 'punch_in':
-                PunchRecord.objects.create(
-                    employee=employee,
-                    punch_in=timezone.now()
-                )
+                # Validation saw no punch today; a concurrent one may still win
+                if kiosk.punch_in(employee, timezone.now()) is None:
+                    PUNCHES.inc(action, 'rejected')
+                    return Response({'non_field_errors': ['Already punched in today']},
+                                    status=status.HTTP_400_BAD_REQUEST)
+                PUNCHES.inc(action, 'ok')
                 return Response({'status': 'punched in'}, status=status.HTTP_200_OK)
 
             elif action == 'punch_out':
                 today_record = PunchRecord.objects.filter(
                     employee=employee,
-                    date=timezone.now().date(),
+                    date__in=worktime.shift_days(employee),
                     punch_out__isnull=True
-                ).first()
+                ).order_by('-date').first()
                 if today_record:
                     today_record.punch_out = timezone.now()
                     today_record.save()
+                    PUNCHES.inc(action, 'ok')
                     return Response({'status': 'punched out'}, status=status.HTTP_200_OK)
+                PUNCHES.inc(action, 'rejected')
                 return Response({'status': 'no punch in record found'}, status=status.HTTP_400_BAD_REQUEST)
+        if isinstance(serializer.initial_data, dict) and 'action' not in serializer.errors:
+            # A valid action refused by validation, e.g. a second punch in
+            PUNCHES.inc(serializer.initial_data['action'], 'rejected')
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ReportViewSet(viewsets.ModelViewSet):
+    # Like punch, never throttled: a kiosk coming back online must get through
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated],
+            throttle_classes=[])
+    def sync(self, request):
+        """Apply punches buffered by an offline kiosk, reporting an outcome per punch.
+
+        Punches carry the device's time, so only kiosk (manager or admin)
+        accounts may sync; employees punch through ``punch``, stamped by
+        the server.
+        """
+        if request.user.role not in ('admin', 'manager'):
+            return Response({'error': 'Not allowed.'}, status=status.HTTP_403_FORBIDDEN)
+        payload = request.data if isinstance(request.data, dict) else {}
+        punches = payload.get('punches')
+        if not isinstance(punches, list):
+            return Response({'error': 'punches must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(punches) > settings.KIOSK_SYNC_MAX_PUNCHES:
+            return Response(
+                {'error': f'At most {settings.KIOSK_SYNC_MAX_PUNCHES} punches per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        batch = KioskSyncBatch(request.user, punches, device=str(payload.get('device') or '')[:64])
+        batch.validate()
+        results = batch.save()
+        counts = {}
+        for result in results:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+        return Response({'results': results, 'counts': counts}, status=status.HTTP_200_OK)
+
+
+class ReportViewSet(RowListMixin, viewsets.ModelViewSet):
     queryset = Report.objects.all()
     serializer_class = ReportSerializer
     permission_classes = [IsAuthenticated]
+    list_rows = listing.REPORTS
+    throttle_classes = [ReportThrottle]
 
     def get_queryset(self):
         user = self.request.user
         if user.role == 'employee':
             return Report.objects.none()
+        if user.role == 'manager':
+            # Only their own team reports, never company-wide ones
+            return self.queryset.filter(generated_by=user)
         return self.queryset
 
     def create(self, request, *args, **kwargs):
         try:
             # Extract data from request
-            title = request.data.get('title')
-            report_type = request.data.get('report_type')
-            start_date = request.data.get('start_date')
-            end_date = request.data.get('end_date')
+            payload = request.data if isinstance(request.data, dict) else {}
+            title = payload.get('title')
+            report_type = payload.get('report_type')
+            start_date = payload.get('start_date')
+            end_date = payload.get('end_date')
 
             # Validate required fields
             if not all([title, report_type, start_date, end_date]):
@@ -112,10 +337,22 @@ class ReportViewSet(viewsets.ModelViewSet):
                     {'error': 'Missing required fields: title, report_type, start_date, end_date'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            try:
+                start_date, end_date = as_date(start_date), as_date(end_date)
+            except ValueError:
+                return Response(
+                    {'error': 'start_date and end_date must be valid dates (YYYY-MM-DD)'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
-            # Generate report data based on type
-            report_data = self.generate_report_data(
-                report_type, start_date, end_date)
+            # Reuse a report the scheduler stored overnight if it is still
+            # current, otherwise generate it now
+            report_data = scheduler.precomputed(report_type, start_date, end_date, request.user)
+            if report_data is None:
+                with report_slot():
+                    report_data = generate_report_data(
+                        report_type, start_date, end_date,
+                        employees=EmployeeViewSet.visible_to(request.user))
 
             # Create report
             report = Report.objects.create(
@@ -131,109 +368,100 @@ class ReportViewSet(viewsets.ModelViewSet):
             serializer = self.get_serializer(report)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+        except Throttled:
+            raise
         except Exception as e:
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-    def generate_report_data(self, report_type, start_date, end_date):
-        """Generate report data based on type and date range"""
-        if report_type == 'attendance':
-            return self.generate_attendance_report(start_date, end_date)
-        elif report_type == 'salary':
-            return self.generate_salary_report(start_date, end_date)
-        elif report_type == 'employee':
-            return self.generate_employee_report(start_date, end_date)
-        else:
-            return {}
-
-    def generate_attendance_report(self, start_date, end_date):
-        """Generate attendance report data"""
-        # Get all punch records in the date range
-        punch_records = PunchRecord.objects.filter(
-            date__gte=start_date,
-            date__lte=end_date
-        )
-
-        # Group by employee
-        attendance_data = {}
-        for record in punch_records:
-            employee_id = record.employee.employee_id
-            if employee_id not in attendance_data:
-                attendance_data[employee_id] = {
-                    'name': record.employee.full_name,
-                    'days_worked': 0,
-                    'total_hours': 0,
-                    'avg_hours_per_day': 0
-                }
-
-            attendance_data[employee_id]['days_worked'] += 1
-            attendance_data[employee_id]['total_hours'] += float(
-                record.total_hours or 0)
-
-        # Calculate averages
-        for employee_id in attendance_data:
-            days = attendance_data[employee_id]['days_worked']
-            if days > 0:
-                attendance_data[employee_id]['avg_hours_per_day'] = round(
-                    attendance_data[employee_id]['total_hours'] / days, 2
-                )
 
-        return attendance_data
-
-    def generate_salary_report(self, start_date, end_date):
-        """Generate salary report data"""
-        # Get all punch records in the date range
-        punch_records = PunchRecord.objects.filter(
-            date__gte=start_date,
-            date__lte=end_date
-        )
-
-        # Group by employee
-        salary_data = {}
-        for record in punch_records:
-            employee_id = record.employee.employee_id
-            if employee_id not in salary_data:
-                salary_data[employee_id] = {
-                    'name': record.employee.full_name,
-                    'hourly_rate': float(record.employee.hourly_rate),
-                    'total_hours': 0,
-                    'total_salary': 0
-                }
-
-            hours = float(record.total_hours or 0)
-            salary_data[employee_id]['total_hours'] += hours
-            salary_data[employee_id]['total_salary'] += hours * \
-                float(record.employee.hourly_rate)
-
-        return salary_data
-
-    def generate_employee_report(self, start_date, end_date):
-        """Generate employee report data"""
-        employees = Employee.objects.filter(role='employee')
-        employee_data = {}
-
-        for employee in employees:
-            employee_records = PunchRecord.objects.filter(
-                employee=employee,
-                date__gte=start_date,
-                date__lte=end_date
-            )
+class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
+    """Field-level change history, filtered by object or actor"""
+    queryset = AuditLog.objects.all()
+    serializer_class = AuditLogSerializer
+    permission_classes = [IsAuthenticated]
 
-            total_hours = sum(float(record.total_hours or 0)
-                              for record in employee_records)
-            total_salary = total_hours * float(employee.hourly_rate)
-
-            employee_data[employee.employee_id] = {
-                'name': employee.full_name,
-                'email': employee.email,
-                'role': employee.role,
-                'campaign': employee.campaign,
-                'hourly_rate': float(employee.hourly_rate),
-                'total_hours': total_hours,
-                'total_salary': total_salary,
-                'days_worked': employee_records.count()
-            }
-
-        return employee_data
+    def get_queryset(self):
+        user = self.request.user
+        if user.role == 'employee':
+            return AuditLog.objects.none()
+        # Include changes this process made moments ago (cheap when nothing is queued)
+        audit.flush_now()
+        queryset = self.queryset.select_related('actor')
+        if user.role == 'manager':
+            # Changes to their team and its punch records, and anything they
+            # or their team did
+            team = hierarchy.team(user)
+            queryset = queryset.filter(
+                Q(model='employee', object_id__in=team)
+                | Q(model='punchrecord', object_id__in=PunchRecord.objects.filter(employee__in=team).values('pk'))
+                | Q(actor=user) | Q(actor__in=team))
+        if self.action != 'list':
+            return queryset
+
+        params = AuditLogFilterSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        filters = params.validated_data
+        lookups = {}
+        for name in ('model', 'object_id', 'action'):
+            if name in filters:
+                lookups[name] = filters[name]
+        if 'actor' in filters:
+            lookups['actor_id'] = filters['actor']
+        if 'actor_employee_id' in filters:
+            lookups['actor__employee_id'] = filters['actor_employee_id']
+        if 'since' in filters:
+            lookups['created_at__gte'] = filters['since']
+        if 'until' in filters:
+            lookups['created_at__lt'] = filters['until']
+        return queryset.filter(**lookups)
+
+
+class PayslipViewSet(viewsets.ViewSet):
+    """Month-end payslip batches, generated in the background by ``generate_payslips``"""
+    permission_classes = [IsAuthenticated]
+    lookup_field = 'month'
+    lookup_value_regex = r'\d{4}-\d{2}'
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.user.role != 'admin':
+            self.permission_denied(request, message='Only admins can manage payslips.')
+
+    def list(self, request):
+        return Response(payslips.all_statuses())
+
+    def create(self, request):
+        serializer = PayslipBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        current = payslips.batch_status(params['month'])
+        if current is not None and current['state'] in payslips.IN_PROGRESS:
+            if params['force']:
+                return Response({'error': 'This batch is being generated; try again when it is done.'},
+                                status=status.HTTP_409_CONFLICT)
+            return Response(current, status=status.HTTP_202_ACCEPTED)
+        if (current is not None and not params['force'] and current['state'] == 'complete'
+                and current['format'] == params['format'] and (current['zip'] or not params['zip'])):
+            return Response(current, status=status.HTTP_200_OK)
+
+        # Interrupted and failed batches resume where they stopped
+        payslips.start(params['month'], params['format'], params['zip'], params['force'])
+        return Response(payslips.batch_status(params['month']), status=status.HTTP_202_ACCEPTED)
+
+    def retrieve(self, request, month=None):
+        current = payslips.batch_status(month)
+        if current is None:
+            raise Http404
+        return Response(current)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, month=None):
+        current = payslips.batch_status(month)
+        if current is None or current['state'] != 'complete' or not current['zip']:
+            raise Http404
+        path = payslips.batch_dir(month) / current['zip']
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=current['zip'],
+                            content_type='application/zip')
@@ -0,0 +1,145 @@
+"""Local work days.
+
+Punches are stored in UTC, but which day a shift belongs to depends on where
+it was worked.  Employees can have their own ``timezone``; everyone else
+works in ``settings.WORK_TIME_ZONE``.  ``PunchRecord.date`` is the local day
+of the punch in and ``start_minute`` its local minute of the day.  Both are
+worked out once when the punch is written, so reports, "today" lookups and
+analytics filter and aggregate stored, indexed columns instead of converting
+every row.
+
+``backfill_work_days`` recomputes both columns for existing punches, e.g.
+after an employee's timezone changes.
+"""
+from datetime import timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+from django.utils import timezone
+
+
+@lru_cache(maxsize=None)
+def get_zone(name):
+    return ZoneInfo(name)
+
+
+def zone_named(name):
+    """``get_zone`` for an employee's ``timezone`` value, blank meaning the default"""
+    return get_zone(name or settings.WORK_TIME_ZONE)
+
+
+def zone_of(employee=None):
+    """The employee's zone; the default work zone for None"""
+    return zone_named(getattr(employee, 'timezone', ''))
+
+
+def validate_timezone(value):
+    try:
+        get_zone(value)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValidationError(f'"{value}" is not a known timezone.')
+
+
+def work_day(moment, zone):
+    """(local date, local minute of the day) of an instant in ``zone``"""
+    if timezone.is_naive(moment):
+        # The same reading the database layer gives a naive datetime
+        moment = timezone.make_aware(moment)
+    local = moment.astimezone(zone)
+    return local.date(), local.hour * 60 + local.minute
+
+
+def today(employee=None, now=None):
+    """The current work date for ``employee`` (the default zone when None)"""
+    return (now or timezone.now()).astimezone(zone_of(employee)).date()
+
+
+def shift_days(employee=None, now=None):
+    """Days an open punch may still be on: today, and yesterday for a shift past midnight"""
+    day = today(employee, now)
+    return [day, day - timedelta(days=1)]
+
+
+def _statement(model, connection):
+    quote = connection.ops.quote_name
+    meta = model._meta
+    return (f'UPDATE {quote(meta.db_table)} SET {quote(meta.get_field("date").column)} = %s, '
+            f'{quote(meta.get_field("start_minute").column)} = %s WHERE {quote(meta.pk.column)} = %s')
+
+
+def _write(connection, sql, rows):
+    """Apply (date, start_minute, pk) rows; returns those that clash with another punch's day"""
+    # One prepared statement for the whole batch (bulk_update's CASE per
+    # column costs time quadratic in the batch size)
+    try:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+        return []
+    except IntegrityError:
+        pass
+    # A punch takes a day another one has not left yet: go row by row,
+    # retrying while any succeed
+    pending = rows
+    while pending:
+        failed = []
+        for row in pending:
+            try:
+                with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                    cursor.execute(sql, row)
+            except IntegrityError:
+                failed.append(row)
+        if len(failed) == len(pending):
+            break
+        pending = failed
+    return pending
+
+
+def backfill(batch_size=5000, using=DEFAULT_DB_ALIAS, employee_ids=None, log=None):
+    """Recompute ``date`` and ``start_minute`` of stored punches in batches.
+
+    Batches hold whole employees, read in (employee, date) order from the
+    unique index, and only rows whose values change are written.  A punch
+    that would move onto a day its employee keeps another punch on is left
+    as it was and reported in ``clashes``.
+    """
+    from .models import PunchRecord
+    from .reports import invalidate_partials
+
+    connection = connections[using]
+    sql = _statement(PunchRecord, connection)
+    queryset = PunchRecord.objects.using(using).order_by('employee_id', 'date')
+    if employee_ids:
+        queryset = queryset.filter(employee__employee_id__in=employee_ids)
+    fields = ('pk', 'employee_id', 'punch_in', 'date', 'start_minute', 'employee__timezone')
+    summary = {'checked': 0, 'updated': 0, 'clashes': []}
+    last = 0
+    while True:
+        rows = list(queryset.filter(employee_id__gt=last).values_list(*fields)[:batch_size])
+        if not rows:
+            break
+        last, last_day = rows[-1][1], rows[-1][3]
+        # Finish the last employee, so a punch and the one whose day it
+        # takes are always in the same batch
+        rows += queryset.filter(employee_id=last, date__gt=last_day).values_list(*fields)
+        changed, days = [], set()
+        for pk, employee_id, punch_in, day, minute, name in rows:
+            new_day, new_minute = work_day(punch_in, zone_named(name))
+            if new_day != day or new_minute != minute:
+                # Punches moving later go latest first and punches moving
+                # earlier go earliest first, so each lands on a day its
+                # neighbour has already left
+                order = -new_day.toordinal() if new_day > day else new_day.toordinal()
+                changed.append((order, connection.ops.adapt_datefield_value(new_day), new_minute, pk))
+                days.update((day, new_day))
+        changed.sort()
+        clashes = _write(connection, sql, [row[1:] for row in changed]) if changed else []
+        summary['checked'] += len(rows)
+        summary['updated'] += len(changed) - len(clashes)
+        summary['clashes'].extend(pk for _, _, pk in clashes)
+        invalidate_partials(days)
+        if log:
+            log(f'Checked {summary["checked"]} punches, updated {summary["updated"]}.')
+    return summary
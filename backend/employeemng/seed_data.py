@@ -45,7 +45,8 @@ def create_test_employees():
         )
         print(f"Created manager: {manager}")
 
-    # Create employees if not enough exist
+    # Create employees if not enough exist; they all report to MGR001
+    manager = Employee.objects.get(employee_id='MGR001')
     employee_count = Employee.objects.filter(role='employee').count()
     if employee_count < 5:
         for i in range(1, 6 - employee_count):
@@ -59,6 +60,7 @@ def create_test_employees():
                     last_name='User',
                     email=f'employee{i}@example.com',
                     role='employee',
+                    manager=manager,
                     hourly_rate=6.00 + (i * 0.5),  # Different hourly rates
                     campaign=random.choice(
                         ['Marketing', 'Sales', 'Support', 'Development'])
@@ -51,7 +51,7 @@ import {
   Home,
 } from '@mui/icons-material';
 import { useAuth } from '../contexts/AuthContext';
-import { employeeAPI, punchAPI, reportAPI } from '../services/api';
+import { dashboardAPI, employeeAPI, punchAPI, reportAPI } from '../services/api';
 import ReportViewer from './ReportViewer';
 
 function TabPanel(props) {
@@ -77,6 +77,7 @@ function TabPanel(props) {
 const AdminDashboard = () => {
   const [employees, setEmployees] = useState([]);
   const [punchRecords, setPunchRecords] = useState([]);
+  const [summary, setSummary] = useState(null);
   const [openDialog, setOpenDialog] = useState(false);
   const [selectedEmployee, setSelectedEmployee] = useState(null);
   const [formData, setFormData] = useState({
@@ -87,6 +88,7 @@ const AdminDashboard = () => {
     phone_number: '',
     address: '',
     campaign: '',
+    timezone: '',
     role: 'employee',
     password: '',
     hourly_rate: 6.00,
@@ -100,10 +102,21 @@ const AdminDashboard = () => {
   const { logout, user } = useAuth();
 
   useEffect(() => {
+    fetchSummary();
     fetchEmployees();
     fetchPunchRecords();
   }, []);
 
+  // Totals come from the server; the lists below are only one page each
+  const fetchSummary = async () => {
+    try {
+      const response = await dashboardAPI.get();
+      setSummary(response.data);
+    } catch (error) {
+      console.error('Error fetching dashboard summary:', error);
+    }
+  };
+
   const fetchEmployees = async () => {
     try {
       setLoading(true);
@@ -141,6 +154,7 @@ const AdminDashboard = () => {
       phone_number: '',
       address: '',
       campaign: '',
+      timezone: '',
       role: 'employee',
       password: '',
       hourly_rate: 6.00,
@@ -159,6 +173,7 @@ const AdminDashboard = () => {
       phone_number: employee.phone_number || '',
       address: employee.address || '',
       campaign: employee.campaign || '',
+      timezone: employee.timezone || '',
       role: employee.role,
       password: '',
       hourly_rate: employee.hourly_rate || 6.00,
@@ -240,6 +255,7 @@ const AdminDashboard = () => {
       }
       setMessageType('success');
       fetchEmployees();
+      fetchSummary();
       setOpenDialog(false);
     } catch (error) {
       console.error('Error saving employee:', error);
@@ -262,6 +278,7 @@ const AdminDashboard = () => {
         setMessage('Employee deleted successfully');
         setMessageType('success');
         fetchEmployees();
+        fetchSummary();
       } catch (error) {
         console.error('Error deleting employee:', error);
         setMessage('Error deleting employee');
@@ -340,27 +357,42 @@ const AdminDashboard = () => {
             <Paper elevation={3} sx={{ p: 3, textAlign: 'center', borderRadius: 2, bgcolor: '#e8f5e9' }}>
               <People sx={{ fontSize: 48, color: '#2e7d32' }} />
               <Typography variant="h4" sx={{ fontWeight: 'bold', color: '#2e7d32', mt: 1 }}>
-                {employees.length}
+                {summary ? summary.headcount.total : '-'}
               </Typography>
               <Typography variant="h6" color="text.secondary">Total Employees</Typography>
+              {summary && (
+                <Typography variant="body2" color="text.secondary">
+                  {summary.present.count} in now
+                </Typography>
+              )}
             </Paper>
           </Grid>
           <Grid item xs={12} md={4}>
             <Paper elevation={3} sx={{ p: 3, textAlign: 'center', borderRadius: 2, bgcolor: '#e3f2fd' }}>
               <AccessTime sx={{ fontSize: 48, color: '#1565c0' }} />
               <Typography variant="h4" sx={{ fontWeight: 'bold', color: '#1565c0', mt: 1 }}>
-                {punchRecords.length}
+                {summary ? summary.punch_records : '-'}
               </Typography>
               <Typography variant="h6" color="text.secondary">Punch Records</Typography>
+              {summary && (
+                <Typography variant="body2" color="text.secondary">
+                  {summary.hours.period.toFixed(2)} hrs this month
+                </Typography>
+              )}
             </Paper>
           </Grid>
           <Grid item xs={12} md={4}>
             <Paper elevation={3} sx={{ p: 3, textAlign: 'center', borderRadius: 2, bgcolor: '#fce4ec' }}>
               <AttachMoney sx={{ fontSize: 48, color: '#c2185b' }} />
               <Typography variant="h4" sx={{ fontWeight: 'bold', color: '#c2185b', mt: 1 }}>
-                ${employees.reduce((total, emp) => total + parseFloat(emp.total_salary || 0), 0).toFixed(2)}
+                ${summary ? summary.pay.all_time.toFixed(2) : '-'}
               </Typography>
               <Typography variant="h6" color="text.secondary">Total Payroll</Typography>
+              {summary && (
+                <Typography variant="body2" color="text.secondary">
+                  ${summary.pay.period.toFixed(2)} this month
+                </Typography>
+              )}
             </Paper>
           </Grid>
         </Grid>
@@ -619,6 +651,16 @@ const AdminDashboard = () => {
                 onChange={(e) => setFormData({ ...formData, campaign: e.target.value })}
               />
             </Grid>
+            <Grid item xs={12} md={6}>
+              <TextField
+                fullWidth
+                label="Timezone"
+                value={formData.timezone}
+                onChange={(e) => setFormData({ ...formData, timezone: e.target.value })}
+                placeholder="America/New_York"
+                helperText="Punches are dated in this timezone; leave blank for the default"
+              />
+            </Grid>
             <Grid item xs={12} md={6}>
               <TextField
                 fullWidth
@@ -78,7 +78,7 @@ import {
   Info,
 } from '@mui/icons-material';
 import { useAuth } from '../contexts/AuthContext';
-import { employeeAPI, punchAPI } from '../services/api';
+import { dashboardAPI, employeeAPI, punchAPI } from '../services/api';
 
 // TabPanel component for tab content
 function TabPanel(props) {
@@ -107,6 +107,7 @@ const EmployeeDashboard = () => {
 
   const [employee, setEmployee] = useState(null);
   const [punchRecords, setPunchRecords] = useState([]);
+  const [summary, setSummary] = useState(null);
   const [openDialog, setOpenDialog] = useState(false);
   const [formData, setFormData] = useState({
     first_name: '',
@@ -128,7 +129,7 @@ const EmployeeDashboard = () => {
   const [currentTime, setCurrentTime] = useState(new Date());
   const [workingTime, setWorkingTime] = useState(0);
 
-  const { logout, user } = useAuth();
+  const { logout } = useAuth();
 
   // Update current time every minute
   useEffect(() => {
@@ -148,26 +149,30 @@ const EmployeeDashboard = () => {
 
   const fetchEmployeeData = useCallback(async () => {
     try {
-      const response = await employeeAPI.getAll();
-      const employees = response.data.results || response.data;
-      const currentEmployee = employees.find(emp => emp.employee_id === user.employee_id);
-      if (currentEmployee) {
-        setEmployee(currentEmployee);
-        setFormData({
-          first_name: currentEmployee.first_name,
-          last_name: currentEmployee.last_name,
-          email: currentEmployee.email,
-          phone_number: currentEmployee.phone_number || '',
-          address: currentEmployee.address || '',
-          hourly_rate: currentEmployee.hourly_rate || 6.00,
-        });
-      }
+      // One call for the profile and every total shown on this page
+      const response = await dashboardAPI.get();
+      const { me, ...totals } = response.data;
+      setSummary(totals);
+      const currentEmployee = {
+        ...me,
+        total_hours: totals.hours.all_time,
+        total_salary: totals.pay.all_time.toFixed(2),
+      };
+      setEmployee(currentEmployee);
+      setFormData({
+        first_name: currentEmployee.first_name,
+        last_name: currentEmployee.last_name,
+        email: currentEmployee.email,
+        phone_number: currentEmployee.phone_number || '',
+        address: currentEmployee.address || '',
+        hourly_rate: currentEmployee.hourly_rate || 6.00,
+      });
     } catch (error) {
       console.error('Error fetching employee data:', error);
       setMessage('Failed to load employee data');
       setMessageType('error');
     }
-  }, [user.employee_id]);
+  }, []);
 
   const fetchPunchRecords = useCallback(async () => {
     try {
@@ -205,6 +210,7 @@ const EmployeeDashboard = () => {
       setMessage('Successfully punched in!');
       setMessageType('success');
       fetchPunchRecords();
+      fetchEmployeeData();
     } catch (error) {
       setMessage(error.response?.data?.non_field_errors?.[0] || 'Error punching in');
       setMessageType('error');
@@ -220,6 +226,7 @@ const EmployeeDashboard = () => {
       setMessage('Successfully punched out!');
       setMessageType('success');
       fetchPunchRecords();
+      fetchEmployeeData();
     } catch (error) {
       setMessage(error.response?.data?.non_field_errors?.[0] || 'Error punching out');
       setMessageType('error');
@@ -316,31 +323,15 @@ const EmployeeDashboard = () => {
     return punchRecords.slice(0, 7);
   };
 
-  // Calculate weekly stats
+  // Weekly stats, computed by the server over the last 7 days
   const calculateWeeklyStats = () => {
-    const oneWeekAgo = new Date();
-    oneWeekAgo.setDate(oneWeekAgo.getDate() - 7);
-
-    const weekRecords = punchRecords.filter(record => {
-      const recordDate = new Date(record.date);
-      return recordDate >= oneWeekAgo;
-    });
-
-    // Ensure totalHours is a number by using parseFloat or defaulting to 0
-    const totalHours = weekRecords.reduce((sum, record) => {
-      const hours = record.total_hours ? parseFloat(record.total_hours) : 0;
-      return sum + (isNaN(hours) ? 0 : hours);
-    }, 0);
-
-    const hourlyRate = employee?.hourly_rate ? parseFloat(employee.hourly_rate) : 6;
-    const totalEarnings = totalHours * hourlyRate;
-    const avgHoursPerDay = weekRecords.length > 0 ? totalHours / weekRecords.length : 0;
-
+    const hours = summary ? summary.hours.week : 0;
+    const daysWorked = summary ? summary.days_worked.week : 0;
     return {
-      totalHours: totalHours.toFixed(2),
-      totalEarnings: totalEarnings.toFixed(2),
-      avgHoursPerDay: avgHoursPerDay.toFixed(2),
-      daysWorked: weekRecords.length
+      totalHours: hours.toFixed(2),
+      totalEarnings: (summary ? summary.pay.week : 0).toFixed(2),
+      avgHoursPerDay: (daysWorked > 0 ? hours / daysWorked : 0).toFixed(2),
+      daysWorked,
     };
   };
 
@@ -14,6 +14,7 @@ import { useAuth } from '../contexts/AuthContext';
 const Login = () => {
   const [employeeId, setEmployeeId] = useState('');
   const [password, setPassword] = useState('');
+  const [company, setCompany] = useState('');
   const [error, setError] = useState('');
   const [loading, setLoading] = useState(false);
 
@@ -25,7 +26,7 @@ const Login = () => {
     setLoading(true);
     setError('');
 
-    const result = await login(employeeId, password);
+    const result = await login(employeeId, password, company.trim());
 
     if (result.success) {
       navigate('/dashboard');
@@ -73,6 +74,17 @@ const Login = () => {
               noValidate
               sx={{ mt: 1, width: '100%' }}
             >
+              <TextField
+                margin="normal"
+                fullWidth
+                id="company"
+                label="Company"
+                name="company"
+                autoComplete="organization"
+                helperText="Leave empty unless your company gave you one"
+                value={company}
+                onChange={(e) => setCompany(e.target.value)}
+              />
               <TextField
                 margin="normal"
                 required
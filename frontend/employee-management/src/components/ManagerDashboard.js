@@ -50,7 +50,7 @@ import {
   Assessment,
 } from '@mui/icons-material';
 import { useAuth } from '../contexts/AuthContext';
-import { employeeAPI, punchAPI } from '../services/api';
+import { dashboardAPI, employeeAPI, punchAPI } from '../services/api';
 import ReportViewer from './ReportViewer';
 
 function TabPanel(props) {
@@ -76,6 +76,7 @@ function TabPanel(props) {
 const ManagerDashboard = () => {
   const [employees, setEmployees] = useState([]);
   const [punchRecords, setPunchRecords] = useState([]);
+  const [summary, setSummary] = useState(null);
   const [openDialog, setOpenDialog] = useState(false);
   const [selectedEmployee, setSelectedEmployee] = useState(null);
   const [formData, setFormData] = useState({
@@ -85,6 +86,7 @@ const ManagerDashboard = () => {
     phone_number: '',
     address: '',
     campaign: '',
+    timezone: '',
     hourly_rate: 6.00,
   });
   const [tabValue, setTabValue] = useState(0);
@@ -97,10 +99,21 @@ const ManagerDashboard = () => {
   const { logout, user } = useAuth();
 
   useEffect(() => {
+    fetchSummary();
     fetchEmployees();
     fetchPunchRecords();
   }, []);
 
+  // Totals come from the server; the lists below are only one page each
+  const fetchSummary = async () => {
+    try {
+      const response = await dashboardAPI.get();
+      setSummary(response.data);
+    } catch (error) {
+      console.error('Error fetching dashboard summary:', error);
+    }
+  };
+
   const fetchEmployees = async () => {
     try {
       setLoading(true);
@@ -137,6 +150,7 @@ const ManagerDashboard = () => {
       phone_number: employee.phone_number || '',
       address: employee.address || '',
       campaign: employee.campaign || '',
+      timezone: employee.timezone || '',
       hourly_rate: employee.hourly_rate || 6.00,
     });
     setFormError('');
@@ -193,6 +207,7 @@ const ManagerDashboard = () => {
       setMessage('Employee updated successfully');
       setMessageType('success');
       fetchEmployees();
+      fetchSummary();
       setOpenDialog(false);
 
       // If we were viewing this employee's details, refresh that data too
@@ -264,30 +279,42 @@ const ManagerDashboard = () => {
             <Paper elevation={3} sx={{ p: 3, textAlign: 'center', borderRadius: 2, bgcolor: '#e8f5e9' }}>
               <People sx={{ fontSize: 48, color: '#2e7d32' }} />
               <Typography variant="h4" sx={{ fontWeight: 'bold', color: '#2e7d32', mt: 1 }}>
-                {employees.filter(emp => emp.role === 'employee').length}
+                {summary ? summary.headcount.by_role.employee : '-'}
               </Typography>
               <Typography variant="h6" color="text.secondary">Team Members</Typography>
+              {summary && (
+                <Typography variant="body2" color="text.secondary">
+                  {summary.present.count} in now
+                </Typography>
+              )}
             </Paper>
           </Grid>
           <Grid item xs={12} md={4}>
             <Paper elevation={3} sx={{ p: 3, textAlign: 'center', borderRadius: 2, bgcolor: '#e3f2fd' }}>
               <AccessTime sx={{ fontSize: 48, color: '#1565c0' }} />
               <Typography variant="h4" sx={{ fontWeight: 'bold', color: '#1565c0', mt: 1 }}>
-                {punchRecords.length}
+                {summary ? summary.punch_records : '-'}
               </Typography>
               <Typography variant="h6" color="text.secondary">Punch Records</Typography>
+              {summary && (
+                <Typography variant="body2" color="text.secondary">
+                  {summary.hours.period.toFixed(2)} hrs this month
+                </Typography>
+              )}
             </Paper>
           </Grid>
           <Grid item xs={12} md={4}>
             <Paper elevation={3} sx={{ p: 3, textAlign: 'center', borderRadius: 2, bgcolor: '#fce4ec' }}>
               <AttachMoney sx={{ fontSize: 48, color: '#c2185b' }} />
               <Typography variant="h4" sx={{ fontWeight: 'bold', color: '#c2185b', mt: 1 }}>
-                ${employees
-                  .filter(emp => emp.role === 'employee')
-                  .reduce((total, emp) => total + parseFloat(emp.total_salary || 0), 0)
-                  .toFixed(2)}
+                ${summary ? summary.pay.all_time.toFixed(2) : '-'}
               </Typography>
               <Typography variant="h6" color="text.secondary">Team Payroll</Typography>
+              {summary && (
+                <Typography variant="body2" color="text.secondary">
+                  ${summary.pay.period.toFixed(2)} this month
+                </Typography>
+              )}
             </Paper>
           </Grid>
         </Grid>
@@ -692,6 +719,16 @@ const ManagerDashboard = () => {
                 onChange={(e) => setFormData({ ...formData, campaign: e.target.value })}
               />
             </Grid>
+            <Grid item xs={12} md={6}>
+              <TextField
+                fullWidth
+                label="Timezone"
+                value={formData.timezone}
+                onChange={(e) => setFormData({ ...formData, timezone: e.target.value })}
+                placeholder="America/New_York"
+                helperText="Punches are dated in this timezone; leave blank for the default"
+              />
+            </Grid>
             <Grid item xs={12} md={6}>
               <TextField
                 fullWidth
@@ -27,12 +27,12 @@ export const AuthProvider = ({ children }) => {
     setLoading(false);
   }, []);
 
-  const login = async (employeeId, password) => {
+  const login = async (employeeId, password, company) => {
     try {
-      const response = await authAPI.login(employeeId, password);
+      const response = await authAPI.login(employeeId, password, company);
       const { token, employee_id, role } = response.data;
 
-      const userData = { employee_id, role };
+      const userData = { employee_id, role, company: response.data.company };
 
       localStorage.setItem('token', token);
       localStorage.setItem('user', JSON.stringify(userData));
@@ -34,8 +34,12 @@ api.interceptors.response.use(
 );
 
 export const authAPI = {
-  login: (employeeId, password) =>
-    api.post('/login/', { employee_id: employeeId, password }),
+  login: (employeeId, password, company) =>
+    api.post('/login/', {
+      employee_id: employeeId,
+      password,
+      ...(company ? { company } : {}),
+    }),
   logout: () => {
     localStorage.removeItem('token');
     localStorage.removeItem('user');
@@ -48,10 +52,11 @@ export const employeeAPI = {
   create: (data) => api.post('/employees/', data),
   update: (id, data) => api.put(`/employees/${id}/`, data),
   delete: (id) => api.delete(`/employees/${id}/`),
+  search: (q, limit = 20) => api.get('/employees/search/', { params: { q, limit } }),
 };
 
 export const punchAPI = {
-  getAll: () => api.get('/punch-records/'),
+  getAll: (params) => api.get('/punch-records/', { params }),
   punch: (action) => api.post('/punch-records/punch/', { action }),
   getByEmployee: (employeeId) => api.get(`/punch-records/?employee=${employeeId}`),
 };
@@ -61,5 +66,13 @@ export const reportAPI = {
   create: (data) => api.post('/reports/', data),
 };
 
+export const analyticsAPI = {
+  get: (params) => api.get('/analytics/', { params }),
+};
+
+export const dashboardAPI = {
+  get: () => api.get('/dashboard/'),
+};
+
 export default api;
 